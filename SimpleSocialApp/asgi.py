@@ -2,6 +2,8 @@
 ASGI config for SimpleSocialApp project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests are routed through ``ASGI_ROOT_URLCONF``, which serves the read-heavy
+endpoints with async views, e.g. ``uvicorn SimpleSocialApp.asgi:application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -9,8 +11,22 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler, ASGIRequest
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SimpleSocialApp.settings')
 
-application = get_asgi_application()
+django.setup(set_prefix=False)
+
+
+class AsyncRequest(ASGIRequest):
+    # Django resolves a request with its own `urlconf` when it has one, instead of ROOT_URLCONF.
+    urlconf = settings.ASGI_ROOT_URLCONF
+
+
+class AsyncHandler(ASGIHandler):
+    request_class = AsyncRequest
+
+
+application = AsyncHandler()
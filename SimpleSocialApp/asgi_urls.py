@@ -0,0 +1,31 @@
+"""
+URL configuration the ASGI application serves (see asgi.py): the same routes as urls.py, with the read-heavy
+endpoints served by async views. Their other methods still go to the same DRF views as under WSGI.
+"""
+from django.contrib import admin
+from django.urls import path, include
+
+from posts import urls as posts_urls
+from posts.async_views import AsyncPostListView, AsyncPostDetailView, AsyncCommentListView
+from users import urls as users_urls
+from users.async_views import AsyncUserRetrieveView
+from .urls import media_urlpatterns
+
+
+def with_async_views(urlpatterns, views):
+    """A copy of `urlpatterns` where the routes named in `views` are served by the given async views."""
+    return [path(str(pattern.pattern), views[pattern.name].as_view(), name=pattern.name)
+            if pattern.name in views else pattern for pattern in urlpatterns]
+
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('posts/', include(with_async_views(posts_urls.urlpatterns, {
+        'list-notes': AsyncPostListView,
+        'RUD-note': AsyncPostDetailView,
+        'list-comments': AsyncCommentListView,
+    }))),
+    path('users/', include(with_async_views(users_urls.urlpatterns, {
+        'user': AsyncUserRetrieveView,
+    }))),
+] + media_urlpatterns
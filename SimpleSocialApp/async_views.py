@@ -0,0 +1,92 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404, HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .pagination import KeysetPagination
+
+
+class AsyncReadView(View):
+    """
+    Serves the GET requests of an endpoint on the event loop, with the async ORM, so a worker isn't tied
+    up while it waits on the database or on a slow client. Every other method, and the GET requests that
+    `serves_async` turns down, is handed to `sync_view`, the DRF view registered for the same URL, so the
+    endpoint behaves the same under WSGI and ASGI.
+
+    Subclasses implement `aget(request, **kwargs)`, which returns the response data or a Response-like
+    (data, headers) pair. `request` is a DRF Request whose `user` is already authenticated.
+    """
+    sync_view = None
+    renderer = JSONRenderer()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Like DRF views, authentication is by token, not by session cookie.
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.sync_view is not None and not hasattr(cls.sync_view, 'view_class'):
+            cls.sync_view = cls.sync_view.as_view()
+
+    def serves_async(self, request):
+        return True
+
+    async def get(self, request, *args, **kwargs):
+        drf_request = Request(request)
+        if not self.serves_async(drf_request):
+            return await self.fallback(request, *args, **kwargs)
+
+        try:
+            drf_request.user = await sync_to_async(self.authenticate)(request)
+            result = await self.aget(drf_request, **kwargs)
+        except Http404 as error:
+            return self.handle_exception(exceptions.NotFound(*error.args))
+        except exceptions.APIException as error:
+            return self.handle_exception(error)
+
+        data, headers = result if isinstance(result, tuple) else (result, {})
+        response = self.render(data)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    async def post(self, request, *args, **kwargs):
+        return await self.fallback(request, *args, **kwargs)
+
+    put = patch = delete = post
+
+    async def fallback(self, request, *args, **kwargs):
+        return await sync_to_async(type(self).sync_view)(request, *args, **kwargs)
+
+    @staticmethod
+    def authenticate(request):
+        for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+            result = authentication().authenticate(request)
+            if result is not None:
+                return result[0]
+        return AnonymousUser()
+
+    def handle_exception(self, error):
+        # The same error bodies DRF's exception handler sends.
+        return self.render({'detail': error.detail}, status=error.status_code)
+
+    def render(self, data, status=200):
+        return HttpResponse(self.renderer.render(data), status=status, content_type='application/json')
+
+    async def paginate(self, queryset, request, serializer_class, context):
+        """The async counterpart of a DRF list view's paginated `list()`."""
+        paginator = KeysetPagination()
+        page = await paginator.apaginate_queryset(queryset, request, self)
+        data = await sync_to_async(lambda: serializer_class(page, many=True, context=context).data)()
+        return paginator.get_paginated_response(data).data
+
+    @staticmethod
+    async def serialize(serializer_class, instance, context):
+        # Serializers may still touch the ORM (e.g. bulk like lookups), which has to run off the event loop.
+        return await sync_to_async(lambda: serializer_class(instance, context=context).data)()
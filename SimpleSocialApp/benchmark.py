@@ -0,0 +1,290 @@
+import random
+import socket
+import statistics
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from posts import feed, trending
+from posts.counters import rebuild_post_counters, rebuild_comment_counters, rebuild_profile_counters
+from posts.models import Post, Comment, PostLike, CommentLike
+from search.backends import DOCUMENTS, get_backend
+from users import suggestions
+from users.models import Follow, Profile
+
+PASSWORD = 'benchmark-password'
+BATCH_SIZE = 1000
+# The read-heavy endpoints that have async views, compared between the WSGI and ASGI servers.
+SERVER_ROUTES = ('feed', 'post list (anonymous)', 'post detail', 'comment list', 'user profile')
+WORDS = ['django', 'python', 'coffee', 'music', 'travel', 'football', 'cats', 'cooking', 'books', 'movies']
+
+
+def seed(users=200, follows=20, posts=5, comments=3, likes=5, random_seed=0):
+    """
+    Fill the database with a synthetic social graph: `follows` followings per user, `posts` posts per user,
+    and `comments` comments and `likes` likes per post. Every stored counter, timeline and search index
+    is rebuilt afterwards, so the data looks as if it had been created through the API.
+    """
+    rng = random.Random(random_seed)
+    password = make_password(PASSWORD)
+    User.objects.bulk_create([User(username=f'user{i}', password=password) for i in range(users)],
+                             batch_size=BATCH_SIZE)
+    user_ids = list(User.objects.filter(username__startswith='user').values_list('id', flat=True))
+    Profile.objects.bulk_create([Profile(user_id=user_id) for user_id in user_ids], batch_size=BATCH_SIZE,
+                                ignore_conflicts=True)
+
+    Follow.objects.bulk_create(
+        [Follow(follower_id=follower, following_id=following)
+         for follower in user_ids
+         for following in rng.sample(user_ids, min(follows + 1, len(user_ids))) if following != follower],
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    Post.objects.bulk_create(
+        [Post(author_id=author, content=f'post {i} by {author} about {rng.choice(WORDS)} and {rng.choice(WORDS)}')
+         for author in user_ids for i in range(posts)],
+        batch_size=BATCH_SIZE)
+    post_ids = list(Post.objects.values_list('id', flat=True))
+
+    Comment.objects.bulk_create(
+        [Comment(post_id=post_id, author_id=rng.choice(user_ids), content=f'comment on {rng.choice(WORDS)}')
+         for post_id in post_ids for _ in range(comments)],
+        batch_size=BATCH_SIZE)
+    comment_ids = list(Comment.objects.values_list('id', flat=True))
+
+    PostLike.objects.bulk_create(
+        [PostLike(post_id=post_id, user_id=user_id)
+         for post_id in post_ids for user_id in rng.sample(user_ids, min(likes, len(user_ids)))],
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+    CommentLike.objects.bulk_create(
+        [CommentLike(comment_id=comment_id, user_id=rng.choice(user_ids)) for comment_id in comment_ids],
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    rebuild_post_counters()
+    rebuild_comment_counters()
+    rebuild_profile_counters()
+    feed.rebuild()
+    trending.update()
+    suggestions.compute()
+    for kind in DOCUMENTS:
+        get_backend().rebuild(kind)
+
+
+def endpoints():
+    """
+    One request per route of posts/urls.py and users/urls.py that can be replayed with the same data, as
+    (name, method, url, data, authenticated). Toggle endpoints (like, follow) run an even number of times in a
+    row, so they leave the data as found; batch likes and password change are idempotent. Left out are the
+    routes that only succeed once per input (register, logout, blacklist) and the admin-only follow import.
+    """
+    viewer = User.objects.order_by('id').first()
+    other = User.objects.exclude(id=viewer.id).order_by('id').first()
+    post = Post.objects.order_by('-comments_count', 'id').first()
+    comment = Comment.objects.filter(post=post, parent=None).order_by('id').first()
+    refresh = str(RefreshToken.for_user(viewer))
+    return [
+        ('feed', 'get', reverse('list-notes'), None, True),
+        ('post list (anonymous)', 'get', reverse('list-notes'), None, False),
+        ('post search', 'get', reverse('list-notes') + '?search=django', None, False),
+        ('post create', 'post', reverse('list-notes'), {'content': 'benchmark post'}, True),
+        ('trending', 'get', reverse('trending-posts'), None, True),
+        ('post detail', 'get', reverse('RUD-note', kwargs={'id': post.id}), None, True),
+        ('post like', 'post', reverse('like-post', kwargs={'id': post.id}), None, True),
+        ('batch likes', 'post', reverse('batch-likes'),
+         {'operations': [{'type': 'post', 'id': post.id, 'action': 'like'},
+                         {'type': 'comment', 'id': comment.id, 'action': 'like'}]}, True),
+        ('comment list', 'get', reverse('list-comments', kwargs={'id': post.id}), None, True),
+        ('comment create', 'post', reverse('list-comments', kwargs={'id': post.id}), {'content': 'benchmark'}, True),
+        ('comment tree', 'get', reverse('comment-tree', kwargs={'id': post.id}), None, True),
+        ('comment detail', 'get', reverse('RUD-comment', kwargs={'id': post.id, 'pk': comment.id}), None, True),
+        ('comment like', 'post', reverse('like-comment', kwargs={'id': post.id, 'pk': comment.id}), None, True),
+        ('comment replies', 'get', reverse('list-create-replies', kwargs={'id': post.id, 'pk': comment.id}), None,
+         True),
+        ('user search', 'get', reverse('users') + '?username=user1', None, False),
+        ('login', 'post', reverse('login'), {'username': viewer.username, 'password': PASSWORD}, False),
+        ('token refresh', 'post', reverse('refresh'), {'refresh': refresh}, False),
+        ('token verify', 'post', reverse('verify'), {'token': str(RefreshToken.for_user(viewer).access_token)},
+         False),
+        ('own profile', 'get', reverse('profile'), None, True),
+        ('own followers', 'get', reverse('profile_followers'), None, True),
+        ('own followings', 'get', reverse('profile_following'), None, True),
+        ('follow suggestions', 'get', reverse('profile_suggestions'), None, True),
+        ('export', 'get', reverse('profile_export'), None, True),
+        ('password change', 'put', reverse('password-change'),
+         {'old_password': PASSWORD, 'new_password': PASSWORD, 'confirm_password': PASSWORD}, True),
+        ('user profile', 'get', reverse('user', kwargs={'username': other.username}), None, True),
+        ('user posts', 'get', reverse('user-posts', kwargs={'username': other.username}), None, True),
+        ('follow', 'post', reverse('follow', kwargs={'username': other.username}), None, True),
+        ('user followers', 'get', reverse('followers', kwargs={'username': other.username}), None, True),
+        ('user followings', 'get', reverse('following', kwargs={'username': other.username}), None, True),
+    ], viewer
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(fraction * (len(values) - 1)))]
+
+
+def send(client, method, url, data):
+    # Bodies go as JSON, which the nested operations of a batch of likes need.
+    response = client.get(url, data) if method == 'get' else getattr(client, method)(url, data, format='json')
+    if response.streaming:
+        # A streamed body is only produced, and its queries run, as it is read.
+        b''.join(response.streaming_content)
+    return response
+
+
+def measure(client, method, url, data, iterations):
+    timings, queries, status_code = [], 0, None
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = send(client, method, url, data)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries = max(queries, len(context.captured_queries))
+        status_code = response.status_code
+
+    # Memory is traced in a separate request so tracemalloc's overhead doesn't skew the timings.
+    tracemalloc.start()
+    send(client, method, url, data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'status': status_code,
+        'p50_ms': round(statistics.median(timings), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'queries': queries,
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run(iterations=20):
+    routes, viewer = endpoints()
+    results = {}
+    for name, method, url, data, authenticated in routes:
+        cache.clear()
+        client = APIClient()
+        if authenticated:
+            client.force_authenticate(user=viewer)
+        results[name] = measure(client, method, url, data, iterations)
+    return results
+
+
+def compare(baseline, results, tolerance=0.5):
+    """
+    Regressions of `results` against `baseline`: any endpoint that runs more queries, or whose p50/p99
+    latency or peak memory grew by more than `tolerance` (0.5 = 50%).
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+
+        if result['queries'] > before['queries']:
+            regressions.append(f"{name}: {before['queries']} -> {result['queries']} queries")
+        for metric in ('p50_ms', 'p99_ms', 'peak_memory_kb'):
+            if result[metric] > before[metric] * (1 + tolerance):
+                regressions.append(f'{name}: {metric} {before[metric]} -> {result[metric]}')
+    return regressions
+
+
+class BenchmarkWSGIServer(ThreadedWSGIServer):
+    # runserver's backlog of 10 drops connections under load, which would show up as 1s retries.
+    request_queue_size = 128
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(kind):
+    """
+    Start the WSGI application on a threaded server (as runserver does) or the ASGI application on uvicorn,
+    on a free local port in a background thread. Returns the server's base URL and a function that stops it.
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    if kind == 'wsgi':
+        server = BenchmarkWSGIServer(('127.0.0.1', port), QuietWSGIRequestHandler, allow_reuse_address=False)
+        server.set_app(get_wsgi_application())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return f'http://127.0.0.1:{port}', lambda: (server.shutdown(), server.server_close())
+
+    import uvicorn
+    from SimpleSocialApp.asgi import application
+
+    server = uvicorn.Server(uvicorn.Config(application, host='127.0.0.1', port=port, log_level='warning',
+                                          lifespan='off'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+    return f'http://127.0.0.1:{port}', stop
+
+
+def load(url, headers, requests, concurrency):
+    """Send `requests` GET requests to `url` from `concurrency` clients at once."""
+    def fetch(_):
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+                response.read()
+                ok = response.status < 400
+        except urllib.error.URLError:
+            ok = False
+        return (time.perf_counter() - start) * 1000, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(fetch, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    timings = [timing for timing, _ in results]
+    return {
+        'p50_ms': round(statistics.median(timings), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'requests_per_second': round(requests / elapsed, 1),
+        'errors': sum(not ok for _, ok in results),
+    }
+
+
+def run_servers(iterations=200, concurrency=20):
+    """Compare the sync views on a WSGI server with the async views on an ASGI server, over real HTTP."""
+    routes, viewer = endpoints()
+    authorization = {'Authorization': f'Bearer {RefreshToken.for_user(viewer).access_token}'}
+    results = {}
+    for kind in ('wsgi', 'asgi'):
+        base_url, stop = serve(kind)
+        try:
+            results[kind] = {}
+            for name, method, url, data, authenticated in routes:
+                if name in SERVER_ROUTES:
+                    cache.clear()
+                    results[kind][name] = load(base_url + url, authorization if authenticated else {},
+                                               iterations, concurrency)
+        finally:
+            stop()
+    return results
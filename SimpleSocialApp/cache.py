@@ -0,0 +1,88 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+class VersionedCache:
+    """
+    Caches serialized payloads per object under a version number. Invalidating an object only bumps its
+    version, so stale payloads are never read again and simply expire. Works with any cache backend that
+    supports `add` and `incr`, including locmem and file-based caches.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+    def version_key(self, pk):
+        return f'{self.namespace}:{pk}:version'
+
+    def version(self, pk):
+        # Start from the clock rather than 1, so a version key that got evicted can't come back as an old number.
+        self.cache.add(self.version_key(pk), time.time_ns(), timeout=None)
+        return self.cache.get(self.version_key(pk))
+
+    async def aversion(self, pk):
+        await self.cache.aadd(self.version_key(pk), time.time_ns(), timeout=None)
+        return await self.cache.aget(self.version_key(pk))
+
+    def invalidate(self, pk):
+        self.bump(pk)
+        # Bump again once the change is committed, in case a concurrent request re-cached the old rows meanwhile.
+        transaction.on_commit(lambda: self.bump(pk))
+
+    def bump(self, pk):
+        try:
+            self.cache.incr(self.version_key(pk))
+        except ValueError:
+            self.cache.add(self.version_key(pk), time.time_ns(), timeout=None)
+
+    def get(self, pk):
+        data = self.cache.get(f'{self.namespace}:{pk}:{self.version(pk)}')
+        self.count('hits' if data is not None else 'misses')
+        return data
+
+    async def aget(self, pk):
+        data = await self.cache.aget(f'{self.namespace}:{pk}:{await self.aversion(pk)}')
+        await self.acount('hits' if data is not None else 'misses')
+        return data
+
+    def set(self, pk, data, timeout=None):
+        self.cache.set(f'{self.namespace}:{pk}:{self.version(pk)}', data, timeout=timeout or self.timeout)
+
+    async def aset(self, pk, data):
+        await self.cache.aset(f'{self.namespace}:{pk}:{await self.aversion(pk)}', data, timeout=self.timeout)
+
+    def count(self, name):
+        key = f'{self.namespace}:stats:{name}'
+        self.cache.add(key, 0, timeout=None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            pass
+
+    async def acount(self, name):
+        key = f'{self.namespace}:stats:{name}'
+        await self.cache.aadd(key, 0, timeout=None)
+        try:
+            await self.cache.aincr(key)
+        except ValueError:
+            pass
+
+    def stats(self):
+        return {name: self.cache.get(f'{self.namespace}:stats:{name}', 0) for name in ('hits', 'misses')}
+
+
+post_cache = VersionedCache('post')
+profile_cache = VersionedCache('profile')
+# Users authenticated by CachedJWTAuthentication, for the lifetime of their token.
+user_cache = VersionedCache('user')
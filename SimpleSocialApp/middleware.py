@@ -0,0 +1,163 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger('SimpleSocialApp.requests')
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def sql_shape(sql):
+    """SQL with its literals and the length of its IN lists stripped, so repeats of one query compare equal."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = re.sub(r'%s|\?', '?', sql)
+    return re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(...)', sql)
+
+
+class RequestMetrics:
+    """Query count, DB time and serializer time of one request, with every SQL shape it ran and how often."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.shapes = Counter()
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.shapes[sql_shape(sql)] += 1
+
+    @contextmanager
+    def capture(self):
+        token = _current.set(self)
+        try:
+            for connection in connections.all():
+                install_query_recorder(connection)
+            yield self
+        finally:
+            _current.reset(token)
+
+    def repeated_queries(self, threshold):
+        """The SQL shapes run more than `threshold` times, which usually means an N+1 loop."""
+        return {shape: count for shape, count in self.shapes.items() if count > threshold}
+
+
+def _record_query(execute, sql, params, many, context):
+    # The metrics live in a context variable rather than on the connection, so queries that async views
+    # run through sync_to_async, on another thread's connection, are counted for the right request.
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(lambda sender, connection, **kwargs: install_query_recorder(connection),
+                           weak=False, dispatch_uid='request_metrics')
+
+
+def _timed_data(data):
+    def wrapper(serializer):
+        metrics = _current.get()
+        if metrics is None or metrics.serializing:
+            return data.fget(serializer)
+
+        # Only the outermost `.data` is timed, and the time includes any queries it triggers.
+        metrics.serializing = True
+        start = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            metrics.serializing = False
+            metrics.serializer_time += time.perf_counter() - start
+
+    wrapper.timed = True
+    return property(wrapper)
+
+
+def instrument_serializers():
+    if not getattr(BaseSerializer.data.fget, 'timed', False):
+        BaseSerializer.data = _timed_data(BaseSerializer.data)
+
+
+class RequestMetricsMiddleware:
+    """
+    Measures the number of queries, DB time, serializer time and wall time of every request. They are sent
+    back in a `Server-Timing` header (when REQUEST_METRICS_HEADERS is on) and logged as one JSON line on
+    the `SimpleSocialApp.requests` logger. Requests that repeat one SQL shape more than
+    REQUEST_METRICS_NPLUSONE_THRESHOLD times are logged as warnings, along with the repeated queries.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        instrument_serializers()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        metrics = RequestMetrics()
+        start = time.perf_counter()
+        with metrics.capture():
+            response = self.get_response(request)
+        return self.report(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        start = time.perf_counter()
+        with metrics.capture():
+            response = await self.get_response(request)
+        return self.report(request, response, metrics, time.perf_counter() - start)
+
+    @staticmethod
+    def report(request, response, metrics, total_time):
+        if getattr(settings, 'REQUEST_METRICS_HEADERS', True):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+                f'serializer;dur={metrics.serializer_time * 1000:.1f}',
+                f'total;dur={total_time * 1000:.1f}',
+            ])
+
+        repeated = metrics.repeated_queries(getattr(settings, 'REQUEST_METRICS_NPLUSONE_THRESHOLD', 10))
+        line = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': metrics.queries,
+            'db_ms': round(metrics.db_time * 1000, 1),
+            'serializer_ms': round(metrics.serializer_time * 1000, 1),
+            'total_ms': round(total_time * 1000, 1),
+        }
+        if repeated:
+            line['repeated_queries'] = [{'sql': shape, 'count': count} for shape, count in repeated.items()]
+            logger.warning(json.dumps(line))
+        else:
+            logger.info(json.dumps(line))
+        return response
@@ -0,0 +1,153 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks past the last row of the previous page instead of using OFFSET,
+    so every page costs the same index range scan no matter how deep it is.
+
+    Views can change the sort key with a `keyset_ordering` attribute; the last field must be unique.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views, fetching the page with the async ORM."""
+        return self.set_page([obj async for obj in self.page_queryset(queryset, request, view)])
+
+    def page_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = getattr(view, 'keyset_ordering', self.ordering)
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.seek(self.convert(queryset, position)))
+        # One row more than a page, to tell whether there is a next page.
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        last = self.page[-1]
+        position = [getattr(last, field.lstrip('-')) for field in self.ordering]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position))
+
+    def seek(self, position):
+        """Build the `(a, b) < (x, y)` row comparison as nested ORs that databases can serve from the index."""
+        condition = Q()
+        for i in reversed(range(len(self.ordering))):
+            field = self.ordering[i].lstrip('-')
+            lookup = 'lt' if self.ordering[i].startswith('-') else 'gt'
+            equal = {self.ordering[j].lstrip('-'): position[j] for j in range(i)}
+            condition |= Q(**equal, **{f'{field}__{lookup}': position[i]})
+        return condition
+
+    def convert(self, queryset, position):
+        """The cursor's values as the types of their ordering fields, so a forged cursor never reaches the query."""
+        values = []
+        for name, value in zip(self.ordering, position):
+            name = name.lstrip('-')
+            annotation = queryset.query.annotations.get(name)
+            field = annotation.output_field if annotation is not None else queryset.model._meta.get_field(name)
+            if isinstance(value, (bool, list, dict)) or value is None:
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                values.append(field.to_python(value))
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        return values
+
+    @staticmethod
+    def encode_cursor(position):
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in position]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+
+class RankedPagination(KeysetPagination):
+    """
+    Pages through results that arrive already ranked, such as search hits. The cursor is the position
+    of the last result, and `fetch(offset, limit)` returns the primary keys of the next ranked slice.
+    """
+    ordering = ('rank',)
+
+    def paginate_ranked(self, fetch, queryset, request):
+        self.request = request
+        self.ordering = type(self).ordering
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        if position and (not isinstance(position[0], int) or isinstance(position[0], bool) or position[0] < 0):
+            raise NotFound(self.invalid_cursor_message)
+        offset = position[0] + 1 if position else 0
+
+        ids = fetch(offset, self.page_size + 1)
+        self.has_next = len(ids) > self.page_size
+        self.last_rank = offset + self.page_size - 1
+        objects = queryset.in_bulk(ids[:self.page_size])
+        self.page = [objects[pk] for pk in ids[:self.page_size] if pk in objects]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor([self.last_rank]))
@@ -49,9 +49,12 @@ INSTALLED_APPS = [
     'users',
     'corsheaders',
     'rest_framework_simplejwt.token_blacklist',
+    'search',
+    'mediastore',
 ]
 
 MIDDLEWARE = [
+    'SimpleSocialApp.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,6 +84,24 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'SimpleSocialApp.wsgi.application'
+ASGI_APPLICATION = 'SimpleSocialApp.asgi.application'
+# The ASGI application serves the feed, post detail, comments and profile endpoints with async views.
+ASGI_ROOT_URLCONF = 'SimpleSocialApp.asgi_urls'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Use 'django.core.cache.backends.filebased.FileBasedCache' with a LOCATION to share the cache between processes.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Serialized post details and user profiles, invalidated by version whenever they change.
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 300
 
 
 # Database
@@ -130,6 +151,15 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded images are stored once per content hash (see mediastore.storage). SERVE_MEDIA serves MEDIA_URL
+# from Django, with immutable cache headers on the hashed files; in production the web server should.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'media': {'BACKEND': 'mediastore.storage.ContentAddressedStorage'},
+}
+SERVE_MEDIA = DEBUG
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -140,11 +170,84 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'SimpleSocialApp.pagination.KeysetPagination',
 }
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
 }
+# How often each process loads the newly blacklisted tokens; a token blacklisted by another process keeps
+# working there for at most this long.
+JWT_BLACKLIST_REFRESH_SECONDS = 5
+# How long authenticated users are cached. With a per-process cache such as locmem, a user deactivated or
+# deleted through another process is still let in there for at most this long.
+JWT_USER_CACHE_SECONDS = 5
+
+# Home feed: posts are copied into followers' timelines on write, except for authors with at least
+# FEED_FANOUT_MAX_FOLLOWERS followers, whose posts are pulled into the timeline when it is read.
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+FEED_BACKFILL_POSTS = 50
+
+# Usernames in URLs are resolved to user ids through an in-process LRU cache of USERNAME_CACHE_SIZE entries
+# that expire after USERNAME_CACHE_TTL seconds.
+USERNAME_CACHE_SIZE = 10000
+USERNAME_CACHE_TTL = 300
+
+# Who to follow: the compute_suggestions command (run it nightly) stores up to FOLLOW_SUGGESTIONS users per user,
+# served by /users/profile/suggestions/.
+FOLLOW_SUGGESTIONS = 20
+
+# How many of a user's most recent posts are embedded in their profile; the rest are paged at /users/<username>/posts/.
+PROFILE_EMBEDDED_POSTS = 10
+
+# Trending posts: likes and comments count by TRENDING_WEIGHTS and half as much every TRENDING_HALF_LIFE
+# seconds. The update_trending command (run it every minute or so) counts the new ones and keeps the top
+# TRENDING_SIZE posts ranked for /posts/trending/. Each run reads again the last TRENDING_OVERLAP_SECONDS before
+# the newest event it counted, for rows that committed late. Counted events are remembered for
+# TRENDING_EVENT_MEMORY seconds (ten half-lives unless set), so they count once, and so does a like undone and
+# made again.
+TRENDING_OVERLAP_SECONDS = 300
+TRENDING_SIZE = 50
+TRENDING_HALF_LIFE = 6 * 3600
+TRENDING_WEIGHTS = {'like': 1, 'comment': 2, 'comment_like': 0.5}
+
+# Write-behind likes: likes are buffered per process, coalesced per user and object, and written in batches
+# every LIKE_FLUSH_SECONDS (or as soon as LIKE_BUFFER_MAX are waiting). Users see their own buffered likes;
+# others see them once flushed. Likes still buffered when a process is killed are lost.
+LIKE_WRITE_BEHIND = False
+LIKE_FLUSH_SECONDS = 0.25
+LIKE_BUFFER_MAX = 10000
+
+# Uploaded images are staged as is and resized into these WebP variants (longest side in pixels) by a pool
+# of IMAGE_WORKERS threads after the request. IMAGE_PIPELINE_EAGER processes them on commit instead.
+IMAGE_VARIANTS = {'thumbnail': 150, 'medium': 600, 'full': 1600}
+IMAGE_WORKERS = 2
+IMAGE_PIPELINE_EAGER = False
+
+# Full-text search: FTS5 on SQLite by default. Point this at another `search.backends.BaseSearchBackend`
+# subclass to use a different engine (e.g. 'search.backends.DatabaseSearchBackend').
+SEARCH_BACKEND = None
+
+# Per-request metrics: query count, DB, serializer and wall time are sent in a Server-Timing header and
+# logged as JSON on the 'SimpleSocialApp.requests' logger. Requests that run one SQL shape more than
+# REQUEST_METRICS_NPLUSONE_THRESHOLD times are logged as warnings; set REQUEST_LOG_LEVEL=INFO to log them all.
+REQUEST_METRICS_HEADERS = True
+REQUEST_METRICS_NPLUSONE_THRESHOLD = 10
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'SimpleSocialApp.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,12 @@
+from django.contrib import admin
+
+from .models import Blob
+
+
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'size', 'references', 'created_at']
+    search_fields = ['name']
+    readonly_fields = ['name', 'size', 'references', 'created_at']
+
+
+admin.site.register(Blob, BlobAdmin)
@@ -0,0 +1,13 @@
+from django.apps import AppConfig, apps
+from django.db.models.signals import post_delete
+
+
+class MediastoreConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'mediastore'
+
+    def ready(self):
+        from .pipeline import IMAGE_FIELDS, release
+
+        for label in IMAGE_FIELDS:
+            post_delete.connect(release, sender=apps.get_model(label), dispatch_uid=f'release_images_{label}')
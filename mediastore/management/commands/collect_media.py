@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from mediastore.pipeline import recount_blobs
+
+
+class Command(BaseCommand):
+    help = ('Recount the references to every stored image file from the image variants, and delete the files '
+            'nothing refers to anymore')
+
+    def handle(self, *args, **options):
+        recounted, deleted = recount_blobs()
+        self.stdout.write(self.style.SUCCESS(f'Recounted {recounted} files, deleted {deleted} unreferenced files'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from mediastore import pipeline
+
+
+class Command(BaseCommand):
+    help = ('Produce the variants of every image that has none yet: uploads left in staging (e.g. by a restart) '
+            'and images stored before the pipeline existed')
+
+    def handle(self, *args, **options):
+        processed = failed = 0
+        for label, pk, field_name, name in list(pipeline.pending()):
+            try:
+                pipeline.process(label, pk, field_name, name)
+                processed += 1
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{label} {pk}: could not process {name}: {error}')
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} images, {failed} failed'))
@@ -0,0 +1,12 @@
+from django.db import models
+
+
+class Blob(models.Model):
+    """A file of the content-addressed media storage, stored once however many images refer to it."""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    references = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name} ({self.references} references)'
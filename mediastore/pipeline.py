@@ -0,0 +1,183 @@
+import io
+import logging
+import os
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Blob
+from .storage import media_storage
+
+logger = logging.getLogger(__name__)
+
+# Every image field that goes through the pipeline. Each has a JSONField named `<field>_variants` next to it
+# that maps variant names to stored files; it stays empty while the upload waits in staging.
+IMAGE_FIELDS = {
+    'posts.Post': 'post_img',
+    'users.Profile': 'profile_pic',
+}
+STAGING_DIR = 'staging'
+
+_executor = None
+
+
+def variant_sizes():
+    """Variant name -> longest side in pixels. Images are never upscaled."""
+    return getattr(settings, 'IMAGE_VARIANTS', {'thumbnail': 150, 'medium': 600, 'full': 1600})
+
+
+def variants_field(field_name):
+    return f'{field_name}_variants'
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'IMAGE_WORKERS', 2),
+                                       thread_name_prefix='image-pipeline')
+    return _executor
+
+
+def stage(instance, field_name, upload):
+    """
+    Store an upload as is in the staging area, point the field at it and schedule its processing once the
+    transaction commits. The request only pays for writing the file; resizing happens in the worker pool.
+    """
+    extension = os.path.splitext(upload.name)[1].lower()
+    staged = default_storage.save(f'{STAGING_DIR}/{uuid.uuid4().hex}{extension}', upload)
+    replaced = getattr(instance, variants_field(field_name)) or {}
+    setattr(instance, field_name, staged)
+    setattr(instance, variants_field(field_name), {})
+    instance.save(update_fields=[field_name, variants_field(field_name)])
+
+    label = instance._meta.label
+    storage = instance._meta.get_field(field_name).storage
+    transaction.on_commit(lambda: delete_files(storage, replaced.values()))
+    if getattr(settings, 'IMAGE_PIPELINE_EAGER', False):
+        transaction.on_commit(lambda: process(label, instance.pk, field_name, staged))
+    else:
+        transaction.on_commit(lambda: get_executor().submit(run_in_worker, label, instance.pk, field_name, staged))
+    return staged
+
+
+def clear(instance, field_name):
+    """Empty an image field, e.g. set to null by a client, and delete its variants once the transaction commits."""
+    variants = getattr(instance, variants_field(field_name)) or {}
+    setattr(instance, field_name, None)
+    setattr(instance, variants_field(field_name), {})
+    instance.save(update_fields=[field_name, variants_field(field_name)])
+
+    storage = instance._meta.get_field(field_name).storage
+    transaction.on_commit(lambda: delete_files(storage, variants.values()))
+
+
+def run_in_worker(label, pk, field_name, source):
+    try:
+        process(label, pk, field_name, source)
+    except Exception:
+        logger.exception('Could not process %s %s of %s %s', field_name, source, label, pk)
+    finally:
+        # Worker threads open their own connection, which nothing else would close.
+        connection.close()
+
+
+def render_variants(source):
+    """Re-encode an image file as one WebP per variant size. Re-encoding drops EXIF, GPS and other metadata."""
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        for name, size in variant_sizes().items():
+            variant = image.copy()
+            variant.thumbnail((size, size))
+            buffer = io.BytesIO()
+            variant.save(buffer, 'WEBP', quality=80, method=4)
+            yield name, buffer.getvalue()
+
+
+def process(label, pk, field_name, source):
+    """
+    Produce the variants of the image stored at `source` and swap them in, unless a newer upload replaced it
+    meanwhile. Staged uploads are deleted afterwards; images stored before the pipeline existed are kept.
+    """
+    model = apps.get_model(label)
+    field = model._meta.get_field(field_name)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is not None and getattr(instance, field_name).name == source:
+        upload_to = field.upload_to.rstrip('/')
+        with default_storage.open(source) as file:
+            # The content-addressed storage names each variant after its hash, so duplicates share one file.
+            variants = {name: field.storage.save(f'{upload_to}/{name}.webp', ContentFile(content))
+                        for name, content in render_variants(file)}
+
+        with transaction.atomic():
+            # Lock the row so a newer upload that arrived meanwhile isn't overwritten by this one.
+            instance = model.objects.select_for_update().filter(pk=pk).first()
+            if instance is None or getattr(instance, field_name).name != source:
+                delete_files(field.storage, variants.values())
+            else:
+                # The field itself points at the largest variant.
+                setattr(instance, field_name, variants[max(variant_sizes(), key=variant_sizes().get)])
+                setattr(instance, variants_field(field_name), variants)
+                instance.save(update_fields=[field_name, variants_field(field_name)])
+
+    if source.startswith(f'{STAGING_DIR}/'):
+        delete_files(default_storage, [source])
+
+
+def delete_files(storage, names):
+    # With the content-addressed storage this drops one reference, the file goes with the last one.
+    for name in names:
+        storage.delete(name)
+
+
+def release(sender, instance, **kwargs):
+    """post_delete receiver that deletes the variants of a deleted row's image."""
+    field_name = IMAGE_FIELDS[sender._meta.label]
+    variants = getattr(instance, variants_field(field_name)) or {}
+    storage = sender._meta.get_field(field_name).storage
+    transaction.on_commit(lambda: delete_files(storage, variants.values()))
+
+
+def pending():
+    """(label, pk, field name, file) of every image without variants: staged uploads and images stored before."""
+    for label, field_name in IMAGE_FIELDS.items():
+        rows = apps.get_model(label).objects.exclude(**{field_name: ''}).filter(**{
+            f'{field_name}__isnull': False, variants_field(field_name): {}})
+        for pk, name in rows.values_list('pk', field_name).iterator():
+            yield label, pk, field_name, name
+
+
+def recount_blobs(grace=timedelta(hours=1)):
+    """
+    Reset the reference count of every Blob to the number of variants that point at it, and delete the files
+    nothing points at anymore, e.g. when a worker died between storing the variants and swapping them in.
+    Blobs younger than `grace` are left alone, as their variants may still be on their way to the row.
+    Returns (blobs recounted, blobs deleted).
+    """
+    references = Counter()
+    for label, field_name in IMAGE_FIELDS.items():
+        rows = apps.get_model(label).objects.exclude(**{variants_field(field_name): {}})
+        for variants in rows.values_list(variants_field(field_name), flat=True).iterator():
+            references.update(variants.values())
+
+    recounted = deleted = 0
+    for blob in Blob.objects.filter(created_at__lt=timezone.now() - grace).iterator():
+        count = references[blob.name]
+        if count == 0:
+            # Dropped as the last reference, so a concurrent upload of the same content keeps its file.
+            Blob.objects.filter(pk=blob.pk).update(references=1)
+            media_storage().delete(blob.name)
+            deleted += 1
+        elif count != blob.references:
+            Blob.objects.filter(pk=blob.pk).update(references=count)
+            recounted += 1
+    return recounted, deleted
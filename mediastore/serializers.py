@@ -0,0 +1,44 @@
+from rest_framework import serializers
+
+from .pipeline import clear, stage, variants_field
+
+
+class VariantImageField(serializers.ImageField):
+    """
+    Accepts an image upload like ImageField, but represents the stored image by the URLs of its processed
+    variants, e.g. {'thumbnail': ..., 'medium': ..., 'full': ...}, or None until they are ready.
+    """
+
+    def to_representation(self, value):
+        variants = getattr(value.instance, variants_field(value.field.name), None) if value else None
+        if not variants:
+            return None
+
+        # Bodies serialized for a shared cache keep the paths, which views make absolute for each request.
+        request = None if self.context.get('cached') else self.context.get('request')
+        urls = {name: value.storage.url(path) for name, path in variants.items()}
+        return absolute_image_urls(urls, request) if request is not None else urls
+
+
+def absolute_image_urls(urls, request):
+    """The variant URLs of a VariantImageField (or None) made absolute for `request`."""
+    return urls and {name: request.build_absolute_uri(url) for name, url in urls.items()}
+
+
+class StagedImagesMixin:
+    """
+    ModelSerializer mixin that hands the uploads of its VariantImageFields to the image pipeline instead of
+    saving them in place, so the request never waits on resizing.
+    """
+
+    def save(self, **kwargs):
+        images = [field.source for field in self.fields.values() if isinstance(field, VariantImageField)]
+        uploads = {name: self.validated_data.pop(name) for name in images if self.validated_data.get(name)}
+        # An explicit null removes the image along with its variants.
+        cleared = [name for name in images if name in self.validated_data and self.validated_data.pop(name) is None]
+        instance = super().save(**kwargs)
+        for field_name, upload in uploads.items():
+            stage(instance, field_name, upload)
+        for field_name in cleared:
+            clear(instance, field_name)
+        return instance
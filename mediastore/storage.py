@@ -0,0 +1,82 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import transaction
+from django.db.models import F
+
+from .models import Blob
+
+# <upload_to>/<first two hex digits>/<sha256><extension>
+HASHED_NAME = re.compile(r'(?:^|/)[0-9a-f]{2}/[0-9a-f]{64}(?:\.\w+)?$')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that names every file after the SHA-256 of its content, so identical uploads are
+    stored once. The hash is computed while the file is streamed to a temporary file, which is then moved
+    into place, or dropped if that content is already stored. Each name is a Blob with a reference count:
+    `save` adds a reference and `delete` removes one, and the file goes away with the last reference.
+
+    Files never change under their name, so they can be cached forever (see `CACHE_CONTROL`). Names that
+    aren't content-addressed, such as files stored before this backend, are saved and deleted as usual.
+    """
+    CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+    def _save(self, name, content):
+        os.makedirs(self.location, exist_ok=True)
+        digest, size = hashlib.sha256(), 0
+        with tempfile.NamedTemporaryFile(dir=self.location, prefix='.upload-', delete=False) as temporary:
+            try:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temporary.write(chunk)
+                    size += len(chunk)
+            except BaseException:
+                os.unlink(temporary.name)
+                raise
+
+        hexdigest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        name = posixpath.join(posixpath.dirname(name), hexdigest[:2], hexdigest + extension)
+        try:
+            with transaction.atomic():
+                # The row lock orders this against a `delete` of the last reference to the same content.
+                blob, _ = Blob.objects.select_for_update().get_or_create(name=name, defaults={'size': size})
+                Blob.objects.filter(pk=blob.pk).update(references=F('references') + 1)
+                if not self.exists(name):
+                    path = self.path(name)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    if self.directory_permissions_mode is not None:
+                        os.chmod(os.path.dirname(path), self.directory_permissions_mode)
+                    os.replace(temporary.name, path)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(path, self.file_permissions_mode)
+        finally:
+            if os.path.exists(temporary.name):
+                os.unlink(temporary.name)
+        return name
+
+    def delete(self, name):
+        if not name:
+            raise ValueError('The name must be given to delete().')
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(name=name).first()
+            if blob is not None:
+                if blob.references > 1:
+                    Blob.objects.filter(pk=blob.pk).update(references=F('references') - 1)
+                    return
+                blob.delete()
+            super().delete(name)
+
+    @staticmethod
+    def is_content_addressed(name):
+        return HASHED_NAME.search(name) is not None
+
+
+def media_storage():
+    """The storage of uploaded images, STORAGES['media']."""
+    return storages['media']
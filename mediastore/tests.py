@@ -0,0 +1,204 @@
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from posts.models import Post
+from . import pipeline
+from .models import Blob
+from .views import serve_media
+
+
+def image_file(name='photo.jpg', size=(2000, 1000), format='JPEG'):
+    image = Image.new('RGB', size, 'red')
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera maker'
+    buffer = io.BytesIO()
+    image.save(buffer, format, exif=exif)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class TestSetup(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root, IMAGE_PIPELINE_EAGER=True)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.client = APIClient()
+        self.user = User.objects.create(username='testUser', password='testPass')
+        self.client.force_authenticate(user=self.user)
+
+
+class ImagePipelineTestCase(TestSetup):
+    def test_post_image_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/posts/', {'content': 'photo', 'post_img': image_file()})
+        self.assertEqual(response.status_code, 201, 'Status code is not 201')
+        self.assertIsNone(response.data['post_img'], 'Image is returned before it is processed')
+
+        post = Post.objects.get(id=response.data['id'])
+        self.assertEqual(set(post.post_img_variants), {'thumbnail', 'medium', 'full'}, 'Variants are missing')
+        self.assertEqual(post.post_img.name, post.post_img_variants['full'], 'Field does not point at full size')
+        for name, path in post.post_img_variants.items():
+            with default_storage.open(path) as file, Image.open(file) as image:
+                self.assertEqual(image.format, 'WEBP', f'{name} is not WebP')
+                self.assertEqual(max(image.size), pipeline.variant_sizes()[name], f'{name} has the wrong size')
+                self.assertFalse(image.getexif(), f'{name} kept its metadata')
+        self.assertEqual(default_storage.listdir(pipeline.STAGING_DIR)[1], [], 'Staged upload was not deleted')
+
+        response = self.client.get(f'/posts/{post.id}/')
+        self.assertTrue(response.data['post_img']['thumbnail'].startswith('http://testserver/media/images/'),
+                        'Variant URLs are not returned')
+
+    def test_small_images_are_not_upscaled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/posts/', {'content': 'photo', 'post_img': image_file(size=(100, 50))})
+        post = Post.objects.get(id=response.data['id'])
+        with default_storage.open(post.post_img_variants['full']) as file, Image.open(file) as image:
+            self.assertEqual(image.size, (100, 50), 'Image was upscaled')
+
+    def test_newer_upload_wins(self):
+        post = Post.objects.create(content='photo', author=self.user)
+        first = pipeline.stage(post, 'post_img', image_file())
+        second = pipeline.stage(post, 'post_img', image_file())
+        pipeline.process('posts.Post', post.id, 'post_img', first)
+        post.refresh_from_db()
+        self.assertEqual(post.post_img.name, second, 'Older upload replaced the newer one')
+        self.assertFalse(default_storage.exists(first), 'Superseded upload was not deleted')
+
+        pipeline.process('posts.Post', post.id, 'post_img', second)
+        post.refresh_from_db()
+        self.assertTrue(post.post_img_variants, 'Newer upload was not processed')
+
+    def test_profile_pic(self):
+        profile = self.user.profile
+        with self.captureOnCommitCallbacks(execute=True):
+            pipeline.stage(profile, 'profile_pic', image_file('avatar.png', format='PNG'))
+        profile.refresh_from_db()
+        self.assertTrue(profile.profile_pic.name.startswith('avatars/'), 'Profile picture was not processed')
+
+        response = self.client.get('/users/profile/')
+        self.assertEqual(set(response.data['profile']['profile_pic']), {'thumbnail', 'medium', 'full'},
+                         'Variant URLs are not returned')
+
+    def test_process_images_command(self):
+        post = Post.objects.create(content='photo', author=self.user)
+        post.post_img.save('old.jpg', ContentFile(image_file().read()))
+        original = post.post_img.name
+        out = StringIO()
+        call_command('process_images', stdout=out)
+        self.assertIn('Processed 1 images', out.getvalue(), 'Stored image was not processed')
+        post.refresh_from_db()
+        self.assertTrue(post.post_img_variants, 'Variants were not created')
+        self.assertTrue(default_storage.exists(original), 'Original image was deleted')
+
+
+class ContentAddressedStorageTestCase(TestSetup):
+    def create_post(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/posts/', {'content': 'meme', 'post_img': image_file()})
+        return Post.objects.get(id=response.data['id'])
+
+    def test_duplicates_are_stored_once(self):
+        first, second = self.create_post(), self.create_post()
+        self.assertEqual(first.post_img_variants, second.post_img_variants, 'Duplicate upload was stored again')
+        for path in first.post_img_variants.values():
+            self.assertRegex(path, r'^images/[0-9a-f]{2}/[0-9a-f]{64}\.webp$', 'Name is not the content hash')
+            self.assertEqual(Blob.objects.get(name=path).references, 2, 'References were not counted')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        path = second.post_img_variants['thumbnail']
+        self.assertEqual(Blob.objects.get(name=path).references, 1, 'Reference was not dropped')
+        self.assertTrue(default_storage.exists(path), 'Shared file was deleted')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(Blob.objects.exists(), 'Unreferenced blobs were kept')
+        self.assertFalse(default_storage.exists(path), 'Unreferenced file was kept')
+
+    def test_replaced_image_is_released(self):
+        post = self.create_post()
+        old = post.post_img_variants['full']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(f'/posts/{post.id}/', {
+                'content': 'meme', 'post_img': image_file(size=(800, 400))}, format='multipart')
+        self.assertEqual(response.status_code, 200, 'Status code is not 200')
+        post.refresh_from_db()
+        self.assertNotEqual(post.post_img_variants['full'], old, 'Image was not replaced')
+        self.assertFalse(default_storage.exists(old), 'Replaced image was kept')
+
+    def test_cleared_image_is_released(self):
+        post = self.create_post()
+        old = post.post_img_variants['full']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/posts/{post.id}/', {'post_img': None}, format='json')
+        self.assertEqual(response.status_code, 200, 'Status code is not 200')
+        post.refresh_from_db()
+        self.assertFalse(post.post_img or post.post_img_variants, 'Image was not cleared')
+        self.assertFalse(default_storage.exists(old), 'Cleared image was kept')
+
+    def test_cleared_profile_pic_is_released(self):
+        profile = self.user.profile
+        with self.captureOnCommitCallbacks(execute=True):
+            pipeline.stage(profile, 'profile_pic', image_file('avatar.png', format='PNG'))
+        profile.refresh_from_db()
+        old = profile.profile_pic_variants['full']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch('/users/profile/', {'profile': {'profile_pic': None}}, format='json')
+        profile.refresh_from_db()
+        self.assertEqual(profile.profile_pic_variants, {}, 'Profile picture was not cleared')
+        self.assertFalse(default_storage.exists(old), 'Cleared profile picture was kept')
+
+    def test_cached_urls_follow_the_host(self):
+        post = self.create_post()
+        with self.captureOnCommitCallbacks(execute=True):
+            pipeline.stage(self.user.profile, 'profile_pic', image_file('avatar.png', format='PNG'))
+        for host in ('evil.example', 'testserver'):
+            post_response = self.client.get(f'/posts/{post.id}/', HTTP_HOST=host)
+            profile_response = self.client.get(f'/users/{self.user.username}/', HTTP_HOST=host)
+        self.assertEqual(post_response['X-Cache'], 'HIT', 'Post was not served from the cache')
+        self.assertEqual(profile_response['X-Cache'], 'HIT', 'Profile was not served from the cache')
+        urls = [*post_response.data['post_img'].values(), *profile_response.data['posts'][0]['post_img'].values(),
+                *profile_response.data['profile']['profile_pic'].values()]
+        self.assertTrue(all(url.startswith('http://testserver/') for url in urls),
+                        'Cached image URLs carry the host of the first request')
+
+    def test_immutable_cache_headers(self):
+        post = self.create_post()
+        request = RequestFactory().get('/')
+        response = serve_media(request, post.post_img_variants['thumbnail'])
+        self.assertEqual(response.status_code, 200, 'Status code is not 200')
+        self.assertIn('immutable', response['Cache-Control'], 'Hashed file is not cached for good')
+
+        default_storage.save('images/legacy.jpg', ContentFile(b'legacy'))
+        response = serve_media(request, 'images/legacy.jpg')
+        self.assertNotIn('Cache-Control', response, 'Mutable file is cached for good')
+
+    def test_collect_media_command(self):
+        post = self.create_post()
+        orphan = pipeline.media_storage().save('images/orphan.webp', ContentFile(b'orphan'))
+        Blob.objects.filter(name=post.post_img_variants['full']).update(references=5)
+        Blob.objects.update(created_at=timezone.now() - timedelta(days=1))
+
+        out = StringIO()
+        call_command('collect_media', stdout=out)
+        self.assertIn('Recounted 1 files, deleted 1 unreferenced files', out.getvalue(), 'Blobs were not collected')
+        self.assertEqual(Blob.objects.get(name=post.post_img_variants['full']).references, 1,
+                         'References were not recounted')
+        self.assertFalse(default_storage.exists(orphan), 'Unreferenced file was kept')
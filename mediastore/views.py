@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.views.static import serve
+
+from .storage import ContentAddressedStorage
+
+
+def serve_media(request, path):
+    """Serve an uploaded file from MEDIA_ROOT; content-addressed files never change, so they're cached for good."""
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if ContentAddressedStorage.is_content_addressed(path):
+        response['Cache-Control'] = ContentAddressedStorage.CACHE_CONTROL
+    return response
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Post, Comment, Like
+from .models import Post, Comment, PostLike, CommentLike
 
 
 # Register your models here.
@@ -16,11 +16,17 @@ class CommentAdmin(admin.ModelAdmin):
     search_fields = ['content']
 
 
-class LikeAdmin(admin.ModelAdmin):
-    list_display = ['user', 'object_id', 'content_type', 'created_at']
-    list_filter = ['user', 'content_type', 'object_id']
+class PostLikeAdmin(admin.ModelAdmin):
+    list_display = ['user', 'post', 'created_at']
+    list_filter = ['user', 'post']
+
+
+class CommentLikeAdmin(admin.ModelAdmin):
+    list_display = ['user', 'comment', 'created_at']
+    list_filter = ['user', 'comment']
     
     
 admin.site.register(Post, PostAdmin)
 admin.site.register(Comment, CommentAdmin)
-admin.site.register(Like, LikeAdmin)
+admin.site.register(PostLike, PostLikeAdmin)
+admin.site.register(CommentLike, CommentLikeAdmin)
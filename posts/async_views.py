@@ -0,0 +1,65 @@
+from asgiref.sync import sync_to_async
+from django.http import Http404
+
+from SimpleSocialApp.async_views import AsyncReadView
+from SimpleSocialApp.cache import post_cache
+from users.models import Follow
+from .feed import home_feed
+from .likebuffer import like_buffer
+from .models import Post, Comment
+from .serializers import PostListCreateSerializer, CommentListCreateSerializer
+from .views import PostListCreate, PostRetrieveUpdateDestroy, PostCommentListCreate
+
+
+class AsyncPostListView(AsyncReadView):
+    sync_view = PostListCreate
+
+    def serves_async(self, request):
+        # Searches run on the search backend's raw connection, so they stay on the sync view.
+        return not request.query_params.get('search')
+
+    async def aget(self, request):
+        user = request.user
+        queryset = Post.objects.all()
+        if user.is_authenticated and await Follow.objects.filter(follower=user).aexists():
+            # home_feed() first copies new posts of followed celebrities into the timeline.
+            queryset = await sync_to_async(home_feed)(user, queryset)
+            self.keyset_ordering = ('-feed_at', '-id')
+
+        queryset = queryset.select_related('author').with_stats(user)
+        data = await self.paginate(queryset, request, PostListCreateSerializer, {'request': request})
+        return {**data, 'results': like_buffer.overlay(user, 'post', data['results'])}
+
+
+class AsyncPostDetailView(AsyncReadView):
+    sync_view = PostRetrieveUpdateDestroy
+
+    async def aget(self, request, id):
+        data = await post_cache.aget(id)
+        cache_status = 'HIT'
+        if data is None:
+            cache_status = 'MISS'
+            post = await PostRetrieveUpdateDestroy.detail_queryset(id).afirst()
+            if not post:
+                raise Http404
+            data = await self.serialize(PostRetrieveUpdateDestroy.serializer_class, post,
+                                        PostRetrieveUpdateDestroy.cache_context(request))
+            await post_cache.aset(id, data)
+
+        likes = [{pk async for pk in lookup} for lookup in PostRetrieveUpdateDestroy.like_lookups(data, request.user)]
+        return PostRetrieveUpdateDestroy.personalize(data, request, likes), {'X-Cache': cache_status}
+
+
+class AsyncCommentListView(AsyncReadView):
+    sync_view = PostCommentListCreate
+
+    def serves_async(self, request):
+        return not request.query_params.get('search')
+
+    async def aget(self, request, id):
+        if not await Post.objects.filter(id=id).aexists():
+            raise Http404
+
+        queryset = Comment.objects.filter(post_id=id, parent=None).select_related('author')
+        data = await self.paginate(queryset, request, CommentListCreateSerializer, {'request': request})
+        return {**data, 'results': like_buffer.overlay(request.user, 'comment', data['results'])}
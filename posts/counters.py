@@ -0,0 +1,172 @@
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from SimpleSocialApp.cache import post_cache, profile_cache
+from users.models import Follow, Profile
+from .models import Post, Comment, PostLike, CommentLike
+
+# What can be liked in a batch: the liked model and its like model, whose foreign key is named after the kind.
+LIKE_TARGETS = {'post': (Post, PostLike), 'comment': (Comment, CommentLike)}
+
+
+def bump(model, pk, **deltas):
+    """
+    Atomically add `deltas` to the counter columns of a single row, e.g. bump(Post, 1, likes_count=1). `pk` may
+    also be a Q that picks the rows, e.g. bump(Profile, Q(user_id=1), followers_count=1).
+    """
+    rows = model.objects.filter(pk if isinstance(pk, Q) else Q(pk=pk))
+    # Counters never go below zero, even if they drifted (e.g. rows deleted from the admin).
+    rows.update(**{field: Greatest(F(field) + delta, 0) for field, delta in deltas.items()})
+
+
+def bump_many(model, field, deltas, key='pk'):
+    """bump() for many rows at once, `deltas` mapping each row's `key` to its delta: one update per distinct delta."""
+    by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        by_delta[delta].append(pk)
+    for delta, pks in by_delta.items():
+        if delta:
+            bump(model, Q(**{f'{key}__in': pks}), **{field: delta})
+
+
+def toggle_like(user, obj):
+    """Like `obj` (a Post or Comment) for `user`, or remove the like if it exists. Returns True if it is now liked."""
+    with transaction.atomic():
+        # Locking the object, as apply_likes() and the like buffer do, keeps concurrent toggles from racing.
+        type(obj).objects.select_for_update().filter(pk=obj.pk).values_list('pk', flat=True).first()
+        deleted, _ = obj.likes.filter(user=user).delete()
+        if deleted:
+            bump(type(obj), obj.pk, likes_count=-1)
+            return False
+
+        try:
+            with transaction.atomic():
+                obj.likes.create(user=user)
+        except IntegrityError:
+            # Liked first by a writer that doesn't take the lock; the like exists, so there's nothing to count.
+            return True
+
+        bump(type(obj), obj.pk, likes_count=1)
+        return True
+
+
+def apply_likes(user, operations):
+    """
+    Apply a batch of explicit operations, dicts with a `type` of LIKE_TARGETS, an `id` and an `action` of 'like'
+    or 'unlike', in one transaction. Liking something already liked or unliking something not liked changes
+    nothing, so a replayed batch is harmless; when one object appears several times, the last operation wins.
+    Returns one result per operation with the object's final like state and count.
+    """
+    actions = {(operation['type'], operation['id']): operation['action'] for operation in operations}
+    counts = {}
+    with transaction.atomic():
+        for kind, (model, like_model) in LIKE_TARGETS.items():
+            # Locking the targets keeps concurrent batches on the same objects from counting a like twice.
+            ids = model.objects.select_for_update().filter(id__in=[pk for target, pk in actions if target == kind])
+            ids = list(ids.values_list('id', flat=True))
+            existing = set(like_model.objects.filter(user=user, **{f'{kind}_id__in': ids})
+                           .values_list(f'{kind}_id', flat=True))
+            # Only the difference is written and counted: likes of unliked objects and unlikes of liked ones.
+            liked = [pk for pk in ids if actions[(kind, pk)] == 'like' and pk not in existing]
+            unliked = [pk for pk in ids if actions[(kind, pk)] == 'unlike' and pk in existing]
+
+            like_model.objects.bulk_create([like_model(user=user, **{f'{kind}_id': pk}) for pk in liked],
+                                           ignore_conflicts=True)
+            like_model.objects.filter(user=user, **{f'{kind}_id__in': unliked}).delete()
+            bump_many(model, 'likes_count', {**{pk: 1 for pk in liked}, **{pk: -1 for pk in unliked}})
+            counts[kind] = dict(model.objects.filter(id__in=ids).values_list('id', 'likes_count'))
+
+        # Bulk inserts send no post_save signals, so invalidate the cached posts and profiles here.
+        post_ids = set(counts['post']) | set(Comment.objects.filter(id__in=counts['comment'])
+                                             .values_list('post_id', flat=True))
+        for post_id, author_id in Post.objects.filter(id__in=post_ids).values_list('id', 'author_id'):
+            post_cache.invalidate(post_id)
+            profile_cache.invalidate(author_id)
+
+    results = []
+    for operation in operations:
+        kind, pk = operation['type'], operation['id']
+        if pk not in counts[kind]:
+            results.append({**operation, 'status': 'not_found'})
+        else:
+            results.append({**operation, 'status': 'ok', 'liked': actions[(kind, pk)] == 'like',
+                            'likes': counts[kind][pk]})
+    return results
+
+
+def add_comment(comment):
+    """Count a freshly created comment on its post and, for replies, on the parent comment."""
+    bump(Post, comment.post_id, comments_count=1)
+    if comment.parent_id:
+        bump(Comment, comment.parent_id, comments_count=1)
+
+
+def delete_comment(comment):
+    """Delete a comment together with its replies and take all of them off the post's counter."""
+    with transaction.atomic():
+        removed, level = 1, [comment.id]
+        while level:
+            level = list(Comment.objects.filter(parent__in=level).values_list('id', flat=True))
+            removed += len(level)
+
+        comment.delete()
+        bump(Post, comment.post_id, comments_count=-removed)
+        if comment.parent_id:
+            bump(Comment, comment.parent_id, comments_count=-1)
+
+
+def remove_user(user):
+    """
+    Take `user`'s follows, likes and comments (with the replies deleted along with them) off the counters of the
+    profiles, posts and comments they were counted on. Call it in the transaction that deletes the user, as the
+    cascade deletes those rows without touching any counter.
+    """
+    bump_many(Profile, 'followers_count', {pk: -1 for pk in Follow.objects.filter(follower=user)
+                                           .values_list('following_id', flat=True)}, key='user_id')
+    bump_many(Profile, 'following_count', {pk: -1 for pk in Follow.objects.filter(following=user)
+                                           .values_list('follower_id', flat=True)}, key='user_id')
+    for kind, (model, like_model) in LIKE_TARGETS.items():
+        liked = like_model.objects.filter(user=user).values_list(f'{kind}_id', flat=True)
+        bump_many(model, 'likes_count', {pk: -1 for pk in liked.iterator()})
+
+    # Comment id -> (post id, parent id) of the user's comments and every reply below them.
+    removed, level = {}, Comment.objects.filter(author=user)
+    while True:
+        rows = {pk: (post_id, parent_id) for pk, post_id, parent_id in level.values_list('id', 'post_id', 'parent_id')
+                if pk not in removed}
+        if not rows:
+            break
+        removed.update(rows)
+        level = Comment.objects.filter(parent__in=list(rows))
+
+    bump_many(Post, 'comments_count', {pk: -count for pk, count in
+                                       Counter(post_id for post_id, _ in removed.values()).items()})
+    bump_many(Comment, 'comments_count', {pk: -count for pk, count in Counter(
+        parent_id for _, parent_id in removed.values() if parent_id and parent_id not in removed).items()})
+
+
+def _count(queryset, group_by):
+    return Coalesce(Subquery(queryset.values(group_by).annotate(c=Count('*')).values('c')), Value(0))
+
+
+def rebuild_post_counters():
+    likes = PostLike.objects.filter(post=OuterRef('pk'))
+    comments = Comment.objects.filter(post=OuterRef('pk'))
+    return Post.objects.update(likes_count=_count(likes, 'post'), comments_count=_count(comments, 'post'))
+
+
+def rebuild_comment_counters():
+    likes = CommentLike.objects.filter(comment=OuterRef('pk'))
+    replies = Comment.objects.filter(parent=OuterRef('pk'))
+    return Comment.objects.update(likes_count=_count(likes, 'comment'), comments_count=_count(replies, 'parent'))
+
+
+def rebuild_profile_counters(user_ids=None):
+    followers = Follow.objects.filter(following=OuterRef('user'))
+    following = Follow.objects.filter(follower=OuterRef('user'))
+    profiles = Profile.objects.all() if user_ids is None else Profile.objects.filter(user_id__in=user_ids)
+    return profiles.update(followers_count=_count(followers, 'following'),
+                           following_count=_count(following, 'follower'))
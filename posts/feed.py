@@ -0,0 +1,103 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import F, Max, Window
+from django.db.models.functions import RowNumber
+
+from users.models import Follow, Profile
+from .models import Post, TimelineEntry
+
+# Authors with at least this many followers are not fanned out on write; followers pull their posts on read.
+FANOUT_MAX_FOLLOWERS = getattr(settings, 'FEED_FANOUT_MAX_FOLLOWERS', 10000)
+# How many recent posts of an author are copied into a timeline when it starts following them.
+BACKFILL_POSTS = getattr(settings, 'FEED_BACKFILL_POSTS', 50)
+BATCH_SIZE = 1000
+
+
+def is_celebrity(user_id):
+    return Profile.objects.filter(user_id=user_id, followers_count__gte=FANOUT_MAX_FOLLOWERS).exists()
+
+
+def _entries(user_id, posts):
+    return [TimelineEntry(user_id=user_id, post_id=post.id, author_id=post.author_id, created_at=post.created_at)
+            for post in posts]
+
+
+def fan_out(post):
+    """Copy a new post into the timeline of every follower of its author."""
+    if is_celebrity(post.author_id):
+        return
+
+    follower_ids = Follow.objects.filter(following_id=post.author_id).values_list('follower_id', flat=True)
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=BATCH_SIZE):
+        batch.extend(_entries(follower_id, [post]))
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill(follower_id, author_id):
+    """Give a new follower the author's most recent posts."""
+    posts = Post.objects.filter(author_id=author_id).order_by('-created_at', '-id')[:BACKFILL_POSTS]
+    TimelineEntry.objects.bulk_create(_entries(follower_id, posts), ignore_conflicts=True)
+
+
+def backfill_many(edges):
+    """backfill() for many (follower_id, author_id) pairs, with one query for the posts of all the authors."""
+    followers = defaultdict(list)
+    for follower_id, author_id in edges:
+        followers[author_id].append(follower_id)
+
+    rank = Window(RowNumber(), partition_by=F('author_id'), order_by=[F('created_at').desc(), F('id').desc()])
+    posts = Post.objects.filter(author_id__in=followers).annotate(rank=rank).filter(rank__lte=BACKFILL_POSTS)
+    batch = []
+    for post in posts.iterator(chunk_size=BATCH_SIZE):
+        for follower_id in followers[post.author_id]:
+            batch.extend(_entries(follower_id, [post]))
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def remove(follower_id, author_id):
+    TimelineEntry.objects.filter(user_id=follower_id, author_id=author_id).delete()
+
+
+def pull_celebrity_posts(user):
+    """Fan-out-on-read half of the feed: copy new posts of followed celebrities into the user's timeline."""
+    celebrities = Follow.objects.filter(
+        follower=user, following__profile__followers_count__gte=FANOUT_MAX_FOLLOWERS).values('following_id')
+    posts = Post.objects.filter(author__in=celebrities)
+    latest = TimelineEntry.objects.filter(user=user, author__in=celebrities).aggregate(latest=Max('created_at'))
+    if latest['latest']:
+        # Every post since the last pull, oldest first, however many there are. Posts at the same instant
+        # as the latest entry may not be in yet; the ones that are are skipped as conflicts.
+        posts = posts.filter(created_at__gte=latest['latest']).order_by('created_at', 'id')
+    else:
+        posts = posts.order_by('-created_at', '-id')[:BACKFILL_POSTS]
+
+    batch = []
+    for post in posts.iterator(chunk_size=BATCH_SIZE):
+        batch.extend(_entries(user.id, [post]))
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def home_feed(user, queryset=None):
+    """Posts in the user's timeline, annotated with `feed_at` so they can be paged off the timeline index."""
+    pull_celebrity_posts(user)
+    queryset = Post.objects.all() if queryset is None else queryset
+    return queryset.filter(timeline_entries__user=user).annotate(feed_at=F('timeline_entries__created_at'))
+
+
+def rebuild():
+    """Recreate every timeline from the follow graph."""
+    TimelineEntry.objects.all().delete()
+    for follower_id, author_id in Follow.objects.values_list('follower_id', 'following_id').iterator(
+            chunk_size=BATCH_SIZE):
+        backfill(follower_id, author_id)
@@ -0,0 +1,214 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from SimpleSocialApp.cache import post_cache, profile_cache
+from .counters import LIKE_TARGETS, bump_many, toggle_like
+from .models import Post, Comment
+
+logger = logging.getLogger(__name__)
+
+
+def enabled():
+    return getattr(settings, 'LIKE_WRITE_BEHIND', False)
+
+
+class LikeBuffer:
+    """
+    Write-behind buffer for likes, used when LIKE_WRITE_BEHIND is on. A like or unlike only records the new
+    state of its (kind, object, user) in memory; a background thread writes whatever changed every
+    LIKE_FLUSH_SECONDS, with one bulk insert, one delete and one counter update per object and delta, however
+    many times each like was toggled meanwhile. A hot post liked a thousand times in that window costs a
+    handful of statements instead of a thousand inserts and counter updates.
+
+    The buffer is per process: its likes are invisible to other processes until they're flushed, and lost if
+    the process dies first. The acting user's own likes are overlaid on what they read (see `overlay`).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (kind, object id, user id) -> (liked in the database, liked now)
+        self.pending = {}
+        # Taken out of `pending` by a flush that hasn't committed yet.
+        self.flushing = {}
+        self.thread = None
+
+    def toggle(self, user, obj):
+        """Like `obj` (a Post or Comment) for `user`, or unlike it if it is liked. Returns True if it is now liked."""
+        key = (obj._meta.model_name, obj.pk, user.pk)
+        while True:
+            with self.lock:
+                state = self.state(key)
+            stored = state[0] if state else obj.likes.filter(user=user).exists()
+            with self.lock:
+                # Another toggle of the same like, or a flush, got in while the database was read: start over.
+                if self.state(key) != state:
+                    continue
+                liked = not (state[1] if state else stored)
+                self.pending[key] = (stored, liked)
+                full = len(self.pending) >= getattr(settings, 'LIKE_BUFFER_MAX', 10000)
+                break
+        if full:
+            # Past the limit the request writes the buffer itself, rather than letting it grow without bound.
+            self.flush()
+        else:
+            self.start()
+        return liked
+
+    def state(self, key):
+        """The buffered (liked in the database, liked now) of `key`, or None. Call it holding the lock."""
+        state = self.pending.get(key)
+        if state is None and key in self.flushing:
+            # What the flush in flight writes is what the database holds once it commits.
+            state = (self.flushing[key][1],) * 2
+        return state
+
+    def own(self, user):
+        """The buffered likes of `user`: (kind, object id) -> (liked now, change to the stored like count)."""
+        if not user.is_authenticated:
+            return {}
+        with self.lock:
+            states = {**self.flushing, **self.pending}
+        return {(kind, pk): (liked, liked - stored)
+                for (kind, pk, user_id), (stored, liked) in states.items() if user_id == user.pk}
+
+    def overlay(self, user, kind, items):
+        """Serialized posts or comments with the like flag and count of `user`'s buffered likes applied."""
+        own = self.own(user) if enabled() else {}
+        if not own:
+            return items
+        return [self.apply(item, own.get((kind, item['id']))) for item in items]
+
+    def overlay_tree(self, user, kind, items, children='replies'):
+        """overlay() for nested items, such as comments with their replies under `children`."""
+        own = self.own(user) if enabled() else {}
+        if not own:
+            return items
+
+        def apply(items):
+            return [{**self.apply(item, own.get((kind, item['id']))), children: apply(item[children])}
+                    for item in items]
+        return apply(items)
+
+    @staticmethod
+    def apply(item, state):
+        if state is None:
+            return item
+        liked, delta = state
+        return {**item, 'liked_by_user': liked, 'likes_count': max(item['likes_count'] + delta, 0)}
+
+    def start(self):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name='like-buffer', daemon=True)
+                    self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(getattr(settings, 'LIKE_FLUSH_SECONDS', 0.25))
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception:
+                logger.exception('Could not flush buffered likes')
+
+    def flush(self):
+        """Write the buffered changes. Returns the number of likes created or deleted."""
+        with self.lock:
+            if not self.pending:
+                return 0
+            batch, self.pending = self.pending, {}
+            self.flushing.update(batch)
+
+        try:
+            written = self.write(batch)
+        except Exception:
+            with self.lock:
+                # Put the batch back under any newer changes, to be retried by the next flush. Those assumed
+                # the batch would be written, so they keep their liked state but the batch's stored one.
+                self.pending = {**batch, **{key: (batch[key][0], liked) if key in batch else (stored, liked)
+                                            for key, (stored, liked) in self.pending.items()}}
+            raise
+        finally:
+            with self.lock:
+                for key in batch:
+                    self.flushing.pop(key, None)
+        return written
+
+    @staticmethod
+    def write(batch):
+        changes = {key: liked for key, (stored, liked) in batch.items() if stored != liked}
+        written = 0
+        with transaction.atomic():
+            post_ids = set()
+            for kind, (model, like_model) in LIKE_TARGETS.items():
+                # Locking the targets keeps flushes of other processes from counting the same like twice, and
+                # likes of objects deleted meanwhile are dropped instead of failing the whole batch.
+                ids = {pk for target, pk, _ in changes if target == kind}
+                ids = set(model.objects.select_for_update().filter(id__in=ids).values_list('id', flat=True))
+                likes, unlikes = defaultdict(set), defaultdict(set)
+                for (target, pk, user_id), liked in changes.items():
+                    if target == kind and pk in ids:
+                        (likes if liked else unlikes)[pk].add(user_id)
+
+                # Counters move by the rows actually written, which differ from the buffered changes when
+                # another process wrote the same like first.
+                existing = set(like_model.objects.filter(**{f'{kind}_id__in': list(likes)})
+                               .filter(user_id__in={user_id for user_ids in likes.values() for user_id in user_ids})
+                               .values_list(f'{kind}_id', 'user_id'))
+                new = [(pk, user_id) for pk, user_ids in likes.items() for user_id in user_ids
+                       if (pk, user_id) not in existing]
+                like_model.objects.bulk_create([like_model(user_id=user_id, **{f'{kind}_id': pk})
+                                                for pk, user_id in new], ignore_conflicts=True)
+                deltas = Counter(pk for pk, _ in new)
+                written += len(new)
+                for pk, user_ids in unlikes.items():
+                    deleted, _ = like_model.objects.filter(user_id__in=user_ids, **{f'{kind}_id': pk}).delete()
+                    deltas[pk] -= deleted
+                    written += deleted
+                bump_many(model, 'likes_count', deltas)
+
+                touched = likes.keys() | unlikes.keys()
+                post_ids |= touched if kind == 'post' else set(
+                    Comment.objects.filter(id__in=touched).values_list('post_id', flat=True))
+
+            # Bulk writes send no signals, so invalidate the cached posts and profiles here.
+            for post_id, author_id in Post.objects.filter(id__in=post_ids).values_list('id', 'author_id'):
+                post_cache.invalidate(post_id)
+                profile_cache.invalidate(author_id)
+        return written
+
+
+like_buffer = LikeBuffer()
+# Whatever is still buffered when the process exits normally.
+atexit.register(lambda: like_buffer.flush() if like_buffer.pending else None)
+
+
+def toggle(user, obj):
+    """
+    Like or unlike `obj` for `user`, through the buffer when write-behind is on. Returns whether it is now
+    liked and its like count as `user` sees it.
+    """
+    if not enabled():
+        liked = toggle_like(user, obj)
+        obj.refresh_from_db(fields=['likes_count'])
+        return liked, obj.likes_count
+
+    # No writes and no counter read: the stored count of the object just loaded plus the user's own change.
+    liked = like_buffer.toggle(user, obj)
+    [item] = like_buffer.overlay(user, obj._meta.model_name, [{'id': obj.pk, 'likes_count': obj.likes_count}])
+    return liked, item['likes_count']
+
+
+class BufferedLikesMixin:
+    """List view mixin that shows the requesting user the likes they made that are still buffered."""
+    like_kind = 'post'
+
+    def get_paginated_response(self, data):
+        return super().get_paginated_response(like_buffer.overlay(self.request.user, self.like_kind, data))
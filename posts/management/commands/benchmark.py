@@ -0,0 +1,73 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+
+from SimpleSocialApp import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway database with a synthetic social graph and report latency, query count and '
+            'peak memory of every API endpoint')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--follows', type=int, default=20, help='Followings per user')
+        parser.add_argument('--posts', type=int, default=5, help='Posts per user')
+        parser.add_argument('--comments', type=int, default=3, help='Comments per post')
+        parser.add_argument('--likes', type=int, default=5, help='Likes per post')
+        parser.add_argument('--iterations', type=int, default=20, help='Requests per endpoint')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the synthetic data')
+        parser.add_argument('--server', action='store_true',
+                            help='Also compare the sync (WSGI) and async (ASGI, needs uvicorn) read endpoints '
+                                 'on local servers')
+        parser.add_argument('--concurrency', type=int, default=20, help='Concurrent clients with --server')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Fail if the results regressed against this JSON file')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed latency/memory growth against the baseline (0.5 = 50%%)')
+
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            benchmark.seed(users=options['users'], follows=options['follows'], posts=options['posts'],
+                           comments=options['comments'], likes=options['likes'], random_seed=options['seed'])
+            results = benchmark.run(iterations=options['iterations'])
+            servers = None
+            if options['server']:
+                servers = benchmark.run_servers(iterations=options['iterations'] * 10,
+                                                concurrency=options['concurrency'])
+        except ImportError as error:
+            raise CommandError(f'{error.name} is required for --server')
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        self.stdout.write(f"{'endpoint':<24}{'status':>8}{'p50 ms':>10}{'p99 ms':>10}{'queries':>9}{'peak KB':>10}")
+        for name, result in results.items():
+            self.stdout.write(f"{name:<24}{result['status']:>8}{result['p50_ms']:>10}{result['p99_ms']:>10}"
+                              f"{result['queries']:>9}{result['peak_memory_kb']:>10}")
+
+        if servers:
+            self.stdout.write(f"\n{'server':<8}{'endpoint':<24}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}{'errors':>8}")
+            for kind, server_results in servers.items():
+                for name, result in server_results.items():
+                    self.stdout.write(f"{kind:<8}{name:<24}{result['p50_ms']:>10}{result['p99_ms']:>10}"
+                                      f"{result['requests_per_second']:>10}{result['errors']:>8}")
+
+        report = {'parameters': {key: options[key] for key in
+                                 ('users', 'follows', 'posts', 'comments', 'likes', 'iterations', 'seed')},
+                  'results': results}
+        if servers:
+            report['servers'] = servers
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+            regressions = benchmark.compare(baseline['results'], results, options['tolerance'])
+            if regressions:
+                raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from SimpleSocialApp.cache import post_cache, profile_cache, user_cache
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counters of the post detail and user profile response caches and of the user cache'
+
+    def handle(self, *args, **options):
+        for cache in (post_cache, profile_cache, user_cache):
+            stats = cache.stats()
+            total = stats['hits'] + stats['misses']
+            ratio = stats['hits'] / total if total else 0
+            self.stdout.write(f"{cache.namespace}: {stats['hits']} hits, {stats['misses']} misses ({ratio:.1%} hit rate)")
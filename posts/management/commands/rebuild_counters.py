@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import rebuild_post_counters, rebuild_comment_counters, rebuild_profile_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored like, comment and follow counters from the underlying rows'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            posts = rebuild_post_counters()
+            comments = rebuild_comment_counters()
+            profiles = rebuild_profile_counters()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt counters for {posts} posts, {comments} comments and {profiles} profiles'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import feed
+from posts.models import TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Recreate every home timeline from the follow graph'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            feed.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt timelines with {TimelineEntry.objects.count()} entries'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.trending import CHUNK_SIZE, update
+
+
+class Command(BaseCommand):
+    help = ('Count the likes and comments made since the last run into the trending scores and re-rank the '
+            'trending posts. Meant to run every minute or so, e.g. from cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Activity rows counted per transaction')
+
+    def handle(self, *args, **options):
+        counted = update(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            'Counted ' + ', '.join(f'{count} {source}s' for source, count in counted.items())))
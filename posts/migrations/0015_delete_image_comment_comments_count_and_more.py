@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:47
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset, group_by):
+    return Coalesce(Subquery(queryset.values(group_by).annotate(c=Count('*')).values('c')), Value(0))
+
+
+def fill_counters(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Like = apps.get_model('posts', 'Like')
+
+    post_type = ContentType.objects.filter(app_label='posts', model='post').first()
+    comment_type = ContentType.objects.filter(app_label='posts', model='comment').first()
+    Post.objects.update(
+        likes_count=_count(Like.objects.filter(content_type=post_type, object_id=OuterRef('pk')), 'object_id'),
+        comments_count=_count(Comment.objects.filter(post=OuterRef('pk')), 'post'),
+    )
+    Comment.objects.update(
+        likes_count=_count(Like.objects.filter(content_type=comment_type, object_id=OuterRef('pk')), 'object_id'),
+        comments_count=_count(Comment.objects.filter(parent=OuterRef('pk')), 'parent'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_remove_post_slug'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='Image',
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
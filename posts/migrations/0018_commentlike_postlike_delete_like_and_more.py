@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def move_likes(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Like = apps.get_model('posts', 'Like')
+
+    for model_name, target_field in (('post', 'post'), ('comment', 'comment')):
+        content_type = ContentType.objects.filter(app_label='posts', model=model_name).first()
+        if content_type is None:
+            continue
+
+        Target = apps.get_model('posts', model_name)
+        TypedLike = apps.get_model('posts', f'{model_name}like')
+        # Keep the original like times instead of stamping every row with the migration time.
+        TypedLike._meta.get_field('created_at').auto_now_add = False
+
+        # Likes of deleted objects were never cleaned up by the generic relation, so skip them.
+        likes = Like.objects.filter(content_type=content_type, object_id__in=Target.objects.values('id'))
+        batch = []
+        for like in likes.iterator(chunk_size=1000):
+            batch.append(TypedLike(user_id=like.user_id, created_at=like.created_at,
+                                   **{f'{target_field}_id': like.object_id}))
+            if len(batch) >= 1000:
+                TypedLike.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        TypedLike.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_timelineentry'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('comment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='likes', to='posts.comment')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comment_likes', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PostLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='likes', to='posts.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='post_likes', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='commentlike',
+            index=models.Index(fields=['user', '-created_at'], name='commentlike_user_created_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='commentlike',
+            unique_together={('comment', 'user')},
+        ),
+        migrations.AddIndex(
+            model_name='postlike',
+            index=models.Index(fields=['user', '-created_at'], name='postlike_user_created_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='postlike',
+            unique_together={('post', 'user')},
+        ),
+        migrations.RunPython(move_likes, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='Like',
+        ),
+    ]
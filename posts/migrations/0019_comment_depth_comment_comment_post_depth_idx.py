@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_depth(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    depth = 0
+    while Comment.objects.filter(parent__depth=depth).exclude(depth=depth + 1).update(depth=depth + 1):
+        depth += 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_commentlike_postlike_delete_like_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'depth', 'created_at', 'id'], name='comment_post_depth_idx'),
+        ),
+        migrations.RunPython(fill_depth, migrations.RunPython.noop),
+    ]
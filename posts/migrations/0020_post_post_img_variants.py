@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_comment_depth_comment_comment_post_depth_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='post_img_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
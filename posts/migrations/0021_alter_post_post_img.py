@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:17
+
+import mediastore.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_post_post_img_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='post_img',
+            field=models.ImageField(blank=True, null=True, storage=mediastore.storage.media_storage, upload_to='images/'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=32)),
+                ('user_id', models.BigIntegerField()),
+                ('target_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='trendinglike_created_idx')],
+                'unique_together': {('source', 'user_id', 'target_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+SOURCES = {'like': 'PostLike', 'comment': 'Comment', 'comment_like': 'CommentLike'}
+
+
+def fill_counted_until(apps, schema_editor):
+    # Counting resumes from the creation time of the last row counted by id.
+    TrendingCheckpoint = apps.get_model('posts', 'TrendingCheckpoint')
+    for checkpoint in TrendingCheckpoint.objects.filter(source__in=SOURCES):
+        model = apps.get_model('posts', SOURCES[checkpoint.source])
+        checkpoint.counted_until = (model.objects.filter(id__lte=checkpoint.last_id).order_by('-id')
+                                    .values_list('created_at', flat=True).first())
+        checkpoint.save(update_fields=['counted_until'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_trendinglike'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RenameModel(
+            old_name='TrendingLike',
+            new_name='TrendingEvent',
+        ),
+        migrations.RenameIndex(
+            model_name='trendingevent',
+            new_name='trendingevent_created_idx',
+            old_name='trendinglike_created_idx',
+        ),
+        migrations.AddField(
+            model_name='trendingcheckpoint',
+            name='counted_until',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(fill_counted_until, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='trendingcheckpoint',
+            name='last_id',
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['created_at', 'id'], name='comment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commentlike',
+            index=models.Index(fields=['created_at', 'id'], name='commentlike_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postlike',
+            index=models.Index(fields=['created_at', 'id'], name='postlike_created_idx'),
+        ),
+    ]
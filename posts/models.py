@@ -1,16 +1,42 @@
-from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.db.models import Exists, OuterRef, Value
 from django.contrib.auth.models import User
 
+from mediastore.storage import media_storage
+
+
+class PostQuerySet(models.QuerySet):
+    def with_stats(self, user=None):
+        """
+        Annotate every post with whether `user` liked it, so a whole page can be serialized
+        without running extra queries per post. Like and comment counts are stored on the post.
+        """
+        if user is None or not user.is_authenticated:
+            return self.annotate(is_liked=Value(False))
+
+        return self.annotate(is_liked=Exists(PostLike.objects.filter(user=user, post=OuterRef('pk'))))
+
 
 # Create your models here.
 class Post(models.Model):
     content = models.TextField()
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
-    post_img = models.ImageField(upload_to='images/', blank=True, null=True)
+    post_img = models.ImageField(upload_to='images/', storage=media_storage, blank=True, null=True)
+    # Resized WebP copies of `post_img`, see mediastore.pipeline. Empty while the upload is being processed.
+    post_img_variants = models.JSONField(default=dict, blank=True)
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='post_created_idx'),
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_created_idx'),
+        ]
+
     def __str__(self):
         return str(self.id) + f' - {self.content[:50]}'
 
@@ -20,18 +46,108 @@ class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='replies')
     author = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Nesting level (0 for top-level comments), so a whole thread can be cut at a depth in one query.
+    depth = models.PositiveSmallIntegerField(default=0)
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'parent', '-created_at', '-id'], name='comment_post_created_idx'),
+            models.Index(fields=['parent', '-created_at', '-id'], name='comment_parent_created_idx'),
+            models.Index(fields=['post', 'depth', 'created_at', 'id'], name='comment_post_depth_idx'),
+            models.Index(fields=['created_at', 'id'], name='comment_created_idx'),
+        ]
+
     def __str__(self):
         return str(self.id) + f' - {self.content[:50]}'
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.parent_id:
+            self.depth = self.parent.depth + 1
+        super().save(*args, **kwargs)
+
+
+class PostLike(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='post_likes')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='likes')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # (post, user) answers both "how many likes" and "did this user like it" from the index alone.
+        unique_together = (('post', 'user'),)
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='postlike_user_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='postlike_created_idx'),
+        ]
+
 
-class Like(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='liked_posts')
-    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
-    object_id = models.PositiveIntegerField()
+class CommentLike(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comment_likes')
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name='likes')
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = (('user', 'content_type', 'object_id'),)
+        unique_together = (('comment', 'user'),)
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='commentlike_user_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='commentlike_created_idx'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """A post materialized into one follower's home feed; `created_at` is copied from the post."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = (('user', 'post'),)
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='timeline_user_created_idx'),
+            models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ]
+
+
+class TrendingScore(models.Model):
+    """
+    A post's time-decayed activity score, kept in log space: log(sum of weight * e^(rate * t)) over the likes
+    and comments it got at times t. Ranking by it is ranking by the decayed score at any moment, so scores
+    only change when new activity is counted; see posts.trending.
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='trending_score')
+    log_score = models.FloatField()
+
+
+class TrendingPost(models.Model):
+    """The best scored posts, ranked from 1. Rewritten by every run of the trending job."""
+    rank = models.PositiveIntegerField(primary_key=True)
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, related_name='+')
+    log_score = models.FloatField()
+
+
+class TrendingCheckpoint(models.Model):
+    """The creation time of the newest row of each activity source (likes, comments) the trending job has counted."""
+    source = models.CharField(max_length=32, primary_key=True)
+    counted_until = models.DateTimeField(null=True)
+
+
+class TrendingEvent(models.Model):
+    """
+    A like or comment the trending job has counted, by who made it and on what, so that reading it again or
+    liking the same post or comment again after an unlike doesn't count twice. Kept for TRENDING_EVENT_MEMORY
+    seconds, past which an event weighs next to nothing.
+    """
+    source = models.CharField(max_length=32)
+    user_id = models.BigIntegerField()
+    target_id = models.BigIntegerField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = (('source', 'user_id', 'target_id'),)
+        indexes = [
+            models.Index(fields=['created_at'], name='trendingevent_created_idx'),
+        ]
@@ -1,64 +1,87 @@
-from django.contrib.contenttypes.models import ContentType
+from django.db import models
 from rest_framework import serializers
-from .models import Post, Comment, Like
+
+from mediastore.serializers import StagedImagesMixin, VariantImageField
+from .models import Post, Comment, PostLike, CommentLike
+
+
+class CommentListSerializer(serializers.ListSerializer):
+    """Finds out which of the listed comments the user liked with one query instead of one per comment."""
+
+    def to_representation(self, data):
+        comments = list(data.all() if isinstance(data, models.Manager) else data)
+        request = self.context.get('request')
+        if request is not None and request.user.is_authenticated:
+            checked = self.context.setdefault('checked_comment_ids', set())
+            liked = self.context.setdefault('liked_comment_ids', set())
+            unchecked = [comment.id for comment in comments if comment.id not in checked]
+            if unchecked:
+                liked.update(CommentLike.objects.filter(user=request.user, comment__in=unchecked)
+                             .values_list('comment_id', flat=True))
+                checked.update(unchecked)
+        return super().to_representation(comments)
 
 
 class CommentListCreateSerializer(serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
-    likes_count = serializers.SerializerMethodField()
     liked_by_user = serializers.SerializerMethodField()
     parent = serializers.PrimaryKeyRelatedField(queryset=Comment.objects.all(), required=False)
 
     class Meta:
         model = Comment
-        fields = ['id', 'author', 'post', 'content', 'likes_count', 'liked_by_user', 'parent']
-        read_only_fields = ['id', 'author', 'post', 'likes_count', 'liked_by_user', 'parent']
+        fields = ['id', 'author', 'post', 'content', 'likes_count', 'liked_by_user', 'comments_count', 'parent']
+        read_only_fields = ['id', 'author', 'post', 'likes_count', 'liked_by_user', 'comments_count', 'parent']
         search_fields = ['content', 'author__username']
+        list_serializer_class = CommentListSerializer
 
     def create(self, validated_data):
         return Comment.objects.create(**validated_data)
 
-    def get_likes_count(self, obj):
-        return Like.objects.filter(content_type=ContentType.objects.get_for_model(Comment), object_id=obj.id).count()
-
     def get_liked_by_user(self, obj):
         user = self.context.get('request').user
         if not user.is_authenticated:
             return False
 
-        return Like.objects.filter(user=user, content_type=ContentType.objects.get_for_model(Comment),
-                                   object_id=obj.id).exists()
+        if obj.id in self.context.get('checked_comment_ids', ()):
+            return obj.id in self.context['liked_comment_ids']
+        return obj.likes.filter(user=user).exists()
+
+
+class CommentTreeSerializer(CommentListCreateSerializer):
+    """A comment with its replies nested below it, as assembled in memory by `CommentTreeView`."""
+    replies = serializers.SerializerMethodField()
+
+    class Meta(CommentListCreateSerializer.Meta):
+        fields = CommentListCreateSerializer.Meta.fields + ['depth', 'created_at', 'replies']
+        read_only_fields = fields
+
+    def get_replies(self, obj):
+        return CommentTreeSerializer(obj.tree_replies, many=True, context=self.context).data
 
 
 class CommentRetrieveUpdateDestroySerializer(serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
-    likes_count = serializers.SerializerMethodField()
     liked_by_user = serializers.SerializerMethodField()
     parent = serializers.PrimaryKeyRelatedField(queryset=Comment.objects.all(), required=False)
 
     class Meta:
         model = Comment
-        fields = ['id', 'author', 'post', 'content', 'likes_count', 'liked_by_user', 'parent']
-        read_only_fields = ['id', 'author', 'post', 'likes_count', 'liked_by_user']
-
-    def get_likes_count(self, obj):
-        return Like.objects.filter(content_type=ContentType.objects.get_for_model(Comment), object_id=obj.id).count()
+        fields = ['id', 'author', 'post', 'content', 'likes_count', 'liked_by_user', 'comments_count', 'parent']
+        read_only_fields = ['id', 'author', 'post', 'likes_count', 'liked_by_user', 'comments_count']
 
     def get_liked_by_user(self, obj):
         user = self.context.get('request').user
         if not user.is_authenticated:
             return False
 
-        return Like.objects.filter(user=user, content_type=ContentType.objects.get_for_model(Comment),
-                                   object_id=obj.id).exists()
+        return obj.likes.filter(user=user).exists()
 
 
-class PostUpdateSerializer(serializers.ModelSerializer):
+class PostUpdateSerializer(StagedImagesMixin, serializers.ModelSerializer):
     comments = CommentListCreateSerializer(many=True, read_only=True)
     author = serializers.ReadOnlyField(source='author.username')
-    likes_count = serializers.SerializerMethodField()
+    post_img = VariantImageField(required=False, allow_null=True)
     liked_by_user = serializers.SerializerMethodField()
-    comments_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
@@ -67,26 +90,18 @@ class PostUpdateSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'author', 'created_at', 'updated_at', 'likes_count', 'liked_by_user', 'comments_count',
                             'comments']
 
-    def get_likes_count(self, obj):
-        return Like.objects.filter(content_type=ContentType.objects.get_for_model(Post), object_id=obj.id).count()
-
     def get_liked_by_user(self, obj):
         user = self.context.get('request').user
         if not user.is_authenticated:
             return False
 
-        return Like.objects.filter(user=user, content_type=ContentType.objects.get_for_model(Post),
-                                   object_id=obj.id).exists()
+        return obj.likes.filter(user=user).exists()
 
-    def get_comments_count(self, obj):
-        return Comment.objects.filter(post=obj).count()
 
-
-class PostListCreateSerializer(serializers.ModelSerializer):
+class PostListCreateSerializer(StagedImagesMixin, serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
-    likes_count = serializers.SerializerMethodField()
+    post_img = VariantImageField(required=False, allow_null=True)
     liked_by_user = serializers.SerializerMethodField()
-    comments_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
@@ -99,25 +114,41 @@ class PostListCreateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         return Post.objects.create(**validated_data)
 
-    def get_likes_count(self, obj):
-        return Like.objects.filter(content_type=ContentType.objects.get_for_model(Post), object_id=obj.id).count()
-
     def get_liked_by_user(self, obj):
+        # Posts coming from `Post.objects.with_stats()` are already annotated.
+        if hasattr(obj, 'is_liked'):
+            return obj.is_liked
+
         user = self.context.get('request').user
         if not user.is_authenticated:
             return False
 
-        return Like.objects.filter(user=user, content_type=ContentType.objects.get_for_model(Post),
-                                   object_id=obj.id).exists()
+        return obj.likes.filter(user=user).exists()
 
-    def get_comments_count(self, obj):
-        return Comment.objects.filter(post=obj).count()
 
+class PostLikeSerializer(serializers.ModelSerializer):
+    user = serializers.ReadOnlyField(source='user.username')
+
+    class Meta:
+        model = PostLike
+        fields = ['id', 'user', 'post', 'created_at']
+        read_only_fields = ['id', 'user', 'post', 'created_at']
 
-class LikeSerializer(serializers.ModelSerializer):
+
+class CommentLikeSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.username')
 
     class Meta:
-        model = Like
-        fields = ['id', 'user', 'content_type', 'object_id', 'created_at']
-        read_only_fields = ['id', 'user', 'content_type', 'object_id', 'created_at']
+        model = CommentLike
+        fields = ['id', 'user', 'comment', 'created_at']
+        read_only_fields = ['id', 'user', 'comment', 'created_at']
+
+
+class LikeOperationSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=['post', 'comment'])
+    id = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=['like', 'unlike'])
+
+
+class LikeBatchSerializer(serializers.Serializer):
+    operations = LikeOperationSerializer(many=True, allow_empty=False, max_length=500)
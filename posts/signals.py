@@ -0,0 +1,52 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from SimpleSocialApp.cache import post_cache, profile_cache
+from users.models import Follow
+from . import feed
+from .models import Post, Comment, PostLike, CommentLike
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: feed.fan_out(instance))
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        feed.backfill(instance.follower_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clean_timeline(sender, instance, **kwargs):
+    feed.remove(instance.follower_id, instance.following_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    post_cache.invalidate(instance.id)
+    profile_cache.invalidate(instance.author_id)
+
+
+@receiver(post_save, sender=PostLike)
+@receiver(post_delete, sender=PostLike)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_liked_or_commented_post(sender, instance, **kwargs):
+    post_cache.invalidate(instance.post_id)
+    # Profiles embed their posts along with the like and comment counts.
+    author_id = Post.objects.filter(id=instance.post_id).values_list('author_id', flat=True).first()
+    if author_id:
+        profile_cache.invalidate(author_id)
+
+
+@receiver(post_save, sender=CommentLike)
+@receiver(post_delete, sender=CommentLike)
+def invalidate_comment_post(sender, instance, **kwargs):
+    post_id = Comment.objects.filter(id=instance.comment_id).values_list('post_id', flat=True).first()
+    if post_id:
+        post_cache.invalidate(post_id)
@@ -1,13 +1,36 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models.query import QuerySet
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from SimpleSocialApp import benchmark
+from SimpleSocialApp.async_views import AsyncReadView
+from SimpleSocialApp.cache import post_cache
+from SimpleSocialApp.middleware import RequestMetrics
+from SimpleSocialApp.pagination import KeysetPagination
 
-from .models import Post, Comment
+from users.models import Follow, Profile
+from .likebuffer import like_buffer
+from .models import (Post, Comment, PostLike, CommentLike, TimelineEntry, TrendingScore, TrendingCheckpoint,
+                     TrendingEvent)
 
 
 # Create your tests here.
 class TestSetup(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = User.objects.create(username='testUser', password='testPass')
         self.post = Post.objects.create(content='testContent', author=self.user)
@@ -19,7 +42,7 @@ class PostTestCase(TestSetup):
         self.client.force_authenticate(user=self.user)
         response = self.client.get('/posts/')
         self.assertEqual(response.status_code, 200, 'Status code is not 200')
-        self.assertEqual(response.data[0]['content'], 'testContent', 'Content is not testContent')
+        self.assertEqual(response.data['results'][0]['content'], 'testContent', 'Content is not testContent')
         self.client.force_authenticate(user=None)
 
     def test_post_create(self):
@@ -46,14 +69,14 @@ class PostTestCase(TestSetup):
         self.client.force_authenticate(user=self.user)
         response = self.client.get('/posts/?search=testContent')
         self.assertEqual(response.status_code, 200, 'Status code is not 200')
-        self.assertEqual(response.data[0]['content'], 'testContent', 'Content is not testContent')
+        self.assertEqual(response.data['results'][0]['content'], 'testContent', 'Content is not testContent')
         self.client.force_authenticate(user=None)
 
     def test_post_search_no_result(self):
         self.client.force_authenticate(user=self.user)
         response = self.client.get('/posts/?search=noResult')
         self.assertEqual(response.status_code, 200, 'Status code is not 200')
-        self.assertEqual(len(response.data), 0, 'Response is not empty')
+        self.assertEqual(len(response.data['results']), 0, 'Response is not empty')
         self.client.force_authenticate(user=None)
 
     def test_post_create_unauthenticated(self):
@@ -68,12 +91,168 @@ class PostTestCase(TestSetup):
         self.client.force_authenticate(user=None)
 
 
+class PostListQueryCountTestCase(TestSetup):
+    def get_posts_query_count(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/posts/?page_size=100')
+        self.assertEqual(response.status_code, 200, 'Status code is not 200')
+        return len(context.captured_queries)
+
+    def test_post_list_query_count_is_constant(self):
+        self.client.force_authenticate(user=self.user)
+        single_post_queries = self.get_posts_query_count()
+
+        posts = Post.objects.bulk_create(Post(content=f'content {i}', author=self.user) for i in range(499))
+        PostLike.objects.bulk_create(PostLike(user=self.user, post=post) for post in posts)
+        Comment.objects.bulk_create(Comment(content='comment', post=post, author=self.user) for post in posts)
+
+        self.assertEqual(self.get_posts_query_count(), single_post_queries, 'Query count depends on the page size')
+        self.client.force_authenticate(user=None)
+
+    def test_post_list_counts(self):
+        post = Post.objects.create(content='countedContent', author=self.user)
+        self.client.force_authenticate(user=self.user)
+        self.client.post(f'/posts/{post.id}/like/')
+        self.client.post(f'/posts/{post.id}/comments/', {'content': 'newComment'})
+        response = self.client.get('/posts/?search=countedContent')
+        self.assertEqual(response.data['results'][0]['likes_count'], 1, 'Likes count is not 1')
+        self.assertEqual(response.data['results'][0]['comments_count'], 1, 'Comments count is not 1')
+        self.assertTrue(response.data['results'][0]['liked_by_user'], 'Post is not liked by user')
+        self.client.force_authenticate(user=None)
+
+
+class RequestMetricsTestCase(TestSetup):
+    def test_server_timing_header(self):
+        response = self.client.get('/posts/')
+        self.assertEqual(response.status_code, 200, 'Status code is not 200')
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries", serializer;dur=[\d.]+, '
+                                                    r'total;dur=[\d.]+', 'Server-Timing header is malformed')
+
+    def test_request_log_line(self):
+        with self.assertLogs('SimpleSocialApp.requests', 'INFO') as logs:
+            self.client.get('/posts/')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['path'], '/posts/', 'Logged path is wrong')
+        self.assertGreater(line['queries'], 0, 'Queries are not counted')
+        self.assertNotIn('repeated_queries', line, 'Post list is flagged as N+1')
+
+    def test_repeated_queries(self):
+        posts = [Post.objects.create(content=f'content {i}', author=self.user) for i in range(3)]
+        metrics = RequestMetrics()
+        with metrics.capture():
+            for post in posts:
+                Post.objects.filter(id=post.id).exists()
+            Post.objects.filter(id__in=[post.id for post in posts]).exists()
+            Post.objects.filter(id__in=[self.post.id]).exists()
+        self.assertEqual(sorted(metrics.repeated_queries(1).values()), [2, 3], 'Repeated queries are not grouped')
+        self.assertEqual(metrics.repeated_queries(3), {}, 'Queries under the threshold are flagged')
+
+
+class AsyncViewTestCase(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create(username='author')
+        Follow.objects.create(follower=self.user, following=self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(content='followed', author=self.author)
+        self.authorization = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        self.client.credentials(HTTP_AUTHORIZATION=self.authorization)
+
+    def request_async(self, method, url, data=None, **headers):
+        # The ASGI application routes requests through ASGI_ROOT_URLCONF.
+        with self.settings(ROOT_URLCONF='SimpleSocialApp.asgi_urls'):
+            response = async_to_sync(getattr(AsyncClient(), method))(
+                url, data, headers={'Authorization': self.authorization, **headers})
+            self.assertTrue(issubclass(response.resolver_match.func.view_class, AsyncReadView), 'View is not async')
+            return response
+
+    def get_async(self, url, **headers):
+        return self.request_async('get', url, **headers)
+
+    def assertSameResponse(self, url):
+        sync_response = self.client.get(url)
+        cache.clear()
+        async_response = self.get_async(url)
+        self.assertEqual(async_response.status_code, sync_response.status_code, 'Status codes differ')
+        self.assertEqual(async_response.json(), json.loads(sync_response.content), f'{url} responses differ')
+        return async_response
+
+    def test_async_feed(self):
+        response = self.assertSameResponse('/posts/')
+        self.assertEqual([post['content'] for post in response.json()['results']], ['followed'], 'Feed is wrong')
+
+    def test_async_post_list_anonymous(self):
+        self.client.credentials()
+        sync_response = self.client.get('/posts/?page_size=1')
+        with self.settings(ROOT_URLCONF='SimpleSocialApp.asgi_urls'):
+            async_response = async_to_sync(AsyncClient().get)('/posts/?page_size=1')
+        self.assertEqual(async_response.json(), json.loads(sync_response.content), 'Responses differ')
+
+    def test_async_post_detail(self):
+        self.client.post(f'/posts/{self.post.id}/comments/{self.comment.id}/like/')
+        response = self.assertSameResponse(f'/posts/{self.post.id}/')
+        self.assertEqual(response['X-Cache'], 'MISS', 'First request was not a miss')
+        self.assertTrue(response.json()['comments'][0]['liked_by_user'], 'Comment like flag is missing')
+        self.assertEqual(self.get_async(f'/posts/{self.post.id}/')['X-Cache'], 'HIT', 'Second request was not a hit')
+
+    def test_async_comments(self):
+        self.assertSameResponse(f'/posts/{self.post.id}/comments/')
+
+    def test_async_not_found(self):
+        response = self.assertSameResponse('/posts/0/')
+        self.assertEqual(response.status_code, 404, 'Status code is not 404')
+
+    def test_async_invalid_token(self):
+        response = self.get_async('/posts/', Authorization='Bearer invalid')
+        self.assertEqual(response.status_code, 401, 'Status code is not 401')
+
+    def test_async_search_and_writes_use_sync_views(self):
+        self.assertSameResponse('/posts/?search=testContent')
+        response = self.request_async('post', '/posts/', {'content': 'async'})
+        self.assertEqual(response.status_code, 201, 'Status code is not 201')
+        self.assertTrue(Post.objects.filter(content='async', author=self.user).exists(), 'Post was not created')
+
+
+class PaginationTestCase(TestSetup):
+    def setUp(self):
+        super().setUp()
+        Post.objects.bulk_create(Post(content=f'content {i}', author=self.user) for i in range(24))
+        # Same timestamp everywhere, so only the id can break the ties between pages.
+        Post.objects.update(created_at=self.post.created_at)
+
+    def test_post_pages(self):
+        response = self.client.get('/posts/?page_size=10')
+        ids = [post['id'] for post in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids += [post['id'] for post in response.data['results']]
+
+        self.assertEqual(ids, sorted(Post.objects.values_list('id', flat=True), reverse=True), 'Pages are not in order')
+
+    def test_page_size_limit(self):
+        response = self.client.get('/posts/?page_size=1000')
+        self.assertEqual(len(response.data['results']), 25, 'Page is not complete')
+        self.assertIsNone(response.data['next'], 'Next page is not empty')
+        with mock.patch.object(KeysetPagination, 'max_page_size', 10):
+            response = self.client.get('/posts/?page_size=1000')
+        self.assertEqual(len(response.data['results']), 10, 'Page is larger than the maximum')
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/posts/?cursor=notACursor')
+        self.assertEqual(response.status_code, 404, 'Status code is not 404')
+
+        for position in (['abc', 1], [{'a': 1}, 1], ['2024-01-01T00:00:00', 'abc'], [None, 1]):
+            cursor = KeysetPagination.encode_cursor(position)
+            response = self.client.get(f'/posts/?cursor={cursor}')
+            self.assertEqual(response.status_code, 404, f'Status code is not 404 for {position}')
+
+
 class CommentTestCase(TestSetup):
     def test_comment(self):
         self.client.force_authenticate(user=self.user)
         response = self.client.get(f'/posts/{self.post.id}/comments/')
         self.assertEqual(response.status_code, 200, 'Status code is not 200')
-        self.assertEqual(response.data[0]['content'], 'testComment', 'Content is not testComment')
+        self.assertEqual(response.data['results'][0]['content'], 'testComment', 'Content is not testComment')
         self.client.force_authenticate(user=None)
 
     def test_comment_create(self):
@@ -100,14 +279,14 @@ class CommentTestCase(TestSetup):
         self.client.force_authenticate(user=self.user)
         response = self.client.get(f'/posts/{self.post.id}/comments/?search=testComment')
         self.assertEqual(response.status_code, 200, 'Status code is not 200')
-        self.assertEqual(response.data[0]['content'], 'testComment', 'Content is not testComment')
+        self.assertEqual(response.data['results'][0]['content'], 'testComment', 'Content is not testComment')
         self.client.force_authenticate(user=None)
 
     def test_comment_search_no_result(self):
         self.client.force_authenticate(user=self.user)
         response = self.client.get(f'/posts/{self.post.id}/comments/?search=noResult')
         self.assertEqual(response.status_code, 200, 'Status code is not 200')
-        self.assertEqual(len(response.data), 0, 'Response is not empty')
+        self.assertEqual(len(response.data['results']), 0, 'Response is not empty')
         self.client.force_authenticate(user=None)
 
     def test_comment_create_unauthenticated(self):
@@ -122,6 +301,86 @@ class CommentTestCase(TestSetup):
         self.client.force_authenticate(user=None)
 
 
+class PostCacheTestCase(TestSetup):
+    def test_post_cached(self):
+        response = self.client.get(f'/posts/{self.post.id}/')
+        self.assertEqual(response['X-Cache'], 'MISS', 'First request was not a miss')
+        response = self.client.get(f'/posts/{self.post.id}/')
+        self.assertEqual(response['X-Cache'], 'HIT', 'Second request was not a hit')
+        self.assertEqual(response.data['content'], 'testContent', 'Content is not testContent')
+        self.assertEqual(post_cache.stats(), {'hits': 1, 'misses': 1}, 'Hits and misses were not counted')
+
+    def test_post_cache_invalidated(self):
+        self.client.get(f'/posts/{self.post.id}/')
+        self.client.force_authenticate(user=self.user)
+        self.client.post(f'/posts/{self.post.id}/like/')
+        self.client.post(f'/posts/{self.post.id}/comments/', {'content': 'newComment'})
+        response = self.client.get(f'/posts/{self.post.id}/')
+        self.assertEqual(response['X-Cache'], 'MISS', 'Cache was not invalidated')
+        self.assertEqual(response.data['likes_count'], 1, 'Likes count is not 1')
+        self.assertEqual(len(response.data['comments']), 2, 'New comment is missing')
+        self.client.force_authenticate(user=None)
+
+    def test_post_cache_per_viewer(self):
+        CommentLike.objects.create(user=self.user, comment=self.comment)
+        PostLike.objects.create(user=self.user, post=self.post)
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(f'/posts/{self.post.id}/')
+        self.assertTrue(response.data['liked_by_user'], 'Post is not liked by user')
+        self.assertTrue(response.data['comments'][0]['liked_by_user'], 'Comment is not liked by user')
+
+        self.client.force_authenticate(user=User.objects.create(username='testUser2', password='testPass'))
+        response = self.client.get(f'/posts/{self.post.id}/')
+        self.assertEqual(response['X-Cache'], 'HIT', 'Second request was not a hit')
+        self.assertFalse(response.data['liked_by_user'], 'Like leaked to another viewer')
+        self.assertFalse(response.data['comments'][0]['liked_by_user'], 'Comment like leaked to another viewer')
+        self.client.force_authenticate(user=None)
+
+
+class CommentTreeTestCase(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.reply = Comment.objects.create(content='reply', post=self.post, author=self.user, parent=self.comment)
+        self.nested = Comment.objects.create(content='nested', post=self.post, author=self.user, parent=self.reply)
+
+    def get_tree(self, query=''):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/posts/{self.post.id}/comments/tree/{query}')
+        self.assertEqual(response.status_code, 200, 'Status code is not 200')
+        return response.data, len(context.captured_queries)
+
+    def test_tree(self):
+        CommentLike.objects.create(user=self.user, comment=self.reply)
+        self.client.force_authenticate(user=self.user)
+        tree, _ = self.get_tree()
+        root = tree['comments'][0]
+        self.assertEqual(root['id'], self.comment.id, 'Root is not the top-level comment')
+        self.assertEqual(root['replies'][0]['id'], self.reply.id, 'Reply is not nested')
+        self.assertEqual(root['replies'][0]['replies'][0]['depth'], 2, 'Depth is not 2')
+        self.assertTrue(root['replies'][0]['liked_by_user'], 'Reply is not liked by user')
+        self.assertFalse(root['liked_by_user'], 'Root is liked by user')
+        self.client.force_authenticate(user=None)
+
+    def test_tree_limits(self):
+        tree, _ = self.get_tree('?depth=1')
+        self.assertEqual(tree['comments'][0]['replies'][0]['replies'], [], 'Depth limit is ignored')
+        tree, _ = self.get_tree('?limit=2')
+        self.assertTrue(tree['truncated'], 'Tree is not truncated')
+
+    def test_tree_query_count_is_constant(self):
+        self.client.force_authenticate(user=self.user)
+        _, small_tree_queries = self.get_tree()
+        parents = [self.comment]
+        for i in range(200):
+            parents.append(Comment.objects.create(content=f'reply {i}', post=self.post, author=self.user,
+                                                  parent=parents[i % 20]))
+        CommentLike.objects.bulk_create(CommentLike(user=self.user, comment=comment) for comment in parents)
+        tree, large_tree_queries = self.get_tree('?limit=1000')
+        self.assertFalse(tree['truncated'], 'Tree is truncated')
+        self.assertEqual(large_tree_queries, small_tree_queries, 'Query count depends on the thread size')
+        self.client.force_authenticate(user=None)
+
+
 class LikeTestCase(TestSetup):
     def test_post_like(self):
         self.client.force_authenticate(user=self.user)
@@ -130,29 +389,38 @@ class LikeTestCase(TestSetup):
         self.assertEqual(response.data['likes'], 1, 'Likes is not 1')
         self.client.force_authenticate(user=None)
 
-    # def test_post_unlike(self):
-    #     self.client.force_authenticate(user=self.user)
-    #     self.client.post(f'/posts/{self.post.id}/like/')
-    #     response = self.client.post(f'/posts/{self.post.id}/like/')
-    #     self.assertEqual(response.status_code, 204, 'Status code is not 204')
-    #     self.assertEqual(response.data['likes'], 0, 'Likes is not 0')
-    #     self.client.force_authenticate(user=None)
-    #
-    # def test_comment_like(self):
-    #     self.client.force_authenticate(user=self.user)
-    #     response = self.client.post(f'/posts/{self.post.id}/comments/{self.comment.id}/like/')
-    #     self.assertEqual(response.status_code, 201, 'Status code is not 201')
-    #     self.assertEqual(response.data['likes'], 1, 'Likes is not 1')
-    #     self.client.force_authenticate(user=None)
-    #
-    # def test_comment_unlike(self):
-    #     self.client.force_authenticate(user=self.user)
-    #     self.client.post(f'/posts/{self.post.id}/comments/{self.comment.id}/like/')
-    #     response = self.client.post(f'/posts/{self.post.id}/comments/{self.comment.id}/like/')
-    #     self.assertEqual(response.status_code, 204, 'Status code is not 204')
-    #     self.assertEqual(response.data['likes'], 0, 'Likes is not 0')
-    #     self.client.force_authenticate(user=None)
-    #
+    def test_post_unlike(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post(f'/posts/{self.post.id}/like/')
+        response = self.client.post(f'/posts/{self.post.id}/like/')
+        self.assertEqual(response.status_code, 204, 'Status code is not 204')
+        self.assertEqual(response.data['likes'], 0, 'Likes is not 0')
+        self.client.force_authenticate(user=None)
+
+    def test_comment_like(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(f'/posts/{self.post.id}/comments/{self.comment.id}/like/')
+        self.assertEqual(response.status_code, 201, 'Status code is not 201')
+        self.assertEqual(response.data['likes'], 1, 'Likes is not 1')
+        self.client.force_authenticate(user=None)
+
+    def test_comment_unlike(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post(f'/posts/{self.post.id}/comments/{self.comment.id}/like/')
+        response = self.client.post(f'/posts/{self.post.id}/comments/{self.comment.id}/like/')
+        self.assertEqual(response.status_code, 204, 'Status code is not 204')
+        self.assertEqual(response.data['likes'], 0, 'Likes is not 0')
+        self.client.force_authenticate(user=None)
+
+    def test_likes_deleted_with_post(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post(f'/posts/{self.post.id}/like/')
+        self.client.post(f'/posts/{self.post.id}/comments/{self.comment.id}/like/')
+        self.post.delete()
+        self.assertFalse(PostLike.objects.exists(), 'Post likes were not deleted')
+        self.assertFalse(CommentLike.objects.exists(), 'Comment likes were not deleted')
+        self.client.force_authenticate(user=None)
+
     # def test_post_like_unauthenticated(self):
     #     response = self.client.post(f'/posts/{self.post.id}/like/')
     #     self.assertEqual(response.status_code, 401, 'Status code is not 401')
@@ -168,3 +436,423 @@ class LikeTestCase(TestSetup):
     # def test_comment_unlike_unauthenticated(self):
     #     response = self.client.post(f'/posts/{self.post.id}/comments/{self.comment.id}/like/')
     #     self.assertEqual(response.status_code, 401, 'Status code is not 401')
+
+
+@override_settings(LIKE_WRITE_BEHIND=True)
+class LikeBufferTestCase(TestSetup):
+    def setUp(self):
+        super().setUp()
+        # Flushed by hand, so no background thread writes outside the test's transaction.
+        patcher = mock.patch.object(like_buffer, 'start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(like_buffer.pending.clear)
+        self.addCleanup(like_buffer.flushing.clear)
+        self.client.force_authenticate(user=self.user)
+        self.other = User.objects.create(username='otherUser', password='testPass')
+
+    def test_likes_are_buffered(self):
+        with self.assertNumQueries(2):
+            response = self.client.post(f'/posts/{self.post.id}/like/')
+        self.assertEqual(response.status_code, 201, 'Status code is not 201')
+        self.assertEqual(response.data['likes'], 1, 'Like is not counted for its user')
+        self.assertFalse(PostLike.objects.exists(), 'Like was written before the flush')
+
+        self.assertEqual(like_buffer.flush(), 1, 'Like was not flushed')
+        self.assertTrue(PostLike.objects.filter(user=self.user, post=self.post).exists(), 'Like was not written')
+        self.assertEqual(Post.objects.get(id=self.post.id).likes_count, 1, 'Likes count is not 1')
+
+    def test_toggles_are_coalesced(self):
+        for _ in range(3):
+            self.client.post(f'/posts/{self.post.id}/like/')
+        self.client.post(f'/posts/{self.post.id}/comments/{self.comment.id}/like/')
+        self.client.post(f'/posts/{self.post.id}/comments/{self.comment.id}/like/')
+        self.client.force_authenticate(user=self.other)
+        self.client.post(f'/posts/{self.post.id}/like/')
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(like_buffer.flush(), 2, 'Toggles were not coalesced')
+        inserts = [query for query in context.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1, 'Likes were not inserted in bulk')
+        self.assertEqual(Post.objects.get(id=self.post.id).likes_count, 2, 'Likes count is not 2')
+        self.assertEqual(Comment.objects.get(id=self.comment.id).likes_count, 0, 'Comment likes count is not 0')
+
+    def test_buffered_unlike(self):
+        PostLike.objects.create(user=self.user, post=self.post)
+        Post.objects.filter(id=self.post.id).update(likes_count=1)
+        response = self.client.post(f'/posts/{self.post.id}/like/')
+        self.assertEqual(response.status_code, 204, 'Status code is not 204')
+        self.assertEqual(response.data['likes'], 0, 'Unlike is not counted for its user')
+
+        like_buffer.flush()
+        self.assertFalse(PostLike.objects.exists(), 'Like was not deleted')
+        self.assertEqual(Post.objects.get(id=self.post.id).likes_count, 0, 'Likes count is not 0')
+
+    def test_read_your_own_writes(self):
+        self.client.post(f'/posts/{self.post.id}/like/')
+        self.client.post(f'/posts/{self.post.id}/comments/{self.comment.id}/like/')
+
+        response = self.client.get(f'/posts/{self.post.id}/')
+        self.assertTrue(response.data['liked_by_user'], 'Own buffered like is not shown')
+        self.assertEqual(response.data['likes_count'], 1, 'Own buffered like is not counted')
+        self.assertTrue(response.data['comments'][0]['liked_by_user'], 'Own buffered comment like is not shown')
+        response = self.client.get('/posts/')
+        self.assertTrue(response.data['results'][0]['liked_by_user'], 'Own buffered like is not listed')
+        response = self.client.get(f'/users/{self.user.username}/')
+        self.assertEqual(response.data['posts'][0]['likes_count'], 1, 'Own buffered like is not in the profile')
+
+        self.client.force_authenticate(user=self.other)
+        response = self.client.get(f'/posts/{self.post.id}/')
+        self.assertFalse(response.data['liked_by_user'], 'Buffered like is shown to another user')
+        self.assertEqual(response.data['likes_count'], 0, 'Buffered like is counted for another user')
+
+    def test_unlike_during_flush(self):
+        self.client.post(f'/posts/{self.post.id}/like/')
+        batch, like_buffer.pending = like_buffer.pending, {}
+        like_buffer.flushing.update(batch)
+        response = self.client.post(f'/posts/{self.post.id}/like/')
+        self.assertEqual(response.status_code, 204, 'Status code is not 204')
+
+        like_buffer.write(batch)
+        like_buffer.flushing.clear()
+        like_buffer.flush()
+        self.assertFalse(PostLike.objects.exists(), 'Unlike made during a flush was lost')
+        self.assertEqual(Post.objects.get(id=self.post.id).likes_count, 0, 'Likes count is not 0')
+
+    def test_failed_flush_keeps_newer_toggles(self):
+        self.client.post(f'/posts/{self.post.id}/like/')
+
+        def fail(batch):
+            # Tapped twice more while the flush runs, which then fails.
+            self.client.post(f'/posts/{self.post.id}/like/')
+            self.client.post(f'/posts/{self.post.id}/like/')
+            raise DatabaseError('Flush failed')
+
+        with mock.patch.object(like_buffer, 'write', side_effect=fail), self.assertRaises(DatabaseError):
+            like_buffer.flush()
+        like_buffer.flush()
+        self.assertTrue(PostLike.objects.filter(user=self.user, post=self.post).exists(), 'Like was lost')
+        self.assertEqual(Post.objects.get(id=self.post.id).likes_count, 1, 'Likes count is not 1')
+
+    def test_concurrent_toggles(self):
+        exists = QuerySet.exists
+        post = Post.objects.get(id=self.post.id)
+
+        def tap_meanwhile(queryset):
+            # Another request of the same user toggles the like while this one reads the database.
+            patcher.stop()
+            like_buffer.toggle(self.user, post)
+            return exists(queryset)
+
+        patcher = mock.patch.object(QuerySet, 'exists', tap_meanwhile)
+        patcher.start()
+        self.assertFalse(like_buffer.toggle(self.user, post), 'Second toggle did not unlike')
+        self.assertEqual(like_buffer.own(self.user), {('post', post.id): (False, 0)}, 'Like and unlike made a like')
+
+    def test_deleted_target(self):
+        other_post = Post.objects.create(content='otherContent', author=self.user)
+        self.client.post(f'/posts/{self.post.id}/like/')
+        self.client.post(f'/posts/{other_post.id}/like/')
+        other_post.delete()
+
+        self.assertEqual(like_buffer.flush(), 1, 'Like of the remaining post was not flushed')
+        self.assertEqual(Post.objects.get(id=self.post.id).likes_count, 1, 'Likes count is not 1')
+        self.assertFalse(like_buffer.pending, 'Batch was put back')
+
+    def test_like_written_elsewhere(self):
+        self.client.post(f'/posts/{self.post.id}/like/')
+        # The same like flushed by another process first, which counted it.
+        PostLike.objects.create(user=self.user, post=self.post)
+        Post.objects.filter(id=self.post.id).update(likes_count=1)
+
+        self.assertEqual(like_buffer.flush(), 0, 'Existing like was written again')
+        self.assertEqual(Post.objects.get(id=self.post.id).likes_count, 1, 'Like was counted twice')
+
+    def test_own_likes_in_comment_tree(self):
+        reply = Comment.objects.create(post=self.post, parent=self.comment, author=self.other, content='reply')
+        self.client.post(f'/posts/{self.post.id}/comments/{reply.id}/like/')
+
+        response = self.client.get(f'/posts/{self.post.id}/comments/tree/')
+        [reply_data] = response.data['comments'][0]['replies']
+        self.assertTrue(reply_data['liked_by_user'], 'Own buffered reply like is not shown')
+        self.assertEqual(reply_data['likes_count'], 1, 'Own buffered reply like is not counted')
+
+    def test_full_buffer_is_flushed(self):
+        with self.settings(LIKE_BUFFER_MAX=1):
+            self.client.post(f'/posts/{self.post.id}/like/')
+        self.assertTrue(PostLike.objects.exists(), 'Full buffer was not flushed')
+
+
+class TrendingTestCase(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.users = User.objects.bulk_create(User(username=f'liker{i}') for i in range(5))
+        self.other_post = Post.objects.create(content='otherContent', author=self.user)
+
+    def like(self, post, users):
+        PostLike.objects.bulk_create(PostLike(post=post, user=user) for user in users)
+
+    def update(self):
+        out = StringIO()
+        call_command('update_trending', '--chunk-size', '2', stdout=out)
+        return out.getvalue()
+
+    def test_trending(self):
+        self.like(self.other_post, self.users)
+        self.like(self.post, self.users[:2])
+        self.assertIn('Counted 7 likes, 1 comments, 0 comment_likes', self.update(), 'Activity was not counted')
+
+        response = self.client.get('/posts/trending/')
+        self.assertEqual(response.status_code, 200, 'Status code is not 200')
+        self.assertEqual([post['id'] for post in response.data['results']], [self.other_post.id, self.post.id],
+                         'Posts are not ranked by activity')
+        self.assertAlmostEqual(response.data['results'][0]['trending_score'], 5, places=2, msg='Score is not 5')
+
+        response = self.client.get('/posts/trending/?limit=1')
+        self.assertEqual(len(response.data['results']), 1, 'Limit was ignored')
+
+    def test_update_is_incremental(self):
+        self.like(self.other_post, self.users[:1])
+        self.update()
+        self.assertIn('Counted 0 likes, 0 comments', self.update(), 'Activity was counted twice')
+
+        self.like(self.post, self.users[:3])
+        with CaptureQueriesContext(connection) as context:
+            self.assertIn('Counted 3 likes', self.update(), 'New activity was not counted')
+        self.assertFalse([query for query in context.captured_queries
+                          if 'FROM "posts_postlike"' in query['sql'] and '"created_at" >' not in query['sql']],
+                         'Likes were read from the start')
+        self.assertEqual(TrendingCheckpoint.objects.get(source='like').counted_until,
+                         PostLike.objects.latest('created_at').created_at, 'Checkpoint did not move')
+        response = self.client.get('/posts/trending/')
+        self.assertEqual(response.data['results'][0]['id'], self.post.id, 'Ranking was not updated')
+
+    def test_late_commits_are_counted(self):
+        self.like(self.other_post, self.users[:1])
+        self.update()
+        # Created before the newest counted like, but committed after the run read past it.
+        self.like(self.post, self.users[:1])
+        PostLike.objects.filter(post=self.post).update(created_at=timezone.now() - timedelta(seconds=60))
+        self.assertIn('Counted 1 likes, 0 comments', self.update(), 'Late like was not counted once')
+        self.assertIn('Counted 0 likes, 0 comments', self.update(), 'Activity read again was counted twice')
+
+    def test_activity_decays(self):
+        self.like(self.other_post, self.users[:2])
+        PostLike.objects.update(created_at=timezone.now() - timedelta(hours=24))
+        self.like(self.post, self.users[:1])
+        Comment.objects.all().delete()
+        self.update()
+
+        response = self.client.get('/posts/trending/')
+        self.assertEqual([post['id'] for post in response.data['results']], [self.post.id, self.other_post.id],
+                         'Old activity outranks recent activity')
+        self.assertAlmostEqual(response.data['results'][1]['trending_score'], 2 / 16, places=2,
+                               msg='Activity did not decay by half every half-life')
+
+    def test_deleted_posts_leave_the_ranking(self):
+        self.like(self.other_post, self.users)
+        self.update()
+        self.other_post.delete()
+        self.assertFalse(TrendingScore.objects.filter(post_id=self.other_post.id).exists(), 'Score was kept')
+        response = self.client.get('/posts/trending/')
+        self.assertEqual([post['id'] for post in response.data['results']], [self.post.id],
+                         'Deleted post is still trending')
+
+    def test_toggled_likes_count_once(self):
+        Comment.objects.all().delete()
+        for _ in range(10):
+            PostLike.objects.filter(user=self.users[0], post=self.post).delete()
+            self.like(self.post, self.users[:1])
+            self.assertIn('Counted', self.update(), 'Update did not run')
+        self.like(self.other_post, self.users[:2])
+        self.update()
+
+        response = self.client.get('/posts/trending/')
+        self.assertEqual([post['id'] for post in response.data['results']], [self.other_post.id, self.post.id],
+                         'Toggled likes outrank distinct likes')
+        self.assertAlmostEqual(response.data['results'][1]['trending_score'], 1, places=2,
+                               msg='Toggled like was counted more than once')
+
+        with self.settings(TRENDING_EVENT_MEMORY=0):
+            self.update()
+        self.assertFalse(TrendingEvent.objects.exists(), 'Old counted events were kept')
+
+    def test_ranking_size(self):
+        for i, user in enumerate(self.users):
+            post = Post.objects.create(content=f'post {i}', author=user)
+            self.like(post, self.users[:i + 1])
+        with self.settings(TRENDING_SIZE=2):
+            self.update()
+            response = self.client.get('/posts/trending/?limit=10')
+        self.assertEqual([post['content'] for post in response.data['results']], ['post 4', 'post 3'],
+                         'Ranking does not hold the top 2 posts')
+
+
+class LikeBatchTestCase(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.user)
+        self.other_post = Post.objects.create(content='otherContent', author=self.user)
+
+    def send(self, operations):
+        return self.client.post('/posts/likes/', {'operations': operations}, format='json')
+
+    def test_batch_like(self):
+        response = self.send([{'type': 'post', 'id': self.post.id, 'action': 'like'},
+                              {'type': 'post', 'id': self.other_post.id, 'action': 'like'},
+                              {'type': 'comment', 'id': self.comment.id, 'action': 'like'}])
+        self.assertEqual(response.status_code, 200, 'Status code is not 200')
+        self.assertEqual([result['likes'] for result in response.data['results']], [1, 1, 1], 'Likes are not 1')
+        self.assertEqual(PostLike.objects.filter(user=self.user).count(), 2, 'Post likes were not created')
+        self.assertEqual(Comment.objects.get(id=self.comment.id).likes_count, 1, 'Comment likes count is not 1')
+
+    def test_batch_is_idempotent(self):
+        operations = [{'type': 'post', 'id': self.post.id, 'action': 'like'},
+                      {'type': 'comment', 'id': self.comment.id, 'action': 'unlike'}]
+        first = self.send(operations)
+        second = self.send(operations)
+        self.assertEqual(first.data, second.data, 'Replaying the batch changed the result')
+        self.assertEqual(Post.objects.get(id=self.post.id).likes_count, 1, 'Likes count is not 1')
+        self.assertFalse(CommentLike.objects.exists(), 'Unliking created a like')
+
+    def test_batch_unlike(self):
+        self.client.post(f'/posts/{self.post.id}/like/')
+        response = self.send([{'type': 'post', 'id': self.post.id, 'action': 'unlike'}])
+        self.assertEqual(response.data['results'][0]['likes'], 0, 'Likes is not 0')
+        self.assertFalse(response.data['results'][0]['liked'], 'Post is still liked')
+        self.assertFalse(PostLike.objects.exists(), 'Post like was not deleted')
+
+    def test_batch_applies_deltas(self):
+        # Stored counts move by the likes the batch added or removed; they aren't recounted from every like.
+        Post.objects.filter(id=self.post.id).update(likes_count=5)
+        self.client.post(f'/posts/{self.other_post.id}/like/')
+        with CaptureQueriesContext(connection) as context:
+            response = self.send([{'type': 'post', 'id': self.post.id, 'action': 'like'},
+                                  {'type': 'post', 'id': self.other_post.id, 'action': 'like'}])
+        self.assertEqual([result['likes'] for result in response.data['results']], [6, 1], 'Counts are wrong')
+        self.assertFalse([query for query in context.captured_queries if 'COUNT(' in query['sql']],
+                         'Likes were recounted')
+
+    def test_batch_last_operation_wins(self):
+        response = self.send([{'type': 'post', 'id': self.post.id, 'action': 'like'},
+                              {'type': 'post', 'id': self.post.id, 'action': 'unlike'}])
+        self.assertFalse(PostLike.objects.exists(), 'The last operation did not win')
+        self.assertEqual(len(response.data['results']), 2, 'Not every operation has a result')
+
+    def test_batch_not_found(self):
+        response = self.send([{'type': 'post', 'id': 0, 'action': 'like'},
+                              {'type': 'post', 'id': self.post.id, 'action': 'like'}])
+        self.assertEqual([result['status'] for result in response.data['results']], ['not_found', 'ok'],
+                         'Missing post is not reported')
+
+    def test_batch_invalidates_cache(self):
+        self.client.get(f'/posts/{self.post.id}/')
+        self.send([{'type': 'comment', 'id': self.comment.id, 'action': 'like'}])
+        response = self.client.get(f'/posts/{self.post.id}/')
+        self.assertEqual(response['X-Cache'], 'MISS', 'Cache was not invalidated')
+
+    def test_batch_invalid(self):
+        response = self.send([{'type': 'user', 'id': self.user.id, 'action': 'like'}])
+        self.assertEqual(response.status_code, 400, 'Status code is not 400')
+
+    def test_batch_unauthenticated(self):
+        self.client.force_authenticate(user=None)
+        response = self.send([{'type': 'post', 'id': self.post.id, 'action': 'like'}])
+        self.assertEqual(response.status_code, 401, 'Status code is not 401')
+
+
+class CounterTestCase(TestSetup):
+    def test_comment_counters(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post(f'/posts/{self.post.id}/comments/', {'content': 'newComment'})
+        response = self.client.post(f'/posts/{self.post.id}/comments/{self.comment.id}/replies/', {'content': 'reply'})
+        self.assertEqual(response.status_code, 201, 'Status code is not 201')
+        self.post.refresh_from_db()
+        self.comment.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 2, 'Comments count is not 2')
+        self.assertEqual(self.comment.comments_count, 1, 'Replies count is not 1')
+        self.client.force_authenticate(user=None)
+
+    def test_comment_delete_counters(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(f'/posts/{self.post.id}/comments/', {'content': 'newComment'})
+        comment_id = response.data['id']
+        self.client.post(f'/posts/{self.post.id}/comments/{comment_id}/replies/', {'content': 'reply'})
+        self.client.delete(f'/posts/{self.post.id}/comments/{comment_id}/')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0, 'Comments count is not 0')
+        self.client.force_authenticate(user=None)
+
+    def test_rebuild_counters(self):
+        PostLike.objects.create(user=self.user, post=self.post)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1, 'Likes count is not 1')
+        self.assertEqual(self.post.comments_count, 1, 'Comments count is not 1')
+
+
+class FeedTestCase(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create(username='author', password='testPass')
+        self.stranger = User.objects.create(username='stranger', password='testPass')
+        Follow.objects.create(follower=self.user, following=self.author)
+        self.client.force_authenticate(user=self.user)
+
+    def create_post(self, author, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(content=content, author=author)
+
+    def get_feed(self):
+        response = self.client.get('/posts/')
+        self.assertEqual(response.status_code, 200, 'Status code is not 200')
+        return [post['content'] for post in response.data['results']]
+
+    def test_feed(self):
+        self.create_post(self.author, 'first')
+        self.create_post(self.stranger, 'hidden')
+        self.create_post(self.author, 'second')
+        self.assertEqual(self.get_feed(), ['second', 'first'], 'Feed is not the followed posts, newest first')
+
+    def test_feed_backfill_on_follow(self):
+        self.create_post(self.stranger, 'older')
+        Follow.objects.create(follower=self.user, following=self.stranger)
+        self.assertIn('older', self.get_feed(), 'Followed user posts are not backfilled')
+
+    def test_feed_unfollow(self):
+        self.create_post(self.author, 'first')
+        self.create_post(self.stranger, 'other')
+        Follow.objects.create(follower=self.user, following=self.stranger)
+        Follow.objects.filter(follower=self.user, following=self.author).delete()
+        self.assertEqual(self.get_feed(), ['other'], 'Unfollowed user posts are still in the feed')
+
+    def test_feed_celebrity(self):
+        with mock.patch('posts.feed.FANOUT_MAX_FOLLOWERS', 1):
+            Profile.objects.filter(user=self.author).update(followers_count=1)
+            post = self.create_post(self.author, 'famous')
+            self.assertFalse(TimelineEntry.objects.filter(post=post).exists(), 'Celebrity post was fanned out')
+            self.assertEqual(self.get_feed(), ['famous'], 'Celebrity post is not pulled into the feed')
+
+    def test_feed_celebrity_gap(self):
+        with mock.patch('posts.feed.FANOUT_MAX_FOLLOWERS', 1), mock.patch('posts.feed.BACKFILL_POSTS', 2):
+            Profile.objects.filter(user=self.author).update(followers_count=1)
+            self.create_post(self.author, 'first')
+            self.get_feed()
+            for i in range(5):
+                self.create_post(self.author, f'post {i}')
+            self.assertEqual(TimelineEntry.objects.filter(user=self.user).count(), 1, 'Posts were pulled early')
+            self.get_feed()
+            self.assertEqual(TimelineEntry.objects.filter(user=self.user).count(), 6,
+                             'Posts between two reads were not all pulled')
+
+
+class BenchmarkTestCase(TestCase):
+    def test_benchmark(self):
+        benchmark.seed(users=5, follows=2, posts=2, comments=2, likes=2)
+        results = benchmark.run(iterations=2)
+        self.assertEqual(results['feed']['status'], 200, 'Feed status code is not 200')
+        self.assertTrue(all(result['status'] < 400 for result in results.values()), 'An endpoint failed')
+        self.assertEqual(benchmark.compare(results, results), [], 'Results regressed against themselves')
+
+        slower = {name: {**result, 'queries': result['queries'] + 1} for name, result in results.items()}
+        self.assertEqual(len(benchmark.compare(results, slower)), len(results), 'Extra queries are not reported')
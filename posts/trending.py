@@ -0,0 +1,163 @@
+import heapq
+import math
+import time
+from datetime import timedelta
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import (Post, Comment, PostLike, CommentLike, TrendingScore, TrendingPost, TrendingCheckpoint,
+                     TrendingEvent)
+
+# Activity that makes a post trend: the model, the path from its rows to the post, and who made an event on
+# what, which counts once.
+SOURCES = {
+    'like': (PostLike, 'post_id', 'user_id', 'post_id'),
+    'comment': (Comment, 'post_id', 'author_id', 'id'),
+    'comment_like': (CommentLike, 'comment__post_id', 'user_id', 'comment_id'),
+}
+CHUNK_SIZE = 5000
+
+
+def decay_rate():
+    """Per second: activity counts half as much every TRENDING_HALF_LIFE seconds."""
+    return math.log(2) / getattr(settings, 'TRENDING_HALF_LIFE', 6 * 3600)
+
+
+def trending_size():
+    return getattr(settings, 'TRENDING_SIZE', 50)
+
+
+def event_memory():
+    """Seconds a counted event is remembered: by default ten half-lives, after which it weighs under a thousandth."""
+    return getattr(settings, 'TRENDING_EVENT_MEMORY', 10 * math.log(2) / decay_rate())
+
+
+def overlap():
+    """How far back before the newest counted event a run reads again, for rows that committed late."""
+    return timedelta(seconds=getattr(settings, 'TRENDING_OVERLAP_SECONDS', 300))
+
+
+def logaddexp(a, b):
+    """log(e^a + e^b) without leaving log space, where the exponentials would overflow."""
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def current_score(log_score):
+    """The decayed score right now: the weighted activity, each counted by how recent it is."""
+    return math.exp(log_score - decay_rate() * time.time())
+
+
+def update(chunk_size=CHUNK_SIZE):
+    """
+    Count the likes and comments made since the last run into their posts' scores and re-rank.
+
+    Every event adds weight * e^(rate * t) to its post's score, so older scores never have to be decayed and
+    only the posts with new activity change. The ranking keeps twice TRENDING_SIZE candidates, which is
+    enough to rank again from: unchanged posts outside it can't overtake a candidate, whose score can only
+    have grown, and the spare half covers candidates that get deleted.
+
+    Rows are read by creation time, from TRENDING_OVERLAP_SECONDS before the newest one counted so far, since a
+    row can commit after newer ones were read. Counted events are remembered (see TrendingEvent), so rows read
+    again don't count twice, and neither does a like undone and made again. Each chunk is counted and
+    checkpointed in one transaction, so an interrupted run resumes where it stopped and concurrent runs never
+    count an event twice. Returns the number of events counted per source.
+    """
+    rate = decay_rate()
+    weights = getattr(settings, 'TRENDING_WEIGHTS', {'like': 1, 'comment': 2, 'comment_like': 0.5})
+    pool = 2 * trending_size()
+    candidates = dict(TrendingPost.objects.values_list('post_id', 'log_score'))
+    counted = {}
+
+    for source, (model, post_field, user_field, target_field) in SOURCES.items():
+        counted[source] = 0
+        log_weight = math.log(weights[source]) if weights.get(source) else None
+        # (created_at, id) of the last row read by this run.
+        position = None
+        while True:
+            with transaction.atomic():
+                checkpoint, _ = TrendingCheckpoint.objects.get_or_create(source=source)
+                checkpoint = TrendingCheckpoint.objects.select_for_update().get(source=source)
+                rows = model.objects.order_by('created_at', 'id')
+                if position:
+                    rows = rows.filter(Q(created_at__gt=position[0]) | Q(created_at=position[0], id__gt=position[1]))
+                elif checkpoint.counted_until:
+                    rows = rows.filter(created_at__gte=checkpoint.counted_until - overlap())
+                rows = list(rows.values_list('id', post_field, 'created_at', user_field, target_field)[:chunk_size])
+                if not rows:
+                    break
+                position = rows[-1][2], rows[-1][0]
+                newest = max(checkpoint.counted_until or position[0], position[0])
+                rows = first_events(source, rows)
+
+                if log_weight is not None:
+                    activity = {}
+                    for _, post_id, created_at, *_ in rows:
+                        activity[post_id] = logaddexp(activity.get(post_id), log_weight + rate * created_at.timestamp())
+                    candidates.update(add_activity(activity))
+                    candidates = dict(heapq.nlargest(pool, candidates.items(), key=itemgetter(1)))
+
+                checkpoint.counted_until = newest
+                checkpoint.save(update_fields=['counted_until'])
+                counted[source] += len(rows)
+
+    TrendingEvent.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=event_memory())).delete()
+    rank(candidates)
+    return counted
+
+
+def first_events(source, rows):
+    """
+    The rows (id, post id, created at, user id, target id) not counted yet, which are remembered as counted.
+    The others were read by an earlier run, or are likes that were undone and made again since.
+    """
+    events = {(user_id, target_id) for *_, user_id, target_id in rows}
+    seen = set(TrendingEvent.objects.filter(source=source, user_id__in={user_id for user_id, _ in events},
+                                            target_id__in={target_id for _, target_id in events})
+               .values_list('user_id', 'target_id'))
+    first = []
+    for row in rows:
+        if row[3:] not in seen:
+            seen.add(row[3:])
+            first.append(row)
+    TrendingEvent.objects.bulk_create([TrendingEvent(source=source, user_id=user_id, target_id=target_id,
+                                                     created_at=created_at)
+                                       for _, _, created_at, user_id, target_id in first], ignore_conflicts=True)
+    return first
+
+
+def add_activity(activity):
+    """Add each post's log-space activity to its stored score. Returns the new scores."""
+    # Posts deleted meanwhile have nothing to score.
+    existing = set(Post.objects.filter(id__in=activity).values_list('id', flat=True))
+    activity = {post_id: log_activity for post_id, log_activity in activity.items() if post_id in existing}
+    scores = dict(TrendingScore.objects.filter(post_id__in=activity).values_list('post_id', 'log_score'))
+    scores = {post_id: logaddexp(scores.get(post_id), log_activity) for post_id, log_activity in activity.items()}
+    TrendingScore.objects.bulk_create([TrendingScore(post_id=post_id, log_score=log_score)
+                                       for post_id, log_score in scores.items()],
+                                      update_conflicts=True, unique_fields=['post'], update_fields=['log_score'])
+    return scores
+
+
+def rank(candidates):
+    # Candidates deleted since they were read drop out here.
+    existing = set(Post.objects.filter(id__in=candidates).values_list('id', flat=True))
+    ranked = sorted(((post_id, score) for post_id, score in candidates.items() if post_id in existing),
+                    key=itemgetter(1), reverse=True)
+    with transaction.atomic():
+        TrendingPost.objects.all().delete()
+        TrendingPost.objects.bulk_create([TrendingPost(rank=rank, post_id=post_id, log_score=log_score)
+                                          for rank, (post_id, log_score) in enumerate(ranked, start=1)])
+
+
+def trending(limit=None):
+    """(post id, current score) of the top posts, best first."""
+    limit = min(limit or trending_size(), trending_size())
+    return [(post_id, current_score(log_score)) for post_id, log_score in
+            TrendingPost.objects.order_by('rank').values_list('post_id', 'log_score')[:limit]]
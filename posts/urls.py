@@ -3,11 +3,14 @@ from .views import *
 
 urlpatterns = [
     path('', PostListCreate.as_view(), name='list-notes'),
+    path('likes/', LikeBatchView.as_view(), name='batch-likes'),
+    path('trending/', TrendingPostListView.as_view(), name='trending-posts'),
     path('<int:id>/', PostRetrieveUpdateDestroy.as_view(), name='RUD-note'),
-    path('<int:id>/like', LikePostView.as_view(), name='like-post'),
+    path('<int:id>/like/', LikePostView.as_view(), name='like-post'),
 
     path('<int:id>/comments/', PostCommentListCreate.as_view(), name='list-comments'),
+    path('<int:id>/comments/tree/', CommentTreeView.as_view(), name='comment-tree'),
     path('<int:id>/comments/<int:pk>/', PostCommentRetrieveUpdateDestroy.as_view(), name='RUD-comment'),
-    path('<int:id>/comments/<int:pk>/like', LikeCommentView.as_view(), name='like-comment'),
+    path('<int:id>/comments/<int:pk>/like/', LikeCommentView.as_view(), name='like-comment'),
     path('<int:id>/comments/<int:pk>/replies/', PostCommentReplyListCreate.as_view(), name='list-create-replies'),
 ]
\ No newline at end of file
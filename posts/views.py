@@ -1,36 +1,39 @@
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Prefetch
 from django.http import Http404
-from rest_framework import filters
-from rest_framework import generics, status
+from rest_framework import generics, permissions, status
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 
+from SimpleSocialApp.cache import post_cache
+from mediastore.serializers import absolute_image_urls
+from search.mixins import SearchListMixin
 from users.models import Follow
+from .counters import apply_likes, add_comment, delete_comment
+from .feed import home_feed
+from .likebuffer import BufferedLikesMixin, like_buffer, toggle
+from .trending import trending
 from .serializers import *
 
 
 # Create your views here.
-class PostListCreate(generics.ListCreateAPIView):
+class PostListCreate(SearchListMixin, BufferedLikesMixin, generics.ListCreateAPIView):
     serializer_class = PostListCreateSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend]
     queryset = Post.objects.all()
+    search_kind = 'post'
 
     def get_queryset(self):
         user = self.request.user
         queryset = super().get_queryset()
         search_term = self.request.query_params.get('search', None)
-        if search_term:
-            queryset = queryset.filter(
-                Q(content__icontains=search_term) |
-                Q(author__username__icontains=search_term)
-            )
-        elif user.is_authenticated:
-            following_ids = Follow.objects.filter(follower=user).values_list('following_id', flat=True)
-            if following_ids:
-                queryset = queryset.filter(author__id__in=following_ids).order_by('-created_at')
-
-        return queryset
+        if not search_term and user.is_authenticated and Follow.objects.filter(follower=user).exists():
+            # Read the precomputed timeline and page it off the timeline's own index.
+            queryset = home_feed(user, queryset)
+            self.keyset_ordering = ('-feed_at', '-id')
+
+        return queryset.select_related('author').with_stats(user)
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -44,12 +47,63 @@ class PostRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = PostUpdateSerializer
     lookup_field = 'id'
 
+    # The steps of a cached read below are shared with AsyncPostDetailView, which only runs them asynchronously.
+    @staticmethod
+    def detail_queryset(post_id):
+        comments = Comment.objects.select_related('author')
+        return Post.objects.filter(id=post_id).select_related('author').prefetch_related(Prefetch('comments', comments))
+
     def get_object(self):
-        post = Post.objects.filter(id=self.kwargs['id']).first()
+        post = self.detail_queryset(self.kwargs['id']).first()
         if not post:
             raise Http404
         return post
 
+    def retrieve(self, request, *args, **kwargs):
+        # The cached body is shared by every viewer; only the like flags are looked up per request.
+        post_id = self.kwargs['id']
+        data = post_cache.get(post_id)
+        cache_status = 'HIT'
+        if data is None:
+            cache_status = 'MISS'
+            data = self.get_serializer(self.get_object(), context=self.cache_context(request)).data
+            post_cache.set(post_id, data)
+
+        likes = [set(lookup) for lookup in self.like_lookups(data, request.user)]
+        response = Response(self.personalize(data, request, likes))
+        response['X-Cache'] = cache_status
+        return response
+
+    @staticmethod
+    def cache_context(request):
+        # Serialized for every viewer: image URLs are left relative (see personalize) and like flags are overlaid.
+        return {'request': request, 'cached': True}
+
+    @staticmethod
+    def like_lookups(data, user):
+        """Querysets of the ids `user` liked, of the post itself and of its comments; none for anonymous users."""
+        if not user.is_authenticated:
+            return []
+        return [PostLike.objects.filter(user=user, post_id=data['id']).values_list('post_id', flat=True),
+                CommentLike.objects.filter(user=user, comment__post_id=data['id']).values_list('comment_id', flat=True)]
+
+    @classmethod
+    def personalize(cls, data, request, likes):
+        """The cached `data` as the requesting user sees it, given the results of like_lookups()."""
+        liked_posts, liked_comments = likes or (set(), set())
+        data = {**data, 'post_img': absolute_image_urls(data['post_img'], request)}
+        return cls.overlay_buffered(cls.mark_liked(data, data['id'] in liked_posts, liked_comments), request.user)
+
+    @staticmethod
+    def mark_liked(data, liked_post, liked_comments):
+        comments = [{**comment, 'liked_by_user': comment['id'] in liked_comments} for comment in data['comments']]
+        return {**data, 'liked_by_user': liked_post, 'comments': comments}
+
+    @staticmethod
+    def overlay_buffered(data, user):
+        [data] = like_buffer.overlay(user, 'post', [data])
+        return {**data, 'comments': like_buffer.overlay(user, 'comment', data['comments'])}
+
     def update(self, request, *args, **kwargs):
         post = self.get_object()
         user = self.request.user
@@ -74,9 +128,11 @@ class PostRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
         return super().delete(request, *args, **kwargs)
 
 
-class PostCommentListCreate(generics.ListCreateAPIView):
+class PostCommentListCreate(SearchListMixin, BufferedLikesMixin, generics.ListCreateAPIView):
     serializer_class = CommentListCreateSerializer
+    like_kind = 'comment'
     queryset = Comment.objects.all()
+    search_kind = 'comment'
 
     def get_queryset(self):
         post = Post.objects.filter(id=self.kwargs['id']).first()
@@ -84,13 +140,10 @@ class PostCommentListCreate(generics.ListCreateAPIView):
             raise Http404
 
         queryset = super().get_queryset()
-        search_term = self.request.query_params.get('search', None)
-        if search_term:
-            queryset = queryset.filter(
-                Q(content__icontains=search_term) |
-                Q(author__username__icontains=search_term)
-            )
-        return queryset.filter(parent=None).order_by('-created_at')
+        return queryset.filter(post=post, parent=None).select_related('author')
+
+    def get_search_filters(self):
+        return {'post_id': self.kwargs['id'], 'top_level': True}
 
     def create(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
@@ -100,36 +153,115 @@ class PostCommentListCreate(generics.ListCreateAPIView):
         post = generics.get_object_or_404(Post, id=post_id)
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(post=post, author=request.user)
+            with transaction.atomic():
+                comment = serializer.save(post=post, author=request.user)
+                add_comment(comment)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class PostCommentReplyListCreate(generics.ListCreateAPIView):
+class PostCommentReplyListCreate(BufferedLikesMixin, generics.ListCreateAPIView):
     serializer_class = CommentListCreateSerializer
+    like_kind = 'comment'
 
     def get_queryset(self):
-        comment = Comment.objects.filter(id=self.kwargs['id']).first()
+        comment = Comment.objects.filter(id=self.kwargs['pk'], post_id=self.kwargs['id']).first()
         if not comment:
             raise Http404
 
-        return comment.replies.all()  # return all replies to this comment
+        return comment.replies.select_related('author')  # return all replies to this comment
 
     def create(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             raise PermissionDenied("You need to be logged in to comment.")
 
-        comment_id = self.kwargs['id']
-        parent_comment = generics.get_object_or_404(Comment, id=comment_id)
-        serializer = self.get_serializer(data=request.data, parent=parent_comment)
+        comment_id = self.kwargs['pk']
+        parent_comment = generics.get_object_or_404(Comment, id=comment_id, post_id=self.kwargs['id'])
+        serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(post=parent_comment.post, author=request.user, parent=parent_comment)
+            with transaction.atomic():
+                comment = serializer.save(post=parent_comment.post, author=request.user, parent=parent_comment)
+                add_comment(comment)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class TrendingPostListView(generics.GenericAPIView):
+    """
+    The posts with the most activity lately, best first, with their time-decayed `trending_score`. The
+    ranking is kept up to date by the update_trending command, so a request only reads its first `?limit=`
+    entries.
+    """
+    serializer_class = PostListCreateSerializer
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = max(int(request.query_params['limit']), 1)
+        except (KeyError, ValueError):
+            limit = None
+
+        ranked = trending(limit)
+        posts = (Post.objects.filter(id__in=[post_id for post_id, _ in ranked]).select_related('author')
+                 .with_stats(request.user).in_bulk())
+        ranked = [(posts[post_id], score) for post_id, score in ranked if post_id in posts]
+        data = self.get_serializer([post for post, _ in ranked], many=True).data
+        results = [{**item, 'trending_score': round(score, 3)} for item, (_, score) in zip(data, ranked)]
+        return Response({'results': like_buffer.overlay(request.user, 'post', results)})
+
+
+class CommentTreeView(generics.GenericAPIView):
+    """
+    The whole comment thread of a post, nested. All comments down to `?depth=` levels are loaded in one
+    query ordered by creation time (a reply is always newer than its parent), cut at `?limit=` comments,
+    and linked into a tree in memory.
+    """
+    serializer_class = CommentTreeSerializer
+    default_depth = 5
+    max_depth = 20
+    default_limit = 500
+    max_limit = 2000
+
+    def get_limit(self, name, default, maximum):
+        try:
+            value = int(self.request.query_params[name])
+        except (KeyError, ValueError):
+            return default
+        return min(max(value, 0), maximum)
+
+    def get(self, request, *args, **kwargs):
+        post = generics.get_object_or_404(Post, id=self.kwargs['id'])
+        depth = self.get_limit('depth', self.default_depth, self.max_depth)
+        limit = self.get_limit('limit', self.default_limit, self.max_limit)
+
+        comments = list(Comment.objects.filter(post=post, depth__lte=depth).select_related('author')
+                        .order_by('created_at', 'id')[:limit + 1])
+        truncated = len(comments) > limit
+        comments = comments[:limit]
+
+        context = self.get_serializer_context()
+        context['checked_comment_ids'] = {comment.id for comment in comments}
+        context['liked_comment_ids'] = set()
+        if request.user.is_authenticated:
+            context['liked_comment_ids'] = set(CommentLike.objects.filter(
+                user=request.user, comment__post=post, comment__depth__lte=depth).values_list('comment_id', flat=True))
+
+        by_id = {comment.id: comment for comment in comments}
+        roots = []
+        for comment in comments:
+            comment.tree_replies = []
+            parent = by_id.get(comment.parent_id)
+            if parent is not None:
+                parent.tree_replies.append(comment)
+            elif comment.parent_id is None:
+                roots.append(comment)
+
+        serializer = CommentTreeSerializer(roots, many=True, context=context)
+        comments = like_buffer.overlay_tree(request.user, 'comment', serializer.data)
+        return Response({'post': post.id, 'truncated': truncated, 'comments': comments})
+
+
 class PostCommentRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CommentRetrieveUpdateDestroySerializer
     lookup_field = 'pk'
@@ -169,50 +301,54 @@ class PostCommentRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
 
         return super().delete(request, *args, **kwargs)
 
+    def perform_destroy(self, instance):
+        delete_comment(instance)
+
 
 class LikePostView(generics.CreateAPIView):
-    serializer_class = LikeSerializer
-    queryset = Like.objects.all()
+    serializer_class = PostLikeSerializer
+    queryset = PostLike.objects.all()
 
-    def perform_create(self, serializer):
+    def create(self, request, *args, **kwargs):
         user = self.request.user
         if not user.is_authenticated:
             raise PermissionDenied('You must log in first.')
 
         post = self.get_object()
-        like = Like.objects.filter(user=user, content_type=ContentType.objects.get_for_model(post),
-                                   object_id=post.id).first()
-
-        # Check if user already liked the post
-        if not like:
-            serializer.is_valid(raise_exception=True)
-            serializer.save(user=user, content_type=ContentType.objects.get_for_model(Post), object_id=post.id)
-        else:
-            like.delete()
+        liked, likes = toggle(user, post)
+        return Response({'likes': likes}, status=status.HTTP_201_CREATED if liked else status.HTTP_204_NO_CONTENT)
 
     def get_object(self):
         # Retrieve the post object based on the ID in the URL
-        return Post.objects.get(id=self.kwargs['id'])
+        return generics.get_object_or_404(Post, id=self.kwargs['id'])
 
 
 class LikeCommentView(generics.CreateAPIView):
-    serializer_class = LikeSerializer
-    queryset = Like.objects.all()
+    serializer_class = CommentLikeSerializer
+    queryset = CommentLike.objects.all()
 
-    def perform_create(self, serializer):
+    def create(self, request, *args, **kwargs):
         user = self.request.user
         if not user.is_authenticated:
             raise PermissionDenied('You must log in first.')
 
-        post = self.get_object()
-        like = Like.objects.filter(user=user, content_type=ContentType.objects.get_for_model(Comment),
-                                   object_id=post.id).first()
-
-        if not like:
-            serializer.is_valid(raise_exception=True)
-            serializer.save(user=user, content_type=ContentType.objects.get_for_model(Comment), object_id=post.id)
-        else:
-            like.delete()
+        comment = self.get_object()
+        liked, likes = toggle(user, comment)
+        return Response({'likes': likes}, status=status.HTTP_201_CREATED if liked else status.HTTP_204_NO_CONTENT)
 
     def get_object(self):
-        return Post.objects.get(id=self.kwargs['pk'])
+        return generics.get_object_or_404(Comment, id=self.kwargs['pk'], post_id=self.kwargs['id'])
+
+
+class LikeBatchView(generics.GenericAPIView):
+    """Likes and unlikes many posts and comments at once, e.g. when a client replays likes queued offline."""
+    serializer_class = LikeBatchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # Write any buffered likes first, so a later flush can't undo the batch.
+        like_buffer.flush()
+        results = apply_likes(request.user, serializer.validated_data['operations'])
+        return Response({'results': results}, status=status.HTTP_200_OK)
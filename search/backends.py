@@ -0,0 +1,161 @@
+import re
+from functools import reduce
+from operator import or_
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+# Everything that can be searched. `fields` are the indexed texts (and the ORM paths they come from),
+# `filters` are extra values stored alongside a document so results can be narrowed down, e.g. to one post.
+DOCUMENTS = {
+    'post': {
+        'model': 'posts.Post',
+        'fields': {'content': 'content', 'author': 'author__username'},
+        'filters': {},
+    },
+    'comment': {
+        'model': 'posts.Comment',
+        'fields': {'content': 'content', 'author': 'author__username'},
+        'filters': {'post_id': 'post_id', 'top_level': 'parent__isnull'},
+    },
+    'user': {
+        'model': 'auth.User',
+        'fields': {'username': 'username', 'first_name': 'first_name', 'last_name': 'last_name'},
+        'filters': {},
+    },
+}
+
+
+class BaseSearchBackend:
+    """
+    Interface every search backend implements. Documents are identified by their kind (a key of DOCUMENTS)
+    and the primary key of the row they were built from.
+    """
+
+    def index(self, kind, pk, values):
+        """Add or replace a document; `values` holds every field and filter of its kind."""
+        raise NotImplementedError
+
+    def remove(self, kind, pk):
+        raise NotImplementedError
+
+    def search(self, kind, term, offset=0, limit=20, **filters):
+        """Return the primary keys of the best matches for `term`, best first."""
+        raise NotImplementedError
+
+    def rebuild(self, kind):
+        """Re-index every row of a kind from scratch."""
+        raise NotImplementedError
+
+    def index_many(self, kind, queryset):
+        """Add or replace the documents of every row of `queryset`, rows of the kind's model."""
+        document = DOCUMENTS[kind]
+        related = {path.split('__')[0] for path in document['fields'].values() if '__' in path}
+        for obj in queryset.select_related(*related).iterator(chunk_size=1000):
+            self.index(kind, obj.pk, self.document_values(kind, obj))
+
+    @staticmethod
+    def document_values(kind, obj):
+        document = DOCUMENTS[kind]
+        values = {}
+        for name, path in {**document['fields'], **document['filters']}.items():
+            value = obj
+            for attribute in path.split('__'):
+                if attribute == 'isnull':
+                    value = value is None
+                else:
+                    value = getattr(value, attribute)
+            values[name] = value
+        return values
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Fallback that works on any database: unranked `icontains` lookups, newest first, no index to maintain."""
+
+    def index(self, kind, pk, values):
+        pass
+
+    def remove(self, kind, pk):
+        pass
+
+    def rebuild(self, kind):
+        pass
+
+    def index_many(self, kind, queryset):
+        pass
+
+    def search(self, kind, term, offset=0, limit=20, **filters):
+        document = DOCUMENTS[kind]
+        queryset = apps.get_model(document['model']).objects.all()
+        queryset = queryset.filter(reduce(or_, (Q(**{f'{path}__icontains': term})
+                                                for path in document['fields'].values())))
+        queryset = queryset.filter(**{document['filters'][name]: value for name, value in filters.items()})
+        return list(queryset.order_by('-pk').values_list('pk', flat=True)[offset:offset + limit])
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    Inverted index on SQLite FTS5 virtual tables (created by the search migrations), one per kind,
+    with the row's primary key as the FTS rowid. Results are ranked by bm25.
+    """
+
+    @staticmethod
+    def table(kind):
+        return f'search_{kind}'
+
+    @staticmethod
+    def match_expression(term):
+        # Quote every word so user input can't inject FTS syntax, and match word prefixes as you type.
+        words = re.findall(r'\w+', term)
+        return ' '.join(f'"{word}"*' for word in words)
+
+    def index(self, kind, pk, values):
+        columns = ', '.join(values)
+        placeholders = ', '.join(['%s'] * (len(values) + 1))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table(kind)} WHERE rowid = %s', [pk])
+            cursor.execute(f'INSERT INTO {self.table(kind)} (rowid, {columns}) VALUES ({placeholders})',
+                           [pk, *values.values()])
+
+    def remove(self, kind, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table(kind)} WHERE rowid = %s', [pk])
+
+    def search(self, kind, term, offset=0, limit=20, **filters):
+        expression = self.match_expression(term)
+        if not expression:
+            return []
+
+        table = self.table(kind)
+        conditions = ''.join(f' AND {name} = %s' for name in filters)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {table} WHERE {table} MATCH %s{conditions} ORDER BY rank LIMIT %s OFFSET %s',
+                [expression, *filters.values(), limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def rebuild(self, kind):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table(kind)}')
+        self.index_many(kind, apps.get_model(DOCUMENTS[kind]['model']).objects.all())
+
+
+_backend = None
+
+
+def get_backend():
+    """The backend named by the SEARCH_BACKEND setting, or FTS5 on SQLite and the ORM fallback elsewhere."""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == 'sqlite':
+            _backend = SQLiteFTSBackend()
+        else:
+            _backend = DatabaseSearchBackend()
+    return _backend
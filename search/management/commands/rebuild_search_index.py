@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from search.backends import DOCUMENTS, get_backend
+
+
+class Command(BaseCommand):
+    help = 'Re-index every post, comment and user in the search backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kinds', nargs='*', help=f'What to re-index, any of {", ".join(DOCUMENTS)} (default: all)')
+
+    def handle(self, *args, **options):
+        unknown = set(options['kinds']) - set(DOCUMENTS)
+        if unknown:
+            raise CommandError(f'Unknown kinds: {", ".join(sorted(unknown))}')
+
+        backend = get_backend()
+        for kind in options['kinds'] or DOCUMENTS:
+            with transaction.atomic():
+                backend.rebuild(kind)
+            self.stdout.write(f'Re-indexed {kind}s')
+
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
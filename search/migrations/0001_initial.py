@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.db import migrations
+
+TABLES = {
+    'search_post': 'content, author',
+    'search_comment': 'content, author, post_id UNINDEXED, top_level UNINDEXED',
+    'search_user': 'username, first_name, last_name',
+}
+
+
+def create_indexes(apps, schema_editor):
+    # Only SQLite ships FTS5; other databases use a backend that does not need these tables.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    for table, columns in TABLES.items():
+        schema_editor.execute(f"CREATE VIRTUAL TABLE {table} USING fts5({columns}, tokenize='unicode61')")
+
+    schema_editor.execute(
+        'INSERT INTO search_post (rowid, content, author) '
+        'SELECT p.id, p.content, u.username FROM posts_post p JOIN auth_user u ON u.id = p.author_id'
+    )
+    schema_editor.execute(
+        'INSERT INTO search_comment (rowid, content, author, post_id, top_level) '
+        'SELECT c.id, c.content, u.username, c.post_id, c.parent_id IS NULL '
+        'FROM posts_comment c JOIN auth_user u ON u.id = c.author_id'
+    )
+    schema_editor.execute(
+        'INSERT INTO search_user (rowid, username, first_name, last_name) '
+        'SELECT id, username, first_name, last_name FROM auth_user'
+    )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    for table in TABLES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('posts', '0017_timelineentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,28 @@
+from SimpleSocialApp.pagination import RankedPagination
+from .backends import get_backend
+
+
+class SearchListMixin:
+    """
+    Serve a list view's `?search=` queries from the search index, ranked and paginated.
+    Set `search_kind` to a key of `search.backends.DOCUMENTS`.
+    """
+    search_kind = None
+    search_param = 'search'
+
+    def get_search_filters(self):
+        return {}
+
+    def list(self, request, *args, **kwargs):
+        term = request.query_params.get(self.search_param)
+        if not term:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.get_queryset()
+        filters = self.get_search_filters()
+        paginator = RankedPagination()
+        page = paginator.paginate_ranked(
+            lambda offset, limit: get_backend().search(self.search_kind, term, offset, limit, **filters),
+            queryset, request)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
@@ -0,0 +1,57 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from posts.models import Post, Comment
+from .backends import DOCUMENTS, get_backend
+
+KINDS = {Post: 'post', Comment: 'comment', User: 'user'}
+
+
+def indexed_fields(kind):
+    """The model fields the documents of `kind` are built from."""
+    document = DOCUMENTS[kind]
+    return {path.split('__')[0].removesuffix('_id') for path in {**document['fields'], **document['filters']}.values()}
+
+
+def touches_document(kind, update_fields):
+    # Saves limited to other fields, such as User.last_login on every login, leave the document as it is.
+    return update_fields is None or bool({name.removesuffix('_id') for name in update_fields} & indexed_fields(kind))
+
+
+@receiver(pre_save, sender=User)
+def remember_user_document(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.pk is None or not touches_document('user', update_fields):
+        return
+    instance._indexed_values = User.objects.filter(pk=instance.pk).values(
+        *DOCUMENTS['user']['fields'].values()).first()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=User)
+def index_document(sender, instance, raw=False, update_fields=None, **kwargs):
+    kind = KINDS[sender]
+    if raw or not touches_document(kind, update_fields):
+        return
+
+    backend = get_backend()
+    values = backend.document_values(kind, instance)
+    previous = instance.__dict__.pop('_indexed_values', None)
+    if previous is not None:
+        previous = {name: previous[path] for name, path in DOCUMENTS[kind]['fields'].items()}
+        if previous == values:
+            return
+    backend.index(kind, instance.pk, values)
+
+    if previous is not None and previous['username'] != values['username']:
+        # Posts and comments are searchable by their author's username.
+        backend.index_many('post', Post.objects.filter(author=instance))
+        backend.index_many('comment', Comment.objects.filter(author=instance))
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=User)
+def remove_document(sender, instance, **kwargs):
+    get_backend().remove(KINDS[sender], instance.pk)
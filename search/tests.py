@@ -0,0 +1,98 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from posts.models import Post, Comment
+from .backends import DatabaseSearchBackend, SQLiteFTSBackend, get_backend
+
+
+# Create your tests here.
+class TestSetup(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='searchUser', password='testPass', first_name='Ada')
+        self.post = Post.objects.create(content='django search engines', author=self.user)
+        self.other = Post.objects.create(content='search search search', author=self.user)
+        self.comment = Comment.objects.create(content='great search', post=self.post, author=self.user)
+
+
+class SearchIndexTestCase(TestSetup):
+    def test_backend(self):
+        self.assertIsInstance(get_backend(), SQLiteFTSBackend)
+
+    def test_ranked(self):
+        self.assertEqual(get_backend().search('post', 'search'), [self.other.id, self.post.id],
+                         'Results are not ranked')
+
+    def test_prefix(self):
+        self.assertEqual(get_backend().search('post', 'djan'), [self.post.id], 'Prefix did not match')
+
+    def test_update_and_delete(self):
+        self.post.content = 'something else'
+        self.post.save()
+        self.assertEqual(get_backend().search('post', 'django'), [], 'Old content is still indexed')
+        self.other.delete()
+        self.assertNotIn(self.other.id, get_backend().search('post', 'search'), 'Deleted post is still indexed')
+
+    def test_user_saves(self):
+        with mock.patch.object(SQLiteFTSBackend, 'index') as index:
+            self.user.last_login = timezone.now()
+            self.user.save(update_fields=['last_login'])
+            self.user.save()
+        self.assertFalse(index.called, 'User was reindexed though its indexed fields did not change')
+
+        self.user.username = 'renamedUser'
+        self.user.save()
+        self.assertEqual(get_backend().search('user', 'renamedUser'), [self.user.id], 'User was not reindexed')
+        self.assertEqual(sorted(get_backend().search('post', 'renamedUser')), [self.post.id, self.other.id],
+                         'Posts of the renamed user were not reindexed')
+        self.assertEqual(get_backend().search('comment', 'renamedUser'), [self.comment.id],
+                         'Comments of the renamed user were not reindexed')
+        self.assertEqual(get_backend().search('post', 'searchUser'), [], 'Old username is still indexed')
+
+    def test_syntax_is_escaped(self):
+        self.assertEqual(get_backend().search('post', 'search" OR "*'), [], 'Query syntax was not escaped')
+        self.assertEqual(get_backend().search('post', '***'), [], 'Empty query returned results')
+
+    def test_rebuild(self):
+        Post.objects.bulk_create([Post(content='bulk created', author=self.user)])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(get_backend().search('post', 'bulk')), 1, 'Bulk created post is not indexed')
+
+    def test_database_backend(self):
+        backend = DatabaseSearchBackend()
+        self.assertEqual(backend.search('post', 'engines'), [self.post.id])
+        self.assertEqual(backend.search('comment', 'great', post_id=self.post.id, top_level=True), [self.comment.id])
+
+
+class SearchViewTestCase(TestSetup):
+    def test_post_search(self):
+        response = self.client.get('/posts/?search=search&page_size=1')
+        self.assertEqual(response.data['results'][0]['id'], self.other.id, 'Best match is not first')
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'][0]['id'], self.post.id, 'Second page is wrong')
+        self.assertIsNone(response.data['next'], 'Next page is not empty')
+
+    def test_comment_search_scoped_to_post(self):
+        Comment.objects.create(content='search reply', post=self.post, author=self.user, parent=self.comment)
+        Comment.objects.create(content='search elsewhere', post=self.other, author=self.user)
+        response = self.client.get(f'/posts/{self.post.id}/comments/?search=search')
+        self.assertEqual([comment['id'] for comment in response.data['results']], [self.comment.id])
+
+    def test_user_search(self):
+        response = self.client.get('/users/?username=ada')
+        self.assertEqual(response.data['results'][0]['username'], 'searchUser', 'User was not found by name')
+
+    def test_user_search_required(self):
+        response = self.client.get('/users/')
+        self.assertEqual(response.status_code, 400, 'Status code is not 400')
+
+    def test_custom_backend(self):
+        with mock.patch('search.mixins.get_backend', return_value=DatabaseSearchBackend()):
+            response = self.client.get('/posts/?search=engines')
+        self.assertEqual(response.data['results'][0]['id'], self.post.id)
@@ -0,0 +1,26 @@
+from django.http import Http404
+
+from SimpleSocialApp.async_views import AsyncReadView
+from SimpleSocialApp.cache import profile_cache
+from .usernames import auser_for
+from .views import UserRetrieveView
+
+
+class AsyncUserRetrieveView(AsyncReadView):
+    sync_view = UserRetrieveView
+
+    async def aget(self, request, username):
+        user = await auser_for(username, UserRetrieveView.detail_queryset())
+        if not user:
+            raise Http404
+
+        data = await profile_cache.aget(user.id)
+        cache_status = 'HIT'
+        if data is None:
+            cache_status = 'MISS'
+            data = await self.serialize(UserRetrieveView.serializer_class, user,
+                                        UserRetrieveView.cache_context(request))
+            await profile_cache.aset(user.id, data)
+
+        likes = [{pk async for pk in lookup} for lookup in UserRetrieveView.like_lookups(data, request.user)]
+        return UserRetrieveView.personalize(data, request, likes), {'X-Cache': cache_status}
@@ -0,0 +1,120 @@
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import router
+from django.utils import timezone
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from SimpleSocialApp.cache import user_cache
+
+# What authentication caches of a user, in model order as from_db() expects. The password hash and the rest
+# are loaded from the database if used.
+USER_FIELDS = [field.attname for field in User._meta.concrete_fields if field.attname in {
+    'id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser'}]
+
+# Blacklist rows are read incrementally by id, which can skip a row whose transaction committed after a
+# later one was read; a full reload every so often picks those up and drops the expired ids.
+FULL_RELOAD_SECONDS = 300
+
+
+class RevokedTokens:
+    """
+    The ids (JTIs) of the blacklisted tokens that haven't expired yet, kept in memory. At most every
+    JWT_BLACKLIST_REFRESH_SECONDS it loads the rows blacklisted since its last look, so checking a token
+    costs one set lookup instead of a query. Tokens blacklisted by this process are added right away.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.expiries = {}
+        self.last_id = 0
+        self.refreshed_at = self.reloaded_at = None
+
+    def __contains__(self, jti):
+        self.refresh()
+        return jti in self.expiries
+
+    def add(self, jti, expires_at):
+        self.expiries[jti] = expires_at
+
+    def refresh(self):
+        now = time.monotonic()
+        interval = getattr(settings, 'JWT_BLACKLIST_REFRESH_SECONDS', 5)
+        if self.refreshed_at is not None and now - self.refreshed_at < interval:
+            return
+
+        with self.lock:
+            if self.refreshed_at is not None and now - self.refreshed_at < interval:
+                return
+            rows = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+            reload = self.reloaded_at is None or now - self.reloaded_at >= FULL_RELOAD_SECONDS
+            if not reload:
+                rows = rows.filter(id__gt=self.last_id)
+
+            # A reload is filled on the side and swapped in whole, so a lookup meanwhile still sees every id.
+            expiries, last_id = ({}, 0) if reload else (self.expiries, self.last_id)
+            for row_id, jti, expires_at in rows.values_list('id', 'token__jti', 'token__expires_at'):
+                expiries[jti] = expires_at
+                last_id = max(last_id, row_id)
+            self.expiries, self.last_id = expiries, last_id
+            if reload:
+                self.reloaded_at = now
+            self.refreshed_at = now
+
+
+revoked_tokens = RevokedTokens()
+
+
+def blacklist_access_token(token):
+    """
+    Blacklist an access token, so it stops working before it expires. simplejwt only blacklists refresh
+    tokens; this records the access token the same way, as an outstanding token with a blacklist row.
+    """
+    jti, expires_at = token[api_settings.JTI_CLAIM], datetime_from_epoch(token['exp'])
+    outstanding, _ = OutstandingToken.objects.get_or_create(jti=jti, defaults={
+        'user_id': token.get(api_settings.USER_ID_CLAIM),
+        'token': str(token),
+        'created_at': token.current_time,
+        'expires_at': expires_at,
+    })
+    BlacklistedToken.objects.get_or_create(token=outstanding)
+    revoked_tokens.add(jti, expires_at)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that doesn't query the database on every request: the user is cached for up to
+    JWT_USER_CACHE_SECONDS (and dropped from the cache of the process that saves it), and the token is checked
+    against the in-memory set of blacklisted token ids, so a logged out access token is refused as well.
+    """
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if token.get(api_settings.JTI_CLAIM) in revoked_tokens:
+            raise InvalidToken({'detail': 'Token is blacklisted', 'code': 'token_not_valid'})
+        return token
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        values = user_cache.get(user_id) if user_id is not None else None
+        if values is not None:
+            # Fields that aren't cached are deferred, and saving the user only writes the loaded ones.
+            user = User.from_db(router.db_for_read(User), USER_FIELDS, values)
+            if not user.is_active:
+                raise AuthenticationFailed('User is inactive', code='user_inactive')
+            return user
+
+        user = super().get_user(validated_token)
+        # Other processes don't see this one's invalidations unless the cache is shared, so entries stay short.
+        timeout = min(getattr(settings, 'JWT_USER_CACHE_SECONDS', 5), validated_token['exp'] - time.time())
+        user_cache.set(user_id, [getattr(user, field) for field in USER_FIELDS], timeout=max(1, int(timeout)))
+        return user
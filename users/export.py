@@ -0,0 +1,65 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+
+from posts.models import Post, Comment, PostLike, CommentLike
+from .models import Follow
+
+CHUNK_SIZE = 2000
+
+# Everything exported for a user, in export order: the type of each line and the rows, paged by id.
+SECTIONS = {
+    'post': lambda user: Post.objects.filter(author=user).values(
+        'id', 'content', 'post_img', 'created_at', 'updated_at'),
+    'comment': lambda user: Comment.objects.filter(author=user).values(
+        'id', 'post_id', 'parent_id', 'content', 'created_at', 'updated_at'),
+    'post_like': lambda user: PostLike.objects.filter(user=user).values('id', 'post_id', 'created_at'),
+    'comment_like': lambda user: CommentLike.objects.filter(user=user).values('id', 'comment_id', 'created_at'),
+    'following': lambda user: Follow.objects.filter(follower=user).values(
+        'id', 'created_at', user_id=F('following_id'), username=F('following__username')),
+    'follower': lambda user: Follow.objects.filter(following=user).values(
+        'id', 'created_at', user_id=F('follower_id'), username=F('follower__username')),
+}
+
+
+def parse_cursor(cursor):
+    """(section, last exported id) of a line's `cursor`. Raises ValueError for anything else."""
+    if not cursor:
+        return next(iter(SECTIONS)), 0
+    section, _, last_id = cursor.partition(':')
+    if section not in SECTIONS or not last_id.isdigit():
+        raise ValueError(f'Invalid cursor {cursor!r}')
+    return section, int(last_id)
+
+
+def export(user, cursor=None, chunk_size=CHUNK_SIZE):
+    """
+    The posts, comments, likes and follows of `user` as newline-delimited JSON, yielded as bytes a chunk of rows
+    at a time, so memory stays flat however big the account is. Every line carries a `cursor`; passing the last
+    one received resumes the export right after it. The last line has type "end".
+    """
+    start, last_id = parse_cursor(cursor)
+    sections = list(SECTIONS)
+    for section in sections[sections.index(start):]:
+        rows = SECTIONS[section](user).filter(id__gt=last_id if section == start else 0).order_by('id')
+        lines = []
+        for row in rows.iterator(chunk_size=chunk_size):
+            lines.append(json.dumps({'type': section, 'cursor': f"{section}:{row['id']}", **row},
+                                    cls=DjangoJSONEncoder))
+            if len(lines) >= chunk_size:
+                yield ('\n'.join(lines) + '\n').encode()
+                lines = []
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode()
+    yield b'{"type": "end"}\n'
+
+
+async def aexport(user, cursor=None, chunk_size=CHUNK_SIZE):
+    """export() for ASGI responses, which would otherwise read a sync iterator to the end before sending it."""
+    chunks = export(user, cursor, chunk_size)
+    done = object()
+    # Each chunk is read on the same sync thread, and so the same connection, as the query it comes from.
+    while (chunk := await sync_to_async(next)(chunks, done)) is not done:
+        yield chunk
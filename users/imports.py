@@ -0,0 +1,115 @@
+import csv
+import json
+import time
+from collections import Counter
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from SimpleSocialApp.cache import profile_cache
+from posts import feed
+from posts.counters import bump_many
+from .models import Follow, Profile
+
+CHUNK_SIZE = 5000
+FORMATS = ('csv', 'jsonl')
+
+
+def read_edges(lines, format):
+    """
+    Yield (follower, following) username pairs from CSV rows or JSON lines. CSV rows hold the two usernames,
+    optionally under a `follower,following` header; JSON lines are objects with `follower` and `following`.
+    Rows that can't be parsed are yielded as None so they can be counted.
+    """
+    if format == 'csv':
+        for row in csv.reader(lines):
+            if row == ['follower', 'following'] or not row:
+                continue
+            yield (row[0].strip(), row[1].strip()) if len(row) == 2 else None
+    elif format == 'jsonl':
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                edge = json.loads(line)
+                yield str(edge['follower']), str(edge['following'])
+            except (ValueError, KeyError, TypeError):
+                yield None
+    else:
+        raise ValueError(f'Unknown format {format!r}, expected one of {", ".join(FORMATS)}')
+
+
+class FollowImporter:
+    """
+    Creates Follow edges in chunks with one bulk insert each. Usernames are resolved through an in-memory
+    map that only queries the usernames it hasn't seen yet, so a user that appears in many edges is looked up
+    once. Bulk inserts skip the Follow signals, so the profile counters (by the edges each chunk added), cached
+    profiles and timelines of the users in each chunk are brought up to date right after it.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, progress=None):
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.user_ids = {}
+        self.stats = {'read': 0, 'created': 0, 'existing': 0, 'skipped': 0, 'invalid': 0}
+        self.started = None
+
+    def run(self, edges):
+        self.started = time.monotonic()
+        edges = iter(edges)
+        while chunk := list(islice(edges, self.chunk_size)):
+            self.import_chunk(chunk)
+            if self.progress:
+                self.progress(self.report())
+        return self.report()
+
+    def report(self):
+        seconds = time.monotonic() - self.started
+        return {**self.stats, 'seconds': round(seconds, 3),
+                'edges_per_second': round(self.stats['read'] / seconds) if seconds else 0}
+
+    def resolve(self, usernames):
+        missing = set(usernames) - self.user_ids.keys()
+        found = dict(User.objects.filter(username__in=missing).values_list('username', 'id'))
+        for username in missing:
+            self.user_ids[username] = found.get(username)
+
+    def import_chunk(self, chunk):
+        self.stats['read'] += len(chunk)
+        edges = [edge for edge in chunk if edge is not None]
+        self.stats['invalid'] += len(chunk) - len(edges)
+        self.resolve({username for edge in edges for username in edge})
+
+        pairs, resolved = set(), 0
+        for follower, following in edges:
+            follower_id, following_id = self.user_ids[follower], self.user_ids[following]
+            if follower_id is None or following_id is None or follower_id == following_id:
+                # Unknown usernames and self-follows.
+                self.stats['skipped'] += 1
+            else:
+                pairs.add((follower_id, following_id))
+                resolved += 1
+        if not pairs:
+            return
+
+        with transaction.atomic():
+            existing = set(Follow.objects.filter(
+                follower_id__in={follower for follower, _ in pairs},
+                following_id__in={following for _, following in pairs},
+            ).values_list('follower_id', 'following_id')) & pairs
+            new = pairs - existing
+            Follow.objects.bulk_create([Follow(follower_id=follower, following_id=following)
+                                        for follower, following in new], ignore_conflicts=True)
+
+            # Each new edge adds one follower and one following, which costs no count however big the account.
+            bump_many(Profile, 'following_count', Counter(follower for follower, _ in new), key='user_id')
+            bump_many(Profile, 'followers_count', Counter(following for _, following in new), key='user_id')
+            user_ids = {user_id for pair in new for user_id in pair}
+            feed.backfill_many(new)
+            for user_id in user_ids:
+                profile_cache.invalidate(user_id)
+
+        self.stats['created'] += len(new)
+        # Edges that already existed, or were repeated in the input.
+        self.stats['existing'] += resolved - len(new)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from users.suggestions import BATCH_SIZE, compute
+
+
+class Command(BaseCommand):
+    help = ('Recompute who each user might want to follow from the users their followings follow. Meant to '
+            'run off-peak, e.g. nightly from cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Users computed per transaction')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Suggestions stored per user, FOLLOW_SUGGESTIONS by default')
+
+    def handle(self, *args, **options):
+        users, stored = compute(batch_size=options['batch_size'], limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {stored} suggestions for {users} users'))
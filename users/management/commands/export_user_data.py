@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.export import CHUNK_SIZE, export, parse_cursor
+from users.usernames import user_for
+
+
+class Command(BaseCommand):
+    help = ("Export a user's posts, comments, likes and follows as newline-delimited JSON, to stdout or a file. "
+            'Pass the cursor of the last line written to resume an interrupted export')
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--output', help='File to write to; appended to when resuming. Defaults to stdout')
+        parser.add_argument('--cursor', help='Resume after the line with this cursor')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows read per query')
+
+    def handle(self, *args, **options):
+        user = user_for(options['username'])
+        if user is None:
+            raise CommandError(f"User {options['username']} not found")
+        cursor = options['cursor']
+        try:
+            parse_cursor(cursor)
+        except ValueError as error:
+            raise CommandError(error)
+
+        chunks = export(user, cursor, chunk_size=options['chunk_size'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
+            return
+
+        with open(options['output'], 'ab' if cursor else 'wb') as file:
+            for chunk in chunks:
+                file.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Exported {options['username']} to {options['output']}"))
@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.imports import CHUNK_SIZE, FORMATS, FollowImporter, read_edges
+
+
+class Command(BaseCommand):
+    help = 'Import follow edges between existing users from a CSV or JSON lines file ("-" reads stdin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Defaults to the file extension, or csv when reading stdin')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Edges per bulk insert')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or (path.rsplit('.', 1)[-1].lower() if '.' in path else 'csv')
+        if format not in FORMATS:
+            raise CommandError(f'Cannot tell the format of {path}, pass --format')
+
+        importer = FollowImporter(chunk_size=options['chunk_size'], progress=self.report_progress)
+        if path == '-':
+            stats = importer.run(read_edges(sys.stdin, format))
+        else:
+            try:
+                with open(path, newline='', encoding='utf-8') as file:
+                    stats = importer.run(read_edges(file, format))
+            except OSError as error:
+                raise CommandError(error)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['created']} follows from {stats['read']} edges in {stats['seconds']}s "
+            f"({stats['existing']} already existed, {stats['skipped']} skipped, {stats['invalid']} invalid)"))
+
+    def report_progress(self, stats):
+        self.stdout.write(f"{stats['read']} edges read, {stats['created']} created, "
+                          f"{stats['edges_per_second']} edges/s")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from users.tokens import CHUNK_SIZE, LEGACY_TABLE, drop_legacy_table, purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = ('Delete expired outstanding and blacklisted JWTs in small batches, and drop the unused legacy '
+            'blacklist table. Meant to run on a schedule, e.g. hourly from cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Tokens deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to wait between chunks')
+
+    def handle(self, *args, **options):
+        stats = purge_expired_tokens(chunk_size=options['chunk_size'], pause=options['pause'],
+                                     progress=self.report_progress if options['verbosity'] > 1 else None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {stats['outstanding']} outstanding and {stats['blacklisted']} blacklisted tokens in "
+            f"{stats['chunks']} chunks, reclaiming about {stats['bytes']} bytes"))
+
+        legacy = drop_legacy_table()
+        if legacy is not None:
+            rows, size = legacy
+            self.stdout.write(self.style.SUCCESS(
+                f'Dropped the legacy {LEGACY_TABLE} table: {rows} rows, about {size} bytes'))
+
+    def report_progress(self, stats):
+        self.stdout.write(f"{stats['outstanding']} outstanding and {stats['blacklisted']} blacklisted tokens purged")
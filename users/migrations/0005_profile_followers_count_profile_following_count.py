@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:47
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset, group_by):
+    return Coalesce(Subquery(queryset.values(group_by).annotate(c=Count('*')).values('c')), Value(0))
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    Profile = apps.get_model('users', 'Profile')
+    Follow = apps.get_model('users', 'Follow')
+
+    # Every user needs a profile now that the follow counters live on it.
+    Profile.objects.bulk_create(Profile(user=user) for user in User.objects.filter(profile__isnull=True))
+    Profile.objects.update(
+        followers_count=_count(Follow.objects.filter(following=OuterRef('user')), 'following'),
+        following_count=_count(Follow.objects.filter(follower=OuterRef('user')), 'follower'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_delete_blacklistedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_profile_followers_count_profile_following_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['following', '-created_at'], name='follow_following_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['follower', '-created_at'], name='follow_follower_created_idx'),
+        ),
+        # auth_user belongs to another app, so its keyset index for the user list is created by hand.
+        migrations.RunSQL(
+            'CREATE INDEX user_joined_idx ON auth_user (date_joined DESC, id DESC)',
+            'DROP INDEX user_joined_idx',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_follow_follow_following_created_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='profile_pic_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:17
+
+import mediastore.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_profile_profile_pic_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='profile_pic',
+            field=models.ImageField(blank=True, null=True, storage=mediastore.storage.media_storage, upload_to='avatars/'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_alter_profile_profile_pic'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # auth_user belongs to django.contrib.auth, so its expression index can't be declared on the model.
+    # Case-insensitive username lookups compare LOWER(username), which this index serves.
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS auth_user_username_lower_idx ON auth_user (LOWER(username))',
+            'DROP INDEX IF EXISTS auth_user_username_lower_idx',
+        ),
+    ]
@@ -3,6 +3,8 @@ from django.db import models
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+from mediastore.storage import media_storage
+
 
 # Create your models here.
 class Follow(models.Model):
@@ -12,13 +14,41 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ('follower', 'following')
+        indexes = [
+            models.Index(fields=['following', '-created_at'], name='follow_following_created_idx'),
+            models.Index(fields=['follower', '-created_at'], name='follow_follower_created_idx'),
+        ]
 
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     bio = models.TextField(blank=True)
     birth_date = models.DateField(null=True, blank=True)
-    profile_pic = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    profile_pic = models.ImageField(upload_to='avatars/', storage=media_storage, blank=True, null=True)
+    profile_pic_variants = models.JSONField(default=dict, blank=True)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.user.username
+
+
+class FollowSuggestion(models.Model):
+    """
+    A user `user` doesn't follow yet, ranked by `mutuals`: how many of the users they follow follow them.
+    Computed offline for everyone at once, see users.suggestions.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='follow_suggestions')
+    suggested = models.ForeignKey(User, on_delete=models.CASCADE, related_name='suggested_to')
+    mutuals = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = (('user', 'rank'),)
+
+
+@receiver(post_save, sender=User)
+def create_profile(sender, instance, created, **kwargs):
+    if created:
+        Profile.objects.get_or_create(user=instance)
@@ -1,12 +1,18 @@
+from django.conf import settings
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from django.contrib.auth.models import User
 
+from mediastore.pipeline import clear, stage
+from mediastore.serializers import VariantImageField
 from posts.models import Post
 from posts.serializers import PostListCreateSerializer
 from .models import Follow, Profile
 
 
 class ProfileSerializer(serializers.ModelSerializer):
+    profile_pic = VariantImageField(required=False, allow_null=True)
+
     class Meta:
         model = Profile
         fields = ['bio', 'birth_date', 'profile_pic']
@@ -32,7 +38,13 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         del validated_data['confirm_password']
         user = User.objects.create_user(**validated_data)
         if profile_data:
-            Profile.objects.create(user=user, **profile_data)
+            profile = user.profile
+            profile_pic = profile_data.pop('profile_pic', None)
+            for field, value in profile_data.items():
+                setattr(profile, field, value)
+            profile.save()
+            if profile_pic:
+                stage(profile, 'profile_pic', profile_pic)
         return user
 
 
@@ -47,25 +59,49 @@ class UserSmallInformationSerializer(serializers.ModelSerializer):
         read_only_fields = ['username', 'id', 'followers', 'following', 'profile']
 
     def get_followers(self, obj):
-        return obj.followers.count()
+        try:
+            return obj.profile.followers_count
+        except Profile.DoesNotExist:
+            return obj.followers.count()
 
     def get_following(self, obj):
-        return obj.following.count()
+        try:
+            return obj.profile.following_count
+        except Profile.DoesNotExist:
+            return obj.following.count()
+
+
+class FollowSuggestionSerializer(UserSmallInformationSerializer):
+    mutuals = serializers.IntegerField(read_only=True)
+
+    class Meta(UserSmallInformationSerializer.Meta):
+        fields = UserSmallInformationSerializer.Meta.fields + ['mutuals']
 
 
 class UserInformationSerializer(UserSmallInformationSerializer):
     posts = serializers.SerializerMethodField()
+    posts_url = serializers.SerializerMethodField()
     profile = ProfileSerializer()
 
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'first_name', 'last_name',  'followers', 'following', 'profile', 'posts']
-        read_only_fields = ['username', 'id', 'posts', 'followers', 'following', 'profile']
+        fields = ['id', 'username', 'email', 'first_name', 'last_name',  'followers', 'following', 'profile', 'posts',
+                  'posts_url']
+        read_only_fields = ['username', 'id', 'posts', 'posts_url', 'followers', 'following', 'profile']
 
     def get_posts(self, obj):
-        posts = Post.objects.filter(author=obj)
+        # Only the most recent posts are embedded; the rest are paged through at `posts_url`.
         request = self.context.get('request')
-        return PostListCreateSerializer(posts, many=True, context={'request': request}).data
+        limit = getattr(settings, 'PROFILE_EMBEDDED_POSTS', 10)
+        posts = (Post.objects.filter(author=obj).select_related('author')
+                 .with_stats(request.user if request else None).order_by('-created_at', '-id')[:limit])
+        context = {'request': request, 'cached': self.context.get('cached', False)}
+        return PostListCreateSerializer(posts, many=True, context=context).data
+
+    def get_posts_url(self, obj):
+        # Profiles serialized for the shared cache keep the path, which views make absolute for each request.
+        request = None if self.context.get('cached') else self.context.get('request')
+        return reverse('user-posts', kwargs={'username': obj.username}, request=request)
 
     def update(self, instance, validated_data):
         profile_data = validated_data.pop('profile', None)
@@ -77,8 +113,12 @@ class UserInformationSerializer(UserSmallInformationSerializer):
         if profile_data:
             profile.bio = profile_data.get('bio', profile.bio)
             profile.birth_date = profile_data.get('birth_date', profile.birth_date)
-            profile.profile_pic = profile_data.get('profile_pic', profile.profile_pic)
             profile.save()
+            if profile_data.get('profile_pic'):
+                # Resized off the request by the image pipeline.
+                stage(profile, 'profile_pic', profile_data['profile_pic'])
+            elif 'profile_pic' in profile_data:
+                clear(profile, 'profile_pic')
         return instance
 
 
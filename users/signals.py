@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from SimpleSocialApp.cache import profile_cache, user_cache
+from .models import Follow, Profile
+from .usernames import username_cache
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    profile_cache.invalidate(instance.id)
+    user_cache.invalidate(instance.id)
+    username_cache.discard(instance.id, instance.username)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_profile(sender, instance, **kwargs):
+    profile_cache.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow(sender, instance, **kwargs):
+    profile_cache.invalidate(instance.follower_id)
+    profile_cache.invalidate(instance.following_id)
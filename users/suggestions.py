@@ -0,0 +1,83 @@
+import itertools
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from scipy import sparse
+
+from .models import Follow, FollowSuggestion
+
+BATCH_SIZE = 1000
+
+
+def suggestions_per_user():
+    return getattr(settings, 'FOLLOW_SUGGESTIONS', 20)
+
+
+def load_graph():
+    """
+    The follow graph as a sparse adjacency matrix, with row i following column j, and the user id of every
+    row and column. Only users with at least one follow edge have one.
+    """
+    edges = Follow.objects.values_list('follower_id', 'following_id').order_by()
+    flat = np.fromiter(itertools.chain.from_iterable(edges.iterator(chunk_size=10000)), dtype=np.int64)
+    ids, indices = np.unique(flat, return_inverse=True)
+    followers, followings = indices.reshape(-1, 2).T
+    graph = sparse.csr_matrix((np.ones(len(followers), dtype=np.int32), (followers, followings)),
+                              shape=(len(ids), len(ids)))
+    return graph, ids
+
+
+def top_candidates(graph, rows, limit):
+    """
+    For each of the users `rows` (matrix indices), the `limit` users followed by the most of the users they
+    follow, leaving out themselves and who they already follow. Ties go to the lowest user id, which is what
+    the matrix index order is. Returns (row, candidate, mutuals) arrays, sorted by row then rank.
+    """
+    followed = graph[rows]
+    # Row r of followed @ graph counts, for every user, the paths of length two from r to them.
+    counts = (followed @ graph).tocsr()
+    itself = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (np.arange(len(rows)), rows)),
+                               shape=counts.shape)
+    counts = counts - counts.multiply(followed) - counts.multiply(itself)
+    counts.eliminate_zeros()
+
+    counts = counts.tocoo()
+    order = np.lexsort((counts.col, -counts.data, counts.row))
+    row, col, mutuals = counts.row[order], counts.col[order], counts.data[order]
+    # Entries are grouped by row, so an entry's rank is its distance from the first entry of its row.
+    rank = np.arange(len(row)) - np.searchsorted(row, row)
+    keep = rank < limit
+    return rows[row[keep]], col[keep], mutuals[keep]
+
+
+def compute(batch_size=BATCH_SIZE, limit=None):
+    """
+    Recompute the follow suggestions of every user, `batch_size` users at a time: one sparse product per batch
+    instead of a friends-of-friends query per user, and each batch's suggestions replaced in one transaction,
+    so readers see either the previous or the new list. Suggestions of users who no longer follow anyone are
+    dropped at the end. Returns the number of users and suggestions stored.
+    """
+    limit = limit or suggestions_per_user()
+    started = timezone.now()
+    graph, ids = load_graph()
+
+    users = stored = 0
+    for start in range(0, len(ids), batch_size):
+        rows = np.arange(start, min(start + batch_size, len(ids)))
+        row, candidate, mutuals = top_candidates(graph, rows, limit)
+        rank = np.arange(len(row)) - np.searchsorted(row, row)
+        with transaction.atomic():
+            FollowSuggestion.objects.filter(user_id__in=ids[rows].tolist()).delete()
+            FollowSuggestion.objects.bulk_create(
+                [FollowSuggestion(user_id=user_id, suggested_id=suggested_id, mutuals=count, rank=position,
+                                  created_at=started)
+                 for user_id, suggested_id, count, position in zip(
+                    ids[row].tolist(), ids[candidate].tolist(), mutuals.tolist(), rank.tolist())],
+                batch_size=BATCH_SIZE)
+        users += len(np.unique(row))
+        stored += len(row)
+
+    FollowSuggestion.objects.filter(created_at__lt=started).delete()
+    return users, stored
@@ -1,14 +1,38 @@
+import json
+import os
+import tempfile
+import warnings
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from users.models import Profile
+from SimpleSocialApp.cache import user_cache
+from posts.models import Comment, CommentLike, Post, PostLike, TimelineEntry
+from users.authentication import USER_FIELDS, revoked_tokens
+from users.export import export
+from users.models import Follow, FollowSuggestion, Profile
+from users.suggestions import compute
+from users.usernames import by_username, username_cache, user_id_for
 
 
 # Create your tests here.
 class TestSetup(TestCase):
     def setUp(self):
+        cache.clear()
+        username_cache.clear()
         self.client = APIClient()
 
 
@@ -130,6 +154,110 @@ class TestFollowUser(TestSetup):
         response = self.client.post('/users/notAUser/follow/')
         self.assertEqual(response.status_code, 404, 'Status code is not 404')
 
+    def test_followers_pages(self):
+        followers = [User.objects.create(username=f'follower{i}') for i in range(5)]
+        for follower in followers:
+            Follow.objects.create(follower=follower, following=self.user2)
+
+        response = self.client.get(f'/users/{self.user2.username}/followers/?page_size=3')
+        usernames = [user['username'] for user in response.data['results']]
+        response = self.client.get(response.data['next'])
+        usernames += [user['username'] for user in response.data['results']]
+        self.assertIsNone(response.data['next'], 'Next page is not empty')
+        self.assertEqual(usernames, [follower.username for follower in reversed(followers)],
+                         'Followers are not ordered by follow time')
+
+    def test_follow_lists_query_count(self):
+        Follow.objects.create(follower=self.user, following=self.user2)
+        Follow.objects.create(follower=self.user2, following=self.user)
+        urls = [f'/users/{self.user2.username}/followers/', f'/users/{self.user2.username}/followings/',
+                '/users/profile/followers/', '/users/profile/followings/', '/users/?username=test']
+        query_counts = {}
+        for url in urls:
+            username_cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(f'{url}?page_size=100' if '?' not in url else f'{url}&page_size=100')
+            query_counts[url] = len(context.captured_queries)
+
+        users = User.objects.bulk_create(User(username=f'test{i}') for i in range(50))
+        Profile.objects.bulk_create(Profile(user=user, followers_count=1, following_count=1) for user in users)
+        Follow.objects.bulk_create(Follow(follower=user, following=self.user2) for user in users)
+        Follow.objects.bulk_create(Follow(follower=self.user2, following=user) for user in users)
+        Follow.objects.bulk_create(Follow(follower=user, following=self.user) for user in users)
+        Follow.objects.bulk_create(Follow(follower=self.user, following=user) for user in users)
+        call_command('rebuild_search_index', 'user', stdout=StringIO())
+
+        for url, query_count in query_counts.items():
+            username_cache.clear()
+            with self.assertNumQueries(query_count):
+                response = self.client.get(f'{url}?page_size=100' if '?' not in url else f'{url}&page_size=100')
+            self.assertGreater(len(response.data['results']), 50, f'{url} did not list every user')
+
+    def test_follow_counters(self):
+        self.client.post(f'/users/{self.user2.username}/follow/')
+        self.assertEqual(Profile.objects.get(user=self.user).following_count, 1, 'Following count is not 1')
+        self.assertEqual(Profile.objects.get(user=self.user2).followers_count, 1, 'Followers count is not 1')
+        self.client.post(f'/users/{self.user2.username}/follow/')
+        self.assertEqual(Profile.objects.get(user=self.user2).followers_count, 0, 'Followers count is not 0')
+
+
+class TestImportFollows(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.users = [User.objects.create(username=f'user{i}') for i in range(4)]
+        self.author_post = Post.objects.create(content='content', author=self.users[1])
+
+    def import_follows(self, content, suffix):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        out = StringIO()
+        call_command('import_follows', file.name, '--chunk-size', '2', stdout=out)
+        return out.getvalue()
+
+    def test_import_csv(self):
+        output = self.import_follows('follower,following\nuser0,user1\nuser0,user2\nuser2,user1\n'
+                                     'user0,user1\nuser0,nobody\nuser3,user3\nbroken\n', '.csv')
+        self.assertIn('Imported 3 follows from 7 edges', output, 'Import summary is wrong')
+        self.assertIn('1 already existed, 2 skipped, 1 invalid', output, 'Import summary is wrong')
+        self.assertEqual(Follow.objects.count(), 3, 'Follows were not imported')
+        self.assertEqual(Profile.objects.get(user=self.users[1]).followers_count, 2, 'Followers count is not 2')
+        self.assertEqual(Profile.objects.get(user=self.users[0]).following_count, 2, 'Following count is not 2')
+        self.assertTrue(TimelineEntry.objects.filter(user=self.users[0], post=self.author_post).exists(),
+                        'Timeline was not backfilled')
+
+    def test_import_jsonl(self):
+        self.import_follows('{"follower": "user0", "following": "user1"}\n\n{"follower": "user1"}\n', '.jsonl')
+        self.assertEqual(list(Follow.objects.values_list('follower__username', 'following__username')),
+                         [('user0', 'user1')], 'Follows were not imported')
+
+    def test_import_is_idempotent(self):
+        self.import_follows('user0,user1\n', '.csv')
+        output = self.import_follows('user0,user1\n', '.csv')
+        self.assertIn('Imported 0 follows', output, 'Existing follow was imported again')
+        self.assertEqual(Profile.objects.get(user=self.users[1]).followers_count, 1, 'Followers count is not 1')
+
+    def test_import_applies_deltas(self):
+        # Counters move by the edges each chunk added; the users' follows aren't recounted.
+        Profile.objects.filter(user=self.users[1]).update(followers_count=10)
+        self.import_follows('user0,user1\nuser2,user1\nuser3,user1\n', '.csv')
+        self.assertEqual(Profile.objects.get(user=self.users[1]).followers_count, 13, 'Followers count is not 13')
+
+    def test_import_api(self):
+        admin = User.objects.create(username='admin', is_staff=True)
+        self.client.force_authenticate(user=admin)
+        upload = SimpleUploadedFile('follows.csv', b'user0,user1\nuser1,user0\n')
+        response = self.client.post('/users/follows/import/', {'file': upload})
+        self.assertEqual(response.status_code, 200, 'Status code is not 200')
+        self.assertEqual(response.data['created'], 2, 'Follows were not imported')
+
+    def test_import_api_not_admin(self):
+        self.client.force_authenticate(user=self.users[0])
+        upload = SimpleUploadedFile('follows.csv', b'user0,user1\n')
+        response = self.client.post('/users/follows/import/', {'file': upload})
+        self.assertEqual(response.status_code, 403, 'Status code is not 403')
+        self.assertFalse(Follow.objects.exists(), 'Follows were imported')
+
 
 class TestShowUser(TestSetup):
     def setUp(self):
@@ -155,12 +283,103 @@ class TestShowUser(TestSetup):
         response = self.client.get(f'/users/{new_user.username}/')
         self.assertEqual(response.status_code, 200, 'Status code is not 200')
 
+    def test_delete_account_updates_counters(self):
+        other = User.objects.create(username='newUser', password='newPass')
+        post = Post.objects.create(content='content', author=other)
+        self.client.post(f'/users/{other.username}/follow/')
+        self.client.force_authenticate(user=other)
+        self.client.post(f'/users/{self.user.username}/follow/')
+        self.client.force_authenticate(user=self.user)
+        self.client.post(f'/posts/{post.id}/like/')
+        comment = self.client.post(f'/posts/{post.id}/comments/', {'content': 'comment'}).data
+        self.client.force_authenticate(user=other)
+        self.client.post(f"/posts/{post.id}/comments/{comment['id']}/replies/", {'content': 'reply'})
+        top = Comment.objects.get(id=self.client.post(f'/posts/{post.id}/comments/', {'content': 'top'}).data['id'])
+        self.client.force_authenticate(user=self.user)
+        self.client.post(f'/posts/{post.id}/comments/{top.id}/replies/', {'content': 'reply'})
+
+        response = self.client.delete('/users/profile/')
+        self.assertEqual(response.status_code, 204, 'Status code is not 204')
+        other.profile.refresh_from_db()
+        post.refresh_from_db()
+        top.refresh_from_db()
+        self.assertEqual((other.profile.followers_count, other.profile.following_count), (0, 0),
+                         'Follow counters were not updated')
+        self.assertEqual((post.likes_count, post.comments_count), (0, 1), 'Post counters were not updated')
+        self.assertEqual(top.comments_count, 0, 'Reply counter was not updated')
+
+    def test_show_user_cached(self):
+        new_user = User.objects.create(username='newUser', password='newPass')
+        response = self.client.get(f'/users/{new_user.username}/')
+        self.assertEqual(response['X-Cache'], 'MISS', 'First request was not a miss')
+        response = self.client.get(f'/users/{new_user.username}/')
+        self.assertEqual(response['X-Cache'], 'HIT', 'Second request was not a hit')
+        self.client.post(f'/users/{new_user.username}/follow/')
+        response = self.client.get(f'/users/{new_user.username}/')
+        self.assertEqual(response['X-Cache'], 'MISS', 'Cache was not invalidated')
+        self.assertEqual(response.data['followers'], 1, 'Followers is not 1')
+
     def test_show_user_unauthenticated(self):
         self.client.force_authenticate(user=None)
         new_user = User.objects.create(username='newUser', password='newPass')
         response = self.client.get(f'/users/{new_user.username}/')
         self.assertEqual(response.status_code, 200, 'Status code is not 200')
 
+    def test_show_user_embeds_recent_posts(self):
+        new_user = User.objects.create(username='newUser', password='newPass')
+        Post.objects.bulk_create(Post(content=f'content {i}', author=new_user) for i in range(30))
+        with self.settings(PROFILE_EMBEDDED_POSTS=5):
+            response = self.client.get(f'/users/{new_user.username}/')
+        self.assertEqual([post['content'] for post in response.data['posts']],
+                         [f'content {i}' for i in range(29, 24, -1)], 'Profile does not embed the 5 newest posts')
+        self.assertEqual(response.data['posts_url'], 'http://testserver/users/newUser/posts/', 'Posts url is wrong')
+
+        # The cached profile doesn't carry the first viewer's scheme and host to the next one.
+        response = self.client.get(f'/users/{new_user.username}/', secure=True)
+        self.assertEqual(response['X-Cache'], 'HIT', 'Profile was not cached')
+        self.assertEqual(response.data['posts_url'], 'https://testserver/users/newUser/posts/', 'Posts url is wrong')
+
+    def test_show_user_query_count(self):
+        new_user = User.objects.create(username='newUser', password='newPass')
+        Post.objects.create(content='content', author=new_user)
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(f'/users/{new_user.username}/')
+        Post.objects.bulk_create(Post(content=f'content {i}', author=new_user) for i in range(30))
+        cache.clear()
+        username_cache.clear()
+        with self.assertNumQueries(len(context.captured_queries)):
+            self.client.get(f'/users/{new_user.username}/')
+
+    def test_show_user_async(self):
+        new_user = User.objects.create(username='newUser', password='newPass')
+        post = Post.objects.create(content='content', author=new_user)
+        self.client.post(f'/posts/{post.id}/like/')
+        sync_response = self.client.get(f'/users/{new_user.username}/')
+        cache.clear()
+        authorization = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        with self.settings(ROOT_URLCONF='SimpleSocialApp.asgi_urls'):
+            async_response = async_to_sync(AsyncClient().get)(f'/users/{new_user.username}/',
+                                                              headers={'Authorization': authorization})
+        self.assertEqual(async_response.status_code, 200, 'Status code is not 200')
+        self.assertEqual(async_response.json(), json.loads(sync_response.content), 'Responses differ')
+        self.assertTrue(async_response.json()['posts'][0]['liked_by_user'], 'Post like flag is missing')
+
+    def test_user_posts(self):
+        new_user = User.objects.create(username='newUser', password='newPass')
+        Post.objects.bulk_create(Post(content=f'content {i}', author=new_user) for i in range(30))
+        Post.objects.create(content='other', author=self.user)
+        response = self.client.get(f'/users/{new_user.username}/posts/')
+        self.assertEqual(response.status_code, 200, 'Status code is not 200')
+        self.assertEqual(len(response.data['results']), 20, 'Page size is not 20')
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 10, 'Second page is not the remaining 10 posts')
+        self.assertIsNone(response.data['next'], 'Last page has a next link')
+
+    def test_user_posts_does_not_exist(self):
+        response = self.client.get('/users/notAUser/posts/')
+        self.assertEqual(response.status_code, 404, 'Status code is not 404')
+
 
 class ProfileTestCase(TestCase):
     def setUp(self):
@@ -215,3 +434,296 @@ class TestBlacklistEndpoint(TestCase):
     def test_endpoint(self):
         response = self.client.post('/users/blacklist/', {'refresh': self.refresh})
         self.assertEqual(response.status_code, 200)
+
+
+class TestCachedJWTAuthentication(TestSetup):
+    def setUp(self):
+        super().setUp()
+        revoked_tokens.clear()
+        self.user = User.objects.create_user(username='testUser', password='testPass')
+        self.refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+
+    def auth_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/users/profile/followers/')
+        self.assertEqual(response.status_code, 200, 'Status code is not 200')
+        return [query['sql'] for query in context.captured_queries
+                if 'FROM "auth_user" WHERE' in query['sql'] or 'token_blacklist' in query['sql']]
+
+    def test_authenticated_reads_skip_auth_queries(self):
+        self.client.get('/users/profile/followers/')
+        self.assertEqual(self.auth_queries(), [], 'User or blacklist was queried again')
+
+    def test_cached_user_has_no_password(self):
+        self.client.get('/users/profile/')
+        self.assertNotIn(self.user.password, repr(user_cache.get(self.user.id)), 'Password hash was cached')
+        response = self.client.get('/users/profile/')
+        self.assertEqual(response.data['username'], 'testUser', 'Cached user is wrong')
+        for old_password, status_code in (('wrongPass', 400), ('testPass', 200)):
+            response = self.client.put('/users/password-change/', {
+                'old_password': old_password, 'new_password': 'newPass', 'confirm_password': 'newPass'})
+            self.assertEqual(response.status_code, status_code, f'Status code is not {status_code}')
+
+    def test_cached_inactive_user(self):
+        self.client.get('/users/profile/')
+        # Deactivated by another process, whose cache holds the new state while this one's holds the old.
+        values = user_cache.get(self.user.id)
+        values[USER_FIELDS.index('is_active')] = False
+        user_cache.set(self.user.id, values)
+        response = self.client.get('/users/profile/')
+        self.assertEqual(response.status_code, 401, 'Status code is not 401')
+
+    def test_users_are_cached_briefly(self):
+        with self.settings(JWT_USER_CACHE_SECONDS=2), mock.patch.object(user_cache, 'set') as set_user:
+            self.client.get('/users/profile/')
+        self.assertEqual(set_user.call_args.kwargs['timeout'], 2, 'User is cached for the lifetime of the token')
+
+    def test_logout_revokes_access_token(self):
+        response = self.client.post('/users/logout/', {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, 200, 'Status code is not 200')
+        response = self.client.get('/users/profile/')
+        self.assertEqual(response.status_code, 401, 'Status code is not 401')
+
+    def test_blacklisted_elsewhere(self):
+        self.client.get('/users/profile/')
+        access = self.refresh.access_token
+        outstanding = OutstandingToken.objects.create(jti=access['jti'], token=str(access), user=self.user,
+                                                      expires_at=timezone.now() + timedelta(minutes=5))
+        BlacklistedToken.objects.create(token=outstanding)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        with self.settings(JWT_BLACKLIST_REFRESH_SECONDS=0):
+            response = self.client.get('/users/profile/')
+        self.assertEqual(response.status_code, 401, 'Status code is not 401')
+
+    def test_deactivated_user(self):
+        self.client.get('/users/profile/')
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        response = self.client.get('/users/profile/')
+        self.assertEqual(response.status_code, 401, 'Status code is not 401')
+
+
+class TestPurgeTokens(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='testUser', password='testPass')
+        for i in range(5):
+            expires_at = timezone.now() + timedelta(days=1 if i == 4 else -1)
+            token = OutstandingToken.objects.create(jti=f'jti{i}', token=f'token{i}', user=self.user,
+                                                    expires_at=expires_at)
+            if i % 2 == 0:
+                BlacklistedToken.objects.create(token=token)
+
+    def test_purge_expired_tokens(self):
+        out = StringIO()
+        call_command('purge_tokens', '--chunk-size', '3', stdout=out)
+        self.assertIn('Purged 4 outstanding and 2 blacklisted tokens in 2 chunks', out.getvalue(),
+                      'Expired tokens were not purged')
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), ['jti4'],
+                         'Unexpired token was purged')
+        self.assertEqual(BlacklistedToken.objects.count(), 1, 'Unexpired blacklist row was purged')
+
+    def test_drop_legacy_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE users_blacklistedtoken (id integer PRIMARY KEY, token varchar(500))')
+            cursor.execute("INSERT INTO users_blacklistedtoken (token) VALUES ('legacy')")
+        out = StringIO()
+        call_command('purge_tokens', stdout=out)
+        self.assertIn('Dropped the legacy users_blacklistedtoken table: 1 rows', out.getvalue(),
+                      'Legacy table was not dropped')
+        self.assertNotIn('users_blacklistedtoken', connection.introspection.table_names(), 'Legacy table is left')
+
+        out = StringIO()
+        call_command('purge_tokens', stdout=out)
+        self.assertNotIn('legacy', out.getvalue(), 'Missing legacy table was reported')
+
+
+class TestUsernameLookup(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='TestUser', password='testPass')
+
+    def test_lookup_uses_index(self):
+        sql, params = by_username('testuser').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = str(cursor.fetchall())
+        self.assertIn('auth_user_username_lower_idx', plan, 'Lookup does not use the lower(username) index')
+
+    def test_cached_lookup(self):
+        self.assertEqual(user_id_for('TESTUSER'), self.user.id, 'Username was not found case-insensitively')
+        with self.assertNumQueries(0):
+            self.assertEqual(user_id_for('testuser'), self.user.id, 'Cached username was not found')
+        self.assertIsNone(user_id_for('unknown'), 'Unknown username was found')
+
+    def test_cache_is_invalidated(self):
+        user_id_for('testuser')
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assertIsNone(user_id_for('testuser'), 'Old username still resolves')
+        self.assertEqual(user_id_for('Renamed'), self.user.id, 'New username does not resolve')
+
+        self.user.delete()
+        self.assertIsNone(user_id_for('renamed'), 'Deleted user still resolves')
+
+    def test_renamed_elsewhere(self):
+        user_id_for('testuser')
+        # Renamed by another process, which sends this one no signal, and the name taken by someone else.
+        User.objects.filter(id=self.user.id).update(username='renamed')
+        other = User.objects.create_user(username='testUser', password='testPass')
+        username_cache.set('testuser', self.user.id)
+        follower = User.objects.create_user(username='follower', password='testPass')
+        self.client.force_authenticate(user=follower)
+
+        response = self.client.get('/users/testUser/')
+        self.assertEqual(response.data['id'], other.id, 'Old owner of the username was returned')
+        username_cache.set('testuser', self.user.id)
+        response = self.client.post('/users/testUser/follow/')
+        self.assertEqual(response.status_code, 201, 'Status code is not 201')
+        self.assertTrue(Follow.objects.filter(follower=follower, following=other).exists(),
+                        'Old owner of the username was followed')
+
+        Post.objects.create(author=self.user, content='old owner')
+        username_cache.set('testuser', self.user.id)
+        response = self.client.get('/users/testUser/posts/')
+        self.assertEqual(response.data['results'], [], 'Posts of the old owner of the username were listed')
+        username_cache.set('testuser', self.user.id)
+        response = self.client.get('/users/testUser/followers/')
+        self.assertEqual([user['id'] for user in response.data['results']], [follower.id],
+                         'Followers of the old owner of the username were listed')
+
+    def test_cache_expires(self):
+        user_id_for('testuser')
+        with self.settings(USERNAME_CACHE_TTL=-1):
+            username_cache.set('testuser', self.user.id)
+        with self.assertNumQueries(1):
+            user_id_for('testuser')
+
+
+
+class TestFollowSuggestions(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.users = [User.objects.create_user(username=f'user{i}', password='testPass') for i in range(5)]
+        me, a, b, c, d = self.users
+        # c is followed by both of my followings, d by one of them and b by one.
+        for follower, following in [(me, a), (me, b), (a, c), (b, c), (a, d), (a, b), (c, me)]:
+            Follow.objects.create(follower=follower, following=following)
+        self.client.force_authenticate(user=me)
+
+    def test_compute(self):
+        me, a, b, c, d = self.users
+        users, stored = compute(batch_size=2)
+        self.assertEqual(stored, FollowSuggestion.objects.count(), 'Stored count is wrong')
+        suggested = list(FollowSuggestion.objects.filter(user=me).order_by('rank')
+                         .values_list('suggested_id', 'mutuals'))
+        # b is already followed and I am not my own suggestion, though c follows me.
+        self.assertEqual(suggested, [(c.id, 2), (d.id, 1)], 'Suggestions are wrong')
+
+    def test_limit_and_recompute(self):
+        me, a, b, c, d = self.users
+        compute(limit=1)
+        self.assertEqual(FollowSuggestion.objects.filter(user=me).count(), 1, 'Limit was not applied')
+
+        Follow.objects.filter(follower=a).delete()
+        Follow.objects.filter(follower=me).delete()
+        compute()
+        self.assertFalse(FollowSuggestion.objects.filter(user=me).exists(), 'Stale suggestions were kept')
+
+    def test_list_suggestions(self):
+        me, a, b, c, d = self.users
+        compute()
+        with self.assertNumQueries(1):
+            response = self.client.get('/users/profile/suggestions/')
+        self.assertEqual(response.status_code, 200, 'Status code is not 200')
+        self.assertEqual([(user['username'], user['mutuals']) for user in response.data['results']],
+                         [('user3', 2), ('user4', 1)], 'Suggestions are wrong')
+
+        # Users followed since the last computation are left out.
+        Follow.objects.create(follower=me, following=c)
+        response = self.client.get('/users/profile/suggestions/')
+        self.assertEqual([user['username'] for user in response.data['results']], ['user4'],
+                         'Followed user is still suggested')
+
+    def test_command(self):
+        out = StringIO()
+        call_command('compute_suggestions', '--batch-size', '2', stdout=out)
+        self.assertIn('suggestions for', out.getvalue(), 'Command did not report')
+
+    def test_unauthenticated(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.get('/users/profile/suggestions/')
+        self.assertEqual(response.status_code, 401, 'Status code is not 401')
+
+
+class TestExport(TestSetup):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='testUser', password='testPass')
+        self.other = User.objects.create_user(username='otherUser', password='testPass')
+        self.posts = [Post.objects.create(author=self.user, content=f'post {i}') for i in range(5)]
+        comment = Comment.objects.create(post=self.posts[0], author=self.user, content='comment')
+        PostLike.objects.create(post=self.posts[1], user=self.user)
+        CommentLike.objects.create(comment=comment, user=self.user)
+        Follow.objects.create(follower=self.user, following=self.other)
+        Follow.objects.create(follower=self.other, following=self.user)
+        self.client.force_authenticate(user=self.user)
+
+    @staticmethod
+    def lines(content):
+        return [json.loads(line) for line in content.decode().splitlines()]
+
+    def test_export(self):
+        response = self.client.get('/users/profile/export/')
+        self.assertEqual(response.status_code, 200, 'Status code is not 200')
+        self.assertTrue(response.streaming, 'Export is not streamed')
+        lines = self.lines(b''.join(response.streaming_content))
+        self.assertEqual([line['type'] for line in lines],
+                         ['post'] * 5 + ['comment', 'post_like', 'comment_like', 'following', 'follower', 'end'],
+                         'Export is incomplete')
+        self.assertEqual(lines[0]['content'], 'post 0', 'Post is wrong')
+        self.assertEqual(lines[8]['username'], 'otherUser', 'Following is wrong')
+
+    def test_resume(self):
+        lines = self.lines(b''.join(self.client.get('/users/profile/export/').streaming_content))
+        response = self.client.get('/users/profile/export/', {'cursor': lines[2]['cursor']})
+        self.assertEqual(self.lines(b''.join(response.streaming_content)), lines[3:], 'Export did not resume')
+
+        response = self.client.get('/users/profile/export/', {'cursor': 'nothing:1'})
+        self.assertEqual(response.status_code, 400, 'Status code is not 400')
+
+    def test_constant_queries(self):
+        # Rows are read a chunk at a time, so queries grow with the chunks, not with the rows.
+        Post.objects.bulk_create([Post(author=self.user, content='more') for _ in range(100)])
+        with self.assertNumQueries(6):
+            chunks = list(export(self.user, chunk_size=1000))
+        self.assertEqual(len(self.lines(b''.join(chunks))), 105 + 5 + 1, 'Export is incomplete')
+
+    def test_async_export(self):
+        authorization = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+
+        async def fetch():
+            response = await AsyncClient().get('/users/profile/export/', headers={'Authorization': authorization})
+            return response, b''.join([chunk async for chunk in response.streaming_content])
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            response, content = async_to_sync(fetch)()
+        self.assertEqual(response.status_code, 200, 'Status code is not 200')
+        self.assertFalse([warning for warning in caught if 'StreamingHttpResponse' in str(warning.message)],
+                         'Export was read whole before being sent')
+        self.assertEqual(self.lines(content)[-1], {'type': 'end'}, 'Export is incomplete')
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.ndjson')
+            call_command('export_user_data', 'testuser', '--output', path, stderr=StringIO())
+            with open(path, 'rb') as file:
+                lines = self.lines(file.read())
+        self.assertEqual(len(lines), 11, 'Export is incomplete')
+
+        out = StringIO()
+        call_command('export_user_data', 'testuser', '--cursor', lines[-3]['cursor'], stdout=out)
+        self.assertEqual(self.lines(out.getvalue().encode()), lines[-2:], 'Export did not resume')
@@ -16,10 +16,15 @@ urlpatterns = [
     path('profile/', ShowUserView.as_view(), name='profile'),
     path('profile/followers/', UserFollowersListView.as_view(), name='profile_followers'),
     path('profile/followings/', UserFollowingsListView.as_view(), name='profile_following'),
+    path('profile/suggestions/', FollowSuggestionListView.as_view(), name='profile_suggestions'),
+    path('profile/export/', ExportView.as_view(), name='profile_export'),
+
+    path('follows/import/', FollowImportView.as_view(), name='import-follows'),
 
     path('password-change/', PasswordChangeView.as_view(), name='password-change'),
 
     path('<str:username>/', UserRetrieveView.as_view(), name='user'),
+    path('<str:username>/posts/', UserPostListView.as_view(), name='user-posts'),
     path('<str:username>/follow/', FollowUserView.as_view(), name='follow'),
     path('<str:username>/followers/', UserFollowersListView.as_view(), name='followers'),
     path('<str:username>/followings/', UserFollowingsListView.as_view(), name='following'),
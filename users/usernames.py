@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Value
+from django.db.models.functions import Lower
+
+
+def by_username(username):
+    """Users whose username matches `username` case-insensitively, through the LOWER(username) index."""
+    return User.objects.alias(username_lower=Lower('username')).filter(username_lower=Lower(Value(username)))
+
+
+class UsernameCache:
+    """
+    In-process LRU map from lowercased username to user id. Entries expire after USERNAME_CACHE_TTL seconds,
+    and the User signals drop them as soon as a user is saved or deleted in this process; other processes
+    pick up such changes when their entries expire. Unknown usernames aren't cached, so new users are found
+    right away.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # lowercased username -> (user id, expiry), least recently used first
+        self.entries = OrderedDict()
+        # user id -> lowercased username, so a user's entry can be dropped without knowing their old name
+        self.names = {}
+
+    def get(self, username):
+        key = username.lower()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            user_id, expires_at = entry
+            if expires_at < time.monotonic():
+                self.remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return user_id
+
+    def set(self, username, user_id):
+        key = username.lower()
+        with self.lock:
+            self.entries[key] = (user_id, time.monotonic() + getattr(settings, 'USERNAME_CACHE_TTL', 300))
+            self.entries.move_to_end(key)
+            self.names[user_id] = key
+            while len(self.entries) > getattr(settings, 'USERNAME_CACHE_SIZE', 10000):
+                self.remove(next(iter(self.entries)))
+
+    def discard(self, user_id, username=None):
+        """Drop the entry of user `user_id`, and of `username` whoever it belonged to."""
+        with self.lock:
+            for key in {self.names.get(user_id), username and username.lower()} - {None}:
+                if key in self.entries:
+                    self.remove(key)
+
+    def remove(self, key):
+        user_id, _ = self.entries.pop(key)
+        if self.names.get(user_id) == key:
+            del self.names[user_id]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.names.clear()
+
+
+username_cache = UsernameCache()
+
+
+def user_id_for(username):
+    """The id of the user named `username` (case-insensitively), or None."""
+    user_id = username_cache.get(username)
+    if user_id is None:
+        user_id = by_username(username).values_list('id', flat=True).first()
+        if user_id is not None:
+            username_cache.set(username, user_id)
+    return user_id
+
+
+async def auser_id_for(username):
+    user_id = username_cache.get(username)
+    if user_id is None:
+        user_id = await by_username(username).values_list('id', flat=True).afirst()
+        if user_id is not None:
+            username_cache.set(username, user_id)
+    return user_id
+
+
+def user_for(username, queryset=None):
+    """
+    The user named `username` (case-insensitively) from `queryset`, all users by default, or None. Another
+    process may have renamed the cached user and someone else taken the name, so the name of the row is
+    checked and looked up again on a mismatch.
+    """
+    queryset = User.objects.all() if queryset is None else queryset
+    user_id = user_id_for(username)
+    user = queryset.filter(id=user_id).first() if user_id else None
+    if user is not None and user.username.lower() != username.lower():
+        username_cache.discard(user_id, username)
+        user_id = user_id_for(username)
+        user = queryset.filter(id=user_id).first() if user_id else None
+    return user
+
+
+async def auser_for(username, queryset=None):
+    queryset = User.objects.all() if queryset is None else queryset
+    user_id = await auser_id_for(username)
+    user = await queryset.filter(id=user_id).afirst() if user_id else None
+    if user is not None and user.username.lower() != username.lower():
+        username_cache.discard(user_id, username)
+        user_id = await auser_id_for(username)
+        user = await queryset.filter(id=user_id).afirst() if user_id else None
+    return user
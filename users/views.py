@@ -1,17 +1,34 @@
+import io
+
 from django.contrib.auth import login
 from django.contrib.auth.models import User
-from django.db import IntegrityError
-from django.http import JsonResponse, Http404
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, Http404, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import generics, status, permissions, filters
+from rest_framework import generics, status, permissions
 from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework_simplejwt.exceptions import TokenError
-from rest_framework_simplejwt.tokens import RefreshToken
-
-from users.models import Follow
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from SimpleSocialApp.cache import profile_cache
+from mediastore.serializers import absolute_image_urls
+from posts.counters import bump, remove_user
+from posts.likebuffer import BufferedLikesMixin, like_buffer
+from posts.models import Post, PostLike
+from posts.serializers import PostListCreateSerializer
+from search.mixins import SearchListMixin
+from users.authentication import blacklist_access_token
+from users.export import aexport, export, parse_cursor
+from users.imports import FORMATS, FollowImporter, read_edges
+from users.models import Follow, Profile
+from users.usernames import user_for
 from users.serializers import (UserRegistrationSerializer, UserInformationSerializer, PasswordChangeSerializer,
-                               FollowSerializer, UserSmallInformationSerializer)
+                               FollowSerializer, UserSmallInformationSerializer,
+                               FollowSuggestionSerializer)
 
 
 # Create your views here.
@@ -21,6 +38,9 @@ class LogoutView(generics.GenericAPIView):
             refresh_token = request.data['refresh']
             token = RefreshToken(refresh_token)
             token.blacklist()
+            if isinstance(request.auth, AccessToken):
+                # The access token would otherwise keep working until it expires.
+                blacklist_access_token(request.auth)
             return Response({'message': 'You have been logged out'}, status=status.HTTP_200_OK)
         except KeyError and TokenError:
             return Response({'message': 'Refresh token is invalid'}, status=status.HTTP_400_BAD_REQUEST)
@@ -37,31 +57,104 @@ class ShowUserView(generics.RetrieveUpdateDestroyAPIView):
 
         raise PermissionDenied('You are not logged in')
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # The cascade deletes the user's follows, likes and comments without updating their counters.
+            remove_user(instance)
+            instance.delete()
+
 
-class UserListView(generics.ListAPIView):
+class UserListView(SearchListMixin, generics.ListAPIView):
     serializer_class = UserSmallInformationSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend]
     queryset = User.objects.all()
+    keyset_ordering = ('-date_joined', '-id')
+    search_kind = 'user'
+    search_param = 'username'
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        username = self.request.query_params.get('username', None)
-        if username:
-            return queryset.filter(username__icontains=username)
-        else:
+        if not self.request.query_params.get('username', None):
             raise ValidationError("Query parameter 'username' is required")
 
+        return super().get_queryset().select_related('profile')
+
 
 class UserRetrieveView(generics.RetrieveAPIView):
     serializer_class = UserInformationSerializer
     lookup_field = 'username'
 
+    # The steps of a cached read below are shared with AsyncUserRetrieveView, which only runs them asynchronously.
+    @staticmethod
+    def detail_queryset():
+        return User.objects.select_related('profile')
+
     def get_object(self):
-        user = User.objects.filter(username__iexact=self.kwargs['username']).first()
+        user = user_for(self.kwargs['username'], self.detail_queryset())
         if not user:
             raise Http404
         return user
 
+    def retrieve(self, request, *args, **kwargs):
+        # The cached body is shared by every viewer; only the like flags are looked up per request.
+        user = self.get_object()
+        data = profile_cache.get(user.id)
+        cache_status = 'HIT'
+        if data is None:
+            cache_status = 'MISS'
+            data = self.get_serializer(user, context=self.cache_context(request)).data
+            profile_cache.set(user.id, data)
+
+        likes = [set(lookup) for lookup in self.like_lookups(data, request.user)]
+        response = Response(self.personalize(data, request, likes))
+        response['X-Cache'] = cache_status
+        return response
+
+    @staticmethod
+    def cache_context(request):
+        # Serialized for every viewer: URLs are left relative (see personalize) and like flags are overlaid later.
+        return {'request': request, 'cached': True}
+
+    @staticmethod
+    def like_lookups(data, user):
+        """Querysets of the ids `user` liked among the embedded posts; none for anonymous users."""
+        if not user.is_authenticated:
+            return []
+        return [PostLike.objects.filter(user=user, post_id__in=[post['id'] for post in data['posts']])
+                .values_list('post_id', flat=True)]
+
+    @classmethod
+    def personalize(cls, data, request, likes):
+        """The cached `data` as the requesting user sees it, given the results of like_lookups()."""
+        [liked_posts] = likes or [set()]
+        data = cls.mark_liked(cls.absolute_urls(data, request), liked_posts)
+        return cls.overlay_buffered(data, request.user)
+
+    @staticmethod
+    def absolute_urls(data, request):
+        posts = [{**post, 'post_img': absolute_image_urls(post['post_img'], request)} for post in data['posts']]
+        profile = data['profile'] and {**data['profile'],
+                                       'profile_pic': absolute_image_urls(data['profile']['profile_pic'], request)}
+        return {**data, 'posts_url': request.build_absolute_uri(data['posts_url']), 'posts': posts, 'profile': profile}
+
+    @staticmethod
+    def mark_liked(data, liked_posts):
+        return {**data, 'posts': [{**post, 'liked_by_user': post['id'] in liked_posts} for post in data['posts']]}
+
+    @staticmethod
+    def overlay_buffered(data, user):
+        return {**data, 'posts': like_buffer.overlay(user, 'post', data['posts'])}
+
+
+class UserPostListView(BufferedLikesMixin, generics.ListAPIView):
+    serializer_class = PostListCreateSerializer
+
+    def get_queryset(self):
+        user = user_for(self.kwargs['username'], User.objects.only('id', 'username'))
+        if not user:
+            raise Http404
+
+        return Post.objects.filter(author_id=user.id).select_related('author').with_stats(self.request.user)
+
 
 class UserCreateView(generics.CreateAPIView):
     serializer_class = UserRegistrationSerializer
@@ -92,51 +185,130 @@ class FollowUserView(generics.CreateAPIView):
         if not user.is_authenticated:
             return Response({'message': 'You are not logged in'}, status=status.HTTP_401_UNAUTHORIZED)
 
-        username = self.kwargs['username']
-        user_to_follow = User.objects.filter(username__iexact=username).first()
+        user_to_follow = user_for(self.kwargs['username'])
         if not user_to_follow:
             return Response({'message': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
         if request.user.username == user_to_follow.username:
             return Response({'message': 'You cannot follow yourself'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            Follow.objects.create(follower=request.user, following=user_to_follow)
+        with transaction.atomic():
+            deleted, _ = Follow.objects.filter(follower=request.user, following=user_to_follow).delete()
+            if deleted:
+                self.update_counts(request.user, user_to_follow, -1)
+                return Response({'message': 'User unfollowed'}, status=status.HTTP_204_NO_CONTENT)
+
+            try:
+                with transaction.atomic():
+                    Follow.objects.create(follower=request.user, following=user_to_follow)
+            except IntegrityError:
+                # A concurrent request created the same follow and already counted it.
+                return Response({'message': 'User followed'}, status=status.HTTP_201_CREATED)
+
+            self.update_counts(request.user, user_to_follow, 1)
             return Response({'message': 'User followed'}, status=status.HTTP_201_CREATED)
-        except IntegrityError:
-            Follow.objects.get(follower=request.user, following=user_to_follow).delete()
-            return Response({'message': 'User unfollowed'}, status=status.HTTP_204_NO_CONTENT)
+
+    @staticmethod
+    def update_counts(follower, following, delta):
+        bump(Profile, Q(user=follower), following_count=delta)
+        bump(Profile, Q(user=following), followers_count=delta)
+
+
+class FollowImportView(generics.GenericAPIView):
+    """Admin-only upload of follow edges as a CSV or JSON lines `file`, see the import_follows command."""
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if not upload:
+            raise ValidationError({'file': 'A CSV or JSON lines file is required'})
+
+        format = request.data.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+        if format not in FORMATS:
+            raise ValidationError({'format': f'Must be one of {", ".join(FORMATS)}'})
+
+        # Edges are read line by line off the upload, so memory stays flat however big the file is.
+        lines = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+        stats = FollowImporter().run(read_edges(lines, format))
+        return Response(stats, status=status.HTTP_200_OK)
 
 
 class UserFollowersListView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = UserSmallInformationSerializer
+    keyset_ordering = ('-followed_at', '-id')
 
     def get_queryset(self):
         try:
-            username = self.kwargs['username']
-            user = User.objects.filter(username__iexact=username).first()
+            user = user_for(self.kwargs['username'], User.objects.only('id', 'username'))
+            user_id = user and user.id
         except KeyError:
-            user = self.request.user
+            user_id = self.request.user.id
 
-        if not user:
+        if not user_id:
             raise Http404
 
-        follower_ids = Follow.objects.filter(following=user).values_list('follower_id', flat=True)
-        return User.objects.filter(id__in=follower_ids)
+        # Page through the Follow rows by when the follow happened, newest first. The counts are read
+        # off the joined profile, so a page costs the same number of queries whatever its size.
+        return (User.objects.filter(following__following_id=user_id).select_related('profile')
+                .annotate(followed_at=F('following__created_at')))
 
 
 class UserFollowingsListView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = UserSmallInformationSerializer
+    keyset_ordering = ('-followed_at', '-id')
 
     def get_queryset(self):
         try:
-            username = self.kwargs['username']
-            user = User.objects.filter(username__iexact=username).first()
+            user = user_for(self.kwargs['username'], User.objects.only('id', 'username'))
+            user_id = user and user.id
         except KeyError:
-            user = self.request.user
-        if not user:
+            user_id = self.request.user.id
+        if not user_id:
             raise Http404
 
-        following_id = Follow.objects.filter(follower=user).values_list('following_id', flat=True)
-        return User.objects.filter(id__in=following_id)
+        return (User.objects.filter(followers__follower_id=user_id).select_related('profile')
+                .annotate(followed_at=F('followers__created_at')))
+
+
+class FollowSuggestionListView(generics.GenericAPIView):
+    """
+    Who the authenticated user might want to follow, most mutual followings first. The suggestions are
+    computed offline by the compute_suggestions command; this reads the stored list in one query, leaving
+    out anyone followed since.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = FollowSuggestionSerializer
+
+    def get_queryset(self):
+        user = self.request.user
+        return (User.objects.filter(suggested_to__user=user)
+                .filter(~Exists(Follow.objects.filter(follower=user, following=OuterRef('pk'))))
+                .select_related('profile')
+                .annotate(mutuals=F('suggested_to__mutuals'), rank=F('suggested_to__rank'))
+                .order_by('rank'))
+
+    def get(self, request, *args, **kwargs):
+        return Response({'results': self.get_serializer(self.get_queryset(), many=True).data})
+
+
+class ExportView(generics.GenericAPIView):
+    """
+    Streams all of the authenticated user's posts, comments, likes and follows as newline-delimited JSON.
+    An interrupted download is resumed by passing the `cursor` of the last line received as `?cursor=`.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        cursor = request.query_params.get('cursor')
+        try:
+            parse_cursor(cursor)
+        except ValueError:
+            raise ValidationError({'cursor': 'Invalid cursor'})
+
+        # Under ASGI a sync iterator would be read to the end before anything is sent.
+        stream = aexport if isinstance(request._request, ASGIRequest) else export
+        response = StreamingHttpResponse(stream(request.user, cursor), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="{request.user.username}.ndjson"'
+        return response